@@ -0,0 +1,77 @@
+"""
+Authentication backend that loads the session user from the cache.
+
+``get_user`` runs on every request with a session. It fetches the user
+together with its profile and assigned ambulance in one query and makes sure
+the profile exists. With a cache shared by every worker (e.g. Redis) the
+result is kept there, so later requests need no user query at all; saving or
+deleting a user, profile or ambulance drops the cached entry (see
+``accounts.signals``). A per-process cache such as LocMemCache could only be
+cleared in the worker that made the change, leaving a deactivated user or an
+old password valid in the others, so with one the user is loaded every time.
+"""
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+from .models import User, UserProfile
+
+USER_CACHE_KEY = 'auth-user:{}'
+
+# Caches each worker process keeps to itself
+PER_PROCESS_CACHES = (LocMemCache, DummyCache)
+
+
+def user_cache_timeout():
+    return getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 300)
+
+
+def user_cache_enabled():
+    """Whether session users are cached: only in a cache every worker shares"""
+    return user_cache_timeout() > 0 and not isinstance(caches['default'], PER_PROCESS_CACHES)
+
+
+def load_user(user_id):
+    """Fetch a user with profile and assigned ambulance in a single query"""
+    user = (
+        User.objects.select_related('profile', 'assigned_ambulance')
+        .filter(pk=user_id)
+        .first()
+    )
+    if user is None:
+        return None
+    
+    # Create the profile here rather than lazily in the views
+    try:
+        user.profile
+    except UserProfile.DoesNotExist:
+        user.profile = UserProfile.objects.create(user=user)
+    return user
+
+
+def invalidate_user(*user_ids):
+    """Drop cached users, e.g. after a change made with QuerySet.update()"""
+    keys = [USER_CACHE_KEY.format(user_id) for user_id in user_ids if user_id is not None]
+    if keys:
+        cache.delete_many(keys)
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend whose get_user is served from a shared cache"""
+    
+    def get_user(self, user_id):
+        if not user_cache_enabled():
+            user = load_user(user_id)
+            return user if user is not None and self.user_can_authenticate(user) else None
+        
+        key = USER_CACHE_KEY.format(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = load_user(user_id)
+            if user is None:
+                return None
+            cache.set(key, user, timeout=user_cache_timeout())
+        return user if self.user_can_authenticate(user) else None
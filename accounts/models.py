@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models.functions import Lower
 from django.conf import settings
 
 
@@ -44,6 +45,15 @@ class User(AbstractUser):
     
     class Meta:
         db_table = 'accounts_user'
+        indexes = [
+            # Case-insensitive prefix search in user management
+            models.Index(Lower('username'), name='accounts_user_username_ci'),
+            models.Index(Lower('email'), name='accounts_user_email_ci'),
+            models.Index(fields=['phone_number'], name='accounts_user_phone'),
+            # Paginated listing, optionally filtered by role
+            models.Index(fields=['-date_joined'], name='accounts_user_joined'),
+            models.Index(fields=['role', '-date_joined'], name='accounts_user_role_joined'),
+        ]
 
 
 class UserProfile(models.Model):
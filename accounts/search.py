@@ -0,0 +1,43 @@
+"""
+Indexed prefix search for user management.
+
+Usernames and emails are matched case-insensitively against ``LOWER(...)``
+expression indexes and phone numbers against a plain index. Each term is a
+range scan (``value >= term AND value < next(term)``) instead of a
+``LIKE '%term%'`` table scan.
+"""
+
+from django.db.models import Count, Q
+from django.db.models.functions import Lower
+
+
+def _prefix_upper_bound(term):
+    """Smallest string greater than every string starting with term"""
+    return term[:-1] + chr(ord(term[-1]) + 1)
+
+
+def prefix_search(queryset, text):
+    """Filter a User queryset to usernames, emails or phone numbers starting with text"""
+    term = (text or '').strip()
+    if not term:
+        return queryset
+    
+    lowered = term.lower()
+    lowered_end = _prefix_upper_bound(lowered)
+    return queryset.alias(
+        username_ci=Lower('username'),
+        email_ci=Lower('email'),
+    ).filter(
+        Q(username_ci__gte=lowered, username_ci__lt=lowered_end) |
+        Q(email_ci__gte=lowered, email_ci__lt=lowered_end) |
+        Q(phone_number__gte=term, phone_number__lt=_prefix_upper_bound(term))
+    )
+
+
+def role_counts(queryset):
+    """Count users per role in a single grouped query"""
+    counts = {role: 0 for role in ('patient', 'paramedic', 'admin')}
+    for row in queryset.order_by().values('role').annotate(count=Count('id')):
+        counts[row['role']] = row['count']
+    counts['total'] = sum(counts.values())
+    return counts
@@ -0,0 +1,35 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from ambulance.fleet import PARAMEDIC_FIELDS
+from ambulance.models import Ambulance
+from emergency_ambulance.cache_versions import bump
+from .backends import invalidate_user
+from .models import User, UserProfile
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidate_cached_user(sender, instance, **kwargs):
+    """Drop the cached session user when it or one of its related rows changes, and bump the user counters"""
+    # Connected without a sender so saves through proxy models (e.g. the API's TokenUser) are seen
+    if isinstance(instance, User):
+        invalidate_user(instance.pk)
+        bump('users')
+        update_fields = kwargs.get('update_fields')
+        if instance.role == 'paramedic' and (update_fields is None or PARAMEDIC_FIELDS & update_fields):
+            # The fleet registry shows these; a login's last_login save leaves it alone
+            bump('paramedics')
+    elif isinstance(instance, UserProfile):
+        invalidate_user(instance.user_id)
+    elif isinstance(instance, Ambulance):
+        invalidate_user(instance.assigned_paramedic_id, getattr(instance, '_previous_paramedic_id', None))
+
+
+@receiver(pre_save, sender=Ambulance)
+def remember_previous_paramedic(sender, instance, **kwargs):
+    """Keep the paramedic an ambulance is being moved away from, so both users are refreshed"""
+    if instance.pk is not None:
+        instance._previous_paramedic_id = (
+            Ambulance.objects.filter(pk=instance.pk).values_list('assigned_paramedic_id', flat=True).first()
+        )
@@ -0,0 +1,11 @@
+from django import template
+
+from accounts.thumbnails import avatar_url as thumbnail_avatar_url
+
+register = template.Library()
+
+
+@register.simple_tag
+def avatar_url(user, size='small'):
+    """Thumbnail URL for a user's profile image: {% avatar_url user 'small' %}"""
+    return thumbnail_avatar_url(user, size)
@@ -1,3 +1,48 @@
+from unittest import mock
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
 from django.test import TestCase
 
-# Create your tests here.
+from .backends import CachedModelBackend
+from .models import User
+
+
+class SessionUserTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('patient', password='secret-pass', role='patient')
+
+    def test_loads_user_with_profile_in_one_query(self):
+        backend = CachedModelBackend()
+        # The first load creates the missing profile
+        backend.get_user(self.user.pk)
+        with self.assertNumQueries(1):
+            backend.get_user(self.user.pk).profile
+
+    def test_per_process_cache_does_not_keep_users(self):
+        backend = CachedModelBackend()
+        self.assertIsNotNone(backend.get_user(self.user.pk))
+        # Changed without signals, as another worker's change looks to this one
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertIsNone(backend.get_user(self.user.pk))
+
+    def test_password_change_ends_sessions(self):
+        self.client.login(username='patient', password='secret-pass')
+        self.assertEqual(self.client.get('/dashboard/patient/').status_code, 200)
+        User.objects.filter(pk=self.user.pk).update(password=make_password('other-pass'))
+        response = self.client.get('/dashboard/patient/')
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('/accounts/login/', response['Location'])
+
+    @mock.patch('accounts.backends.user_cache_enabled', return_value=True)
+    def test_shared_cache_keeps_users_until_saved(self, enabled):
+        backend = CachedModelBackend()
+        backend.get_user(self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(backend.get_user(self.user.pk).pk, self.user.pk)
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(backend.get_user(self.user.pk))
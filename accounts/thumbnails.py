@@ -0,0 +1,112 @@
+"""
+Profile image thumbnails.
+
+Templates and the API link to a user's avatar through ``avatar_url``. The
+first time a size is asked for, that URL points at the ``accounts:avatar``
+view, which resizes the original in a small thread pool (so a burst of new
+avatars cannot tie up every worker on CPU-bound resizing), stores it under
+``MEDIA_ROOT/thumbnails/<content hash>-<size>.jpg`` and redirects to it. The
+thumbnail's name is then cached, so later renders link to the file directly.
+
+Thumbnails are square JPEGs cropped to the centre, rotated according to the
+EXIF orientation and saved without any metadata. Since names are derived from
+the original's content, a re-upload of the same picture reuses the files.
+"""
+
+import hashlib
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.urls import reverse
+from PIL import Image, ImageOps
+
+# Size name -> edge in pixels; twice the largest CSS size each is shown at, for high-density screens
+SIZES = {
+    'small': 80,
+    'medium': 200,
+    'large': 300,
+}
+
+THUMBNAIL_CACHE_KEY = 'thumbnail:{}:{}'
+
+# What a missing, corrupt or oversized original raises while being thumbnailed
+THUMBNAIL_ERRORS = (OSError, SyntaxError, ValueError, Image.DecompressionBombError)
+
+_executor = None
+_pending = {}
+_lock = threading.Lock()
+
+
+def thumbnail_cache_timeout():
+    return getattr(settings, 'THUMBNAIL_CACHE_TIMEOUT', 86400)
+
+
+def cached_thumbnail(image, size):
+    """Name of the stored thumbnail of an image field, if it has been generated"""
+    return cache.get(THUMBNAIL_CACHE_KEY.format(image.name, size))
+
+
+def avatar_url(user, size='small'):
+    """URL of a user's avatar thumbnail, or '' when the user has no profile image"""
+    image = user.profile_image
+    if not image:
+        return ''
+    name = cached_thumbnail(image, size)
+    if name:
+        return image.storage.url(name)
+    return reverse('accounts:avatar', args=[user.pk, size])
+
+
+def render_thumbnail(data, edge):
+    """Square, EXIF-free JPEG bytes of the image in data"""
+    with Image.open(io.BytesIO(data)) as source:
+        # Let the JPEG decoder scale down while decoding; much faster for camera-sized photos
+        source.draft('RGB', (edge, edge))
+        image = ImageOps.exif_transpose(source)
+        if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        else:
+            image = image.convert('RGB')
+        image = ImageOps.fit(image, (edge, edge), Image.Resampling.LANCZOS)
+    output = io.BytesIO()
+    # No exif= argument: the metadata of the original is dropped
+    image.save(output, 'JPEG', quality=85, optimize=True, progressive=True)
+    return output.getvalue()
+
+
+def generate_thumbnail(image, size):
+    """Create (or find) the stored thumbnail for an image field and remember its name"""
+    storage = image.storage
+    with storage.open(image.name, 'rb') as f:
+        data = f.read()
+    name = f'thumbnails/{hashlib.sha256(data).hexdigest()[:24]}-{size}.jpg'
+    if not storage.exists(name):
+        name = storage.save(name, ContentFile(render_thumbnail(data, SIZES[size])))
+    cache.set(THUMBNAIL_CACHE_KEY.format(image.name, size), name, thumbnail_cache_timeout())
+    return name
+
+
+def get_thumbnail(image, size):
+    """Stored thumbnail name, generating it in the thread pool; concurrent callers share one job"""
+    global _executor
+    name = cached_thumbnail(image, size)
+    if name:
+        return name
+    key = (image.name, size)
+    with _lock:
+        future = _pending.get(key)
+        if future is None:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'THUMBNAIL_WORKERS', 2), thread_name_prefix='thumbnail'
+                )
+            future = _pending[key] = _executor.submit(generate_thumbnail, image, size)
+            future.add_done_callback(lambda done: _pending.pop(key, None))
+    return future.result()
@@ -28,6 +28,9 @@ urlpatterns = [
     # AJAX endpoints
     path('api/toggle-availability/', views.toggle_availability, name='toggle_availability'),
     
+    # Profile image thumbnails (generated on first request)
+    path('avatar/<int:user_id>/<str:size>/', views.avatar_view, name='avatar'),
+    
     # Dashboard redirect
     path('dashboard/', views.dashboard_redirect, name='dashboard_redirect'),
 ]
@@ -3,21 +3,22 @@ from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.urls import reverse
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
 from django.views.decorators.http import require_http_methods
 from django.contrib.auth.forms import PasswordChangeForm, PasswordResetForm, SetPasswordForm
 from django.contrib.auth import update_session_auth_hash
 from django.contrib.auth.tokens import default_token_generator
 from django.contrib.auth.views import PasswordResetView, PasswordResetDoneView, PasswordResetConfirmView, PasswordResetCompleteView
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
 from django.conf import settings
-from django.db import models
+from django.core.paginator import Paginator
 from .forms import CustomUserCreationForm, CustomAuthenticationForm, UserProfileForm, ParamedicProfileForm, ExtendedProfileForm, AdminUserEditForm, AdminParamedicEditForm
 from .models import User, UserProfile
+from .search import prefix_search, role_counts
+from .thumbnails import SIZES, THUMBNAIL_ERRORS, get_thumbnail
 from ambulance.models import AmbulanceRequest
+from notifications.outbox import enqueue_email
 
 
 def register_view(request):
@@ -73,14 +74,10 @@ def logout_view(request):
 @login_required
 def profile_view(request):
     """User profile view"""
-    try:
-        profile = request.user.profile
-    except UserProfile.DoesNotExist:
-        profile = UserProfile.objects.create(user=request.user)
-    
+    # Profile and assigned ambulance are loaded with the user (accounts.backends)
     context = {
         'user': request.user,
-        'profile': profile,
+        'profile': request.user.profile,
     }
     
     # Add role-specific context
@@ -100,10 +97,7 @@ def profile_view(request):
 @login_required
 def edit_profile_view(request):
     """Edit user profile view"""
-    try:
-        profile = request.user.profile
-    except UserProfile.DoesNotExist:
-        profile = UserProfile.objects.create(user=request.user)
+    profile = request.user.profile
     
     if request.method == 'POST':
         user_form = UserProfileForm(request.POST, request.FILES, instance=request.user)
@@ -170,16 +164,24 @@ def manage_users_view(request):
     if role in ['patient', 'paramedic', 'admin']:
         users = users.filter(role=role)
     if q:
-        users = users.filter(models.Q(username__icontains=q) | models.Q(email__icontains=q))
+        users = prefix_search(users, q)
+    
+    # Pagination
+    paginator = Paginator(users, 25)
+    page_obj = paginator.get_page(request.GET.get('page'))
+    
+    # Role totals in one grouped query
+    counts = role_counts(User.objects.all())
     
     context = {
-        'users': users,
+        'users': page_obj.object_list,
+        'page_obj': page_obj,
         'role': role or '',
         'q': q or '',
-        'total_users': User.objects.count(),
-        'total_patients': User.objects.filter(role='patient').count(),
-        'total_paramedics': User.objects.filter(role='paramedic').count(),
-        'total_admins': User.objects.filter(role='admin').count(),
+        'total_users': counts['total'],
+        'total_patients': counts['patient'],
+        'total_paramedics': counts['paramedic'],
+        'total_admins': counts['admin'],
     }
     
     return render(request, 'accounts/manage_users.html', context)
@@ -201,6 +203,19 @@ def toggle_availability(request):
     })
 
 
+@login_required
+def avatar_view(request, user_id, size):
+    """Redirect to a user's avatar thumbnail, generating it on first use"""
+    user = get_object_or_404(User, pk=user_id)
+    if size not in SIZES or not user.profile_image:
+        raise Http404('No such avatar.')
+    try:
+        name = get_thumbnail(user.profile_image, size)
+    except THUMBNAIL_ERRORS:
+        raise Http404('No such avatar.')
+    return redirect(user.profile_image.storage.url(name))
+
+
 def dashboard_redirect(request):
     """Redirect to appropriate dashboard based on user role"""
     if not request.user.is_authenticated:
@@ -315,19 +330,13 @@ def password_reset_request_view(request):
                     'site_name': 'Emergency Ambulance System',
                 }
                 
-                # Render email templates
-                subject = 'Password Reset - Emergency Ambulance System'
-                html_message = render_to_string('accounts/emails/password_reset_email.html', context)
-                plain_message = render_to_string('accounts/emails/password_reset_email.txt', context)
-                
-                # Send email
-                send_mail(
-                    subject=subject,
-                    message=plain_message,
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    recipient_list=[email],
-                    html_message=html_message,
-                    fail_silently=False,
+                # Queue the email; send_outbox delivers it in the background
+                enqueue_email(
+                    'password_reset',
+                    email,
+                    'Password Reset - Emergency Ambulance System',
+                    'accounts/emails/password_reset_email',
+                    context,
                 )
                 
                 messages.success(request, 'Password reset email has been sent to your email address.')
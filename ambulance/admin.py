@@ -1,15 +1,44 @@
 from django.contrib import admin
-from .models import AmbulanceRequest, RequestStatusUpdate, Ambulance
+from django.db.models import Q
+from django.utils import timezone
+from .models import AmbulanceRequest, RequestStatusUpdate, Ambulance, GeocodedAddress
+from accounts.backends import invalidate_user
+from emergency_ambulance.cache_versions import bump
+from .changes import record, stored_audiences
+from .search import matching_request_ids, matching_status_update_ids
+from .tracks import close as close_track
+
+
+class DuplicateFilter(admin.SimpleListFilter):
+    """Filter requests by duplicate-call clustering"""
+    
+    title = 'duplicate calls'
+    parameter_name = 'duplicates'
+    
+    def lookups(self, request, model_admin):
+        return (
+            ('original', 'Has duplicates'),
+            ('duplicate', 'Is a duplicate'),
+        )
+    
+    def queryset(self, request, queryset):
+        if self.value() == 'original':
+            return queryset.filter(duplicates__isnull=False).distinct()
+        if self.value() == 'duplicate':
+            return queryset.filter(duplicate_of__isnull=False)
+        return queryset
 
 
 @admin.register(AmbulanceRequest)
 class AmbulanceRequestAdmin(admin.ModelAdmin):
     """Admin configuration for AmbulanceRequest model"""
     
-    list_display = ('id', 'patient', 'paramedic', 'status', 'priority', 'created_at', 'assigned_at')
-    list_filter = ('status', 'priority', 'created_at', 'assigned_at')
-    search_fields = ('patient__username', 'paramedic__username', 'pickup_address', 'description')
+    list_display = ('id', 'patient', 'paramedic', 'status', 'priority', 'duplicate_of', 'created_at', 'assigned_at')
+    list_filter = ('status', 'priority', DuplicateFilter, 'created_at', 'assigned_at')
+    # Free-text fields (addresses, description, notes) are searched through the FTS index
+    search_fields = ('^patient__username', '^paramedic__username')
     readonly_fields = ('created_at', 'updated_at', 'assigned_at', 'completed_at', 'actual_arrival_time')
+    raw_id_fields = ('duplicate_of',)
     ordering = ('-created_at',)
     
     fieldsets = (
@@ -24,7 +53,7 @@ class AmbulanceRequestAdmin(admin.ModelAdmin):
             'fields': ('contact_phone', 'estimated_arrival_time', 'actual_arrival_time')
         }),
         ('Notes & Status', {
-            'fields': ('notes',)
+            'fields': ('notes', 'duplicate_of')
         }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at', 'assigned_at', 'completed_at'),
@@ -34,15 +63,39 @@ class AmbulanceRequestAdmin(admin.ModelAdmin):
     
     actions = ['mark_as_completed', 'mark_as_cancelled']
     
+    def get_search_results(self, request, queryset, search_term):
+        """Combine username prefix matches with ranked full-text matches"""
+        if not search_term:
+            return queryset, False
+        prefix_matches, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        queryset = queryset.filter(
+            Q(pk__in=matching_request_ids(search_term)) | Q(pk__in=prefix_matches.values('pk'))
+        )
+        return queryset, may_have_duplicates
+    
     def mark_as_completed(self, request, queryset):
         """Mark selected requests as completed"""
-        updated = queryset.update(status='completed')
+        # update() skips auto_now and signals; touch updated_at so cached rows are re-rendered
+        ids = list(queryset.values_list('pk', flat=True))
+        before = stored_audiences('request', ids)
+        updated = queryset.update(status='completed', updated_at=timezone.now())
+        bump('requests')
+        record('request', ids, before=before)
+        for pk in ids:
+            close_track(pk)
         self.message_user(request, f'{updated} requests marked as completed.')
     mark_as_completed.short_description = "Mark selected requests as completed"
     
     def mark_as_cancelled(self, request, queryset):
         """Mark selected requests as cancelled"""
-        updated = queryset.update(status='cancelled')
+        # update() skips auto_now and signals; touch updated_at so cached rows are re-rendered
+        ids = list(queryset.values_list('pk', flat=True))
+        before = stored_audiences('request', ids)
+        updated = queryset.update(status='cancelled', updated_at=timezone.now())
+        bump('requests')
+        record('request', ids, before=before)
+        for pk in ids:
+            close_track(pk)
         self.message_user(request, f'{updated} requests marked as cancelled.')
     mark_as_cancelled.short_description = "Mark selected requests as cancelled"
 
@@ -53,10 +106,21 @@ class RequestStatusUpdateAdmin(admin.ModelAdmin):
     
     list_display = ('request', 'old_status', 'new_status', 'updated_by', 'timestamp')
     list_filter = ('old_status', 'new_status', 'timestamp')
-    search_fields = ('request__id', 'updated_by__username', 'notes')
+    # Notes are searched through the FTS index
+    search_fields = ('=request__id', '^updated_by__username')
     readonly_fields = ('timestamp',)
     ordering = ('-timestamp',)
     
+    def get_search_results(self, request, queryset, search_term):
+        """Combine exact request id and username prefix matches with full-text note matches"""
+        if not search_term:
+            return queryset, False
+        field_matches, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        queryset = queryset.filter(
+            Q(pk__in=matching_status_update_ids(search_term)) | Q(pk__in=field_matches.values('pk'))
+        )
+        return queryset, may_have_duplicates
+    
     fieldsets = (
         ('Status Change', {
             'fields': ('request', 'old_status', 'new_status', 'updated_by')
@@ -98,12 +162,32 @@ class AmbulanceAdmin(admin.ModelAdmin):
     
     def mark_as_available(self, request, queryset):
         """Mark selected ambulances as available"""
-        updated = queryset.update(status='available')
+        ids = list(queryset.values_list('pk', flat=True))
+        before = stored_audiences('ambulance', ids)
+        updated = queryset.update(status='available', updated_at=timezone.now())
+        invalidate_user(*queryset.values_list('assigned_paramedic_id', flat=True))
+        bump('ambulances')
+        record('ambulance', ids, before=before)
         self.message_user(request, f'{updated} ambulances marked as available.')
     mark_as_available.short_description = "Mark selected ambulances as available"
     
     def mark_as_maintenance(self, request, queryset):
         """Mark selected ambulances as under maintenance"""
-        updated = queryset.update(status='maintenance')
+        ids = list(queryset.values_list('pk', flat=True))
+        before = stored_audiences('ambulance', ids)
+        updated = queryset.update(status='maintenance', updated_at=timezone.now())
+        invalidate_user(*queryset.values_list('assigned_paramedic_id', flat=True))
+        bump('ambulances')
+        record('ambulance', ids, before=before)
         self.message_user(request, f'{updated} ambulances marked as under maintenance.')
     mark_as_maintenance.short_description = "Mark selected ambulances as under maintenance"
+
+
+@admin.register(GeocodedAddress)
+class GeocodedAddressAdmin(admin.ModelAdmin):
+    """Admin configuration for GeocodedAddress cache entries"""
+    
+    list_display = ('normalized_address', 'latitude', 'longitude', 'source', 'created_at')
+    list_filter = ('source',)
+    search_fields = ('normalized_address',)
+    readonly_fields = ('created_at',)
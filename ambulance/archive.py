@@ -0,0 +1,94 @@
+"""
+Hot/cold storage of closed ambulance requests.
+
+``archive_requests`` moves completed and cancelled requests, with their
+status history, into ``ambulance_request_archive`` and
+``ambulance_request_status_update_archive``. Each batch is copied with
+``INSERT ... SELECT`` and deleted in one short transaction, so writers are
+only blocked for the duration of a batch. Archived rows keep their ids.
+
+Views that show closed history read through ``get_request`` and
+``count_by`` so archived requests stay visible.
+"""
+
+from django.db import connection, transaction
+from django.db.models import Count
+from django.http import Http404
+from django.utils import timezone
+
+from .changes import record
+from .models import AmbulanceRequest, ArchivedAmbulanceRequest, ArchivedRequestStatusUpdate, RequestStatusUpdate
+
+CLOSED_STATUSES = ('completed', 'cancelled')
+
+
+def _copy_sql(source, target, key, count, extra_columns=()):
+    quote = connection.ops.quote_name
+    columns = [field.column for field in source._meta.concrete_fields]
+    placeholders = ', '.join(['%s'] * count)
+    insert_columns = ', '.join(quote(column) for column in columns + list(extra_columns))
+    select_columns = ', '.join([quote(column) for column in columns] + ['%s'] * len(extra_columns))
+    return (
+        f'INSERT INTO {quote(target._meta.db_table)} ({insert_columns}) '
+        f'SELECT {select_columns} FROM {quote(source._meta.db_table)} WHERE {quote(key)} IN ({placeholders})'
+    )
+
+
+def archivable_requests(days):
+    """Closed requests last updated more than days ago, oldest id first"""
+    cutoff = timezone.now() - timezone.timedelta(days=days)
+    return AmbulanceRequest.objects.filter(
+        status__in=CLOSED_STATUSES, updated_at__lt=cutoff
+    ).order_by('pk')
+
+
+def archive_batch(ids):
+    """Move the given requests and their status updates to the archive tables in one transaction"""
+    ids = list(ids)
+    if not ids:
+        return 0
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            # Requests first: archived status updates reference them
+            cursor.execute(
+                _copy_sql(AmbulanceRequest, ArchivedAmbulanceRequest, 'id', len(ids), ['archived_at']),
+                [timezone.now()] + ids,
+            )
+            cursor.execute(
+                _copy_sql(RequestStatusUpdate, ArchivedRequestStatusUpdate, 'request_id', len(ids)),
+                ids,
+            )
+        # The ORM delete removes the status updates and clears duplicate_of on hot requests
+        relinked = list(
+            AmbulanceRequest.objects.filter(duplicate_of_id__in=ids).exclude(pk__in=ids).values_list('pk', flat=True)
+        )
+        AmbulanceRequest.objects.filter(pk__in=ids).delete()
+        record('request', relinked)
+    return len(ids)
+
+
+def get_request(pk, queryset=None):
+    """Return the live request with this pk, or its archived copy"""
+    queryset = AmbulanceRequest.objects.all() if queryset is None else queryset
+    try:
+        return queryset.get(pk=pk)
+    except AmbulanceRequest.DoesNotExist:
+        pass
+    try:
+        return ArchivedAmbulanceRequest.objects.select_related('patient', 'paramedic', 'ambulance').get(pk=pk)
+    except ArchivedAmbulanceRequest.DoesNotExist:
+        raise Http404('No request matches the given query.')
+
+
+def is_archived(ambulance_request):
+    return isinstance(ambulance_request, ArchivedAmbulanceRequest)
+
+
+def count_by(field, **filters):
+    """Count live and archived requests grouped by field, as {value: count}"""
+    counts = {}
+    for model in (AmbulanceRequest, ArchivedAmbulanceRequest):
+        rows = model.objects.filter(**filters).values_list(field).annotate(count=Count('pk')).order_by()
+        for value, count in rows:
+            counts[value] = counts.get(value, 0) + count
+    return counts
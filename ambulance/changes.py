@@ -0,0 +1,119 @@
+"""
+Change log behind the delta-sync API.
+
+Every save or delete of an ``AmbulanceRequest`` or ``Ambulance`` appends a
+row to ``ambulance_change_log`` (see ``ambulance.signals``); code that writes
+with ``.update()`` skips the signals and calls ``record`` itself. The log's
+autoincrement id is the client's cursor: a poll reads the entries after it by
+primary key, so its cost depends on the number of changes, not on the size of
+the tables. SQLite serializes writers, so ids become visible in order and a
+cursor never skips an entry that commits later.
+
+Each entry also notes who could see the object just before and just after
+the change: the patient of a request, its paramedic (or the ambulance's),
+and whether it was open to everyone (a pending request for paramedics, an
+available ambulance). The API only tells a client an id was removed when
+one of these entries shows the client could have seen it.
+
+``prune`` drops old entries. A client whose cursor is older than the oldest
+remaining entry is told to reload everything (``reset``).
+"""
+
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from .models import Ambulance, AmbulanceRequest, ChangeLog
+
+KINDS = ('request', 'ambulance')
+
+NOBODY = (None, None, False)
+
+
+def audience(kind, instance):
+    """(patient id, paramedic id, open to everyone) of a request or ambulance"""
+    if kind == 'request':
+        return instance.patient_id, instance.paramedic_id, instance.status == 'pending'
+    return None, instance.assigned_paramedic_id, instance.status == 'available'
+
+
+def stored_audiences(kind, ids):
+    """audience of the stored rows with the given ids, by id"""
+    if kind == 'request':
+        rows = AmbulanceRequest.objects.only('patient_id', 'paramedic_id', 'status')
+    else:
+        rows = Ambulance.objects.only('assigned_paramedic_id', 'status')
+    return {row.pk: audience(kind, row) for row in rows.filter(pk__in=ids)}
+
+
+def record(kind, ids, action='upsert', before=None, after=None):
+    """
+    Append log entries for the given object ids.
+
+    before and after map ids to their audience around the change. after
+    defaults to the stored rows, before to after (a change that did not
+    affect who can see the object).
+    """
+    ids = list(ids)
+    if not ids:
+        return
+    if after is None:
+        after = stored_audiences(kind, ids)
+    if before is None:
+        before = after
+    entries = []
+    for pk in ids:
+        owner, assignee, public = after.get(pk, NOBODY)
+        _, previous_assignee, was_public = before.get(pk, NOBODY)
+        entries.append(ChangeLog(
+            kind=kind, object_id=pk, action=action, owner_id=owner, assignee_id=assignee,
+            previous_assignee_id=previous_assignee, public=public or was_public,
+        ))
+    ChangeLog.objects.bulk_create(entries)
+
+
+def current_cursor():
+    """Id of the newest entry; a client that has loaded everything continues from here"""
+    return ChangeLog.objects.aggregate(cursor=Max('id'))['cursor'] or 0
+
+
+def changes_since(cursor, limit):
+    """
+    Ids changed after cursor, per kind, from at most limit entries.
+
+    Returns (ids by kind, next cursor, has_more, reset). Several entries for
+    one object collapse into one id; callers look up the current rows, so
+    whether an id was created, updated or deleted follows from what is there.
+    """
+    oldest = ChangeLog.objects.aggregate(oldest=Min('id'))['oldest']
+    # Entries up to oldest - 1 may have been pruned; ids only grow, so a gap means missed changes
+    reset = oldest is not None and cursor < oldest - 1
+
+    entries = list(
+        ChangeLog.objects.filter(id__gt=cursor).order_by('id').values_list('id', 'kind', 'object_id')[:limit + 1]
+    )
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    ids = {kind: set() for kind in KINDS}
+    for _, kind, object_id in entries:
+        ids[kind].add(object_id)
+    next_cursor = entries[-1][0] if entries else cursor
+    return ids, next_cursor, has_more, reset
+
+
+def seen_ids(kind, ids, cursor, next_cursor, entries):
+    """Those of ids with an entry in (cursor, next_cursor] matching the entries filter, sorted"""
+    if not ids:
+        return []
+    return sorted(set(
+        ChangeLog.objects.filter(kind=kind, object_id__in=ids, id__gt=cursor, id__lte=next_cursor)
+        .filter(entries).values_list('object_id', flat=True)
+    ))
+
+
+def prune(days):
+    """Delete entries older than days, always keeping the newest so ids are not reused"""
+    cutoff = timezone.now() - timezone.timedelta(days=days)
+    newest = current_cursor()
+    deleted, _ = ChangeLog.objects.filter(changed_at__lt=cutoff, id__lt=newest).delete()
+    return deleted
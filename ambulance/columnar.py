@@ -0,0 +1,323 @@
+"""
+Columnar history of closed requests for long-range analytics.
+
+``export_columnar`` appends completed and cancelled requests (live and
+archived) to ``ANALYTICS_STORE_DIR`` as one NumPy ``.npy`` file per column
+in daily partitions named after the request's creation date::
+
+    2025/03/14/id.npy  created_at.npy  status.npy  priority.npy ...
+
+Queries memory-map the files (``mmap_mode='r'``) and aggregate one
+partition at a time with vectorized NumPy operations into running totals, so
+scanning years of history never builds model instances and never holds more
+than one day's columns in memory. Percentiles come from histograms with
+0.1 minute bins, the precision the figures are shown in.
+
+Each day is a symlink to an immutable version directory (``14.<hex>``).
+Appending writes a complete new version and swaps the symlink with one
+``os.replace``; a scan resolves the link once per partition, so it reads one
+version or the other, never a mix, and reloads the partition if its version
+is deleted before the files are open.
+
+Exports are idempotent: a request written again (for example after an edit
+to a closed request) replaces its earlier row in the partition. That lets
+each export re-read a few minutes before the previous one started
+(``manifest.json`` holds the watermark), so rows committed while an export
+was running are never missed.
+"""
+
+import datetime
+import json
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from .archive import CLOSED_STATUSES
+from .models import AmbulanceRequest, ArchivedAmbulanceRequest
+
+STATUS_CODES = {status: code for code, (status, _) in enumerate(AmbulanceRequest.STATUS_CHOICES)}
+PRIORITY_RANKS = {priority: rank for rank, (priority, _) in enumerate(AmbulanceRequest.PRIORITY_CHOICES)}
+
+# Column name -> dtype; durations are seconds from creation (NaN when the step never happened)
+COLUMNS = {
+    'id': np.int64,
+    'created_at': np.int64,
+    'status': np.int8,
+    'priority': np.int8,
+    'pickup_latitude': np.float32,
+    'pickup_longitude': np.float32,
+    'assign_seconds': np.float32,
+    'arrival_seconds': np.float32,
+    'completion_seconds': np.float32,
+}
+
+# Re-read window before the previous export; covers transactions still open when it ran
+EXPORT_OVERLAP = datetime.timedelta(minutes=5)
+
+SOURCE_FIELDS = [
+    'id', 'created_at', 'updated_at', 'status', 'priority', 'pickup_latitude', 'pickup_longitude',
+    'assigned_at', 'actual_arrival_time', 'completed_at',
+]
+
+
+def store_dir():
+    return Path(getattr(settings, 'ANALYTICS_STORE_DIR', Path(settings.BASE_DIR) / 'var' / 'analytics'))
+
+
+def _seconds_since(created, moment):
+    return (moment - created).total_seconds() if moment is not None else np.nan
+
+
+def _to_row(values):
+    pk, created, _, status, priority, lat, lng, assigned, arrived, completed = values
+    return (
+        pk, int(created.timestamp()), STATUS_CODES[status], PRIORITY_RANKS.get(priority, -1),
+        float(lat) if lat is not None else np.nan, float(lng) if lng is not None else np.nan,
+        _seconds_since(created, assigned), _seconds_since(created, arrived), _seconds_since(created, completed),
+    )
+
+
+class ColumnarStore:
+    """Daily partitions of per-column ``.npy`` files under one directory"""
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else store_dir()
+
+    # Writing
+
+    def read_manifest(self):
+        try:
+            return json.loads((self.path / 'manifest.json').read_text())
+        except FileNotFoundError:
+            return {}
+
+    def write_manifest(self, manifest):
+        self.path.mkdir(parents=True, exist_ok=True)
+        tmp = self.path / 'manifest.json.tmp'
+        tmp.write_text(json.dumps(manifest, indent=2))
+        os.replace(tmp, self.path / 'manifest.json')
+
+    def partition_path(self, day):
+        return self.path / f'{day.year:04d}' / f'{day.month:02d}' / f'{day.day:02d}'
+
+    def append(self, day, rows):
+        """Merge rows into the partition for day, replacing rows with the same id"""
+        new = {name: np.array([row[i] for row in rows], dtype=dtype) for i, (name, dtype) in enumerate(COLUMNS.items())}
+        path = self.partition_path(day)
+        if (path / 'id.npy').exists():
+            old = {name: np.load(path / f'{name}.npy') for name in COLUMNS}
+            keep = ~np.isin(old['id'], new['id'])
+            new = {name: np.concatenate([old[name][keep], new[name]]) for name in COLUMNS}
+        order = np.argsort(new['created_at'], kind='stable')
+
+        # Write a complete new version, then point the partition at it in one rename
+        version = path.with_name(f'{path.name}.{uuid.uuid4().hex[:12]}')
+        version.mkdir(parents=True)
+        for name in COLUMNS:
+            np.save(version / f'{name}.npy', new[name][order])
+        link = path.with_name(path.name + '.link')
+        link.unlink(missing_ok=True)
+        link.symlink_to(version.name)
+        if path.exists() and not path.is_symlink():
+            # A plain directory from before versioned partitions
+            os.replace(path, path.with_name(f'{path.name}.{uuid.uuid4().hex[:12]}'))
+        os.replace(link, path)
+        # Older versions; open memory maps keep their files
+        for retired in path.parent.glob(f'{path.name}.*'):
+            if retired != version:
+                shutil.rmtree(retired, ignore_errors=True)
+        return len(order)
+
+    def export(self, batch_size=20000, flush_rows=250000, rebuild=False):
+        """Append requests closed since the last export; returns the number of rows written"""
+        if rebuild:
+            shutil.rmtree(self.path, ignore_errors=True)
+        manifest = self.read_manifest()
+        watermark = manifest.get('watermark')
+        watermark = datetime.datetime.fromisoformat(watermark) if watermark else None
+        started = datetime.datetime.now(datetime.timezone.utc)
+
+        # Rows are buffered per day so each partition is rewritten once per flush, not once per batch
+        by_day = {}
+        buffered = written = 0
+        for model in (AmbulanceRequest, ArchivedAmbulanceRequest):
+            queryset = model.objects.filter(status__in=CLOSED_STATUSES).order_by('pk')
+            if watermark is not None:
+                queryset = queryset.filter(updated_at__gte=watermark)
+            last_pk = None
+            while True:
+                batch_qs = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+                batch = list(batch_qs.values_list(*SOURCE_FIELDS)[:batch_size])
+                if not batch:
+                    break
+                last_pk = batch[-1][0]
+                for values in batch:
+                    by_day.setdefault(values[1].astimezone(datetime.timezone.utc).date(), []).append(_to_row(values))
+                buffered += len(batch)
+                if buffered >= flush_rows:
+                    written += self._flush(by_day)
+                    buffered = 0
+        written += self._flush(by_day)
+
+        manifest['watermark'] = (started - EXPORT_OVERLAP).isoformat()
+        manifest['exported_at'] = started.isoformat()
+        self.write_manifest(manifest)
+        return written
+
+    def _flush(self, by_day):
+        count = 0
+        for day, rows in sorted(by_day.items()):
+            self.append(day, rows)
+            count += len(rows)
+        by_day.clear()
+        return count
+
+    # Reading
+
+    def partitions(self, start=None, end=None):
+        """Dates of existing partitions within [start, end], oldest first"""
+        days = []
+        for path in sorted(self.path.glob('[0-9][0-9][0-9][0-9]/[0-9][0-9]/[0-9][0-9]')):
+            day = datetime.date(int(path.parent.parent.name), int(path.parent.name), int(path.name))
+            if (start is None or day >= start) and (end is None or day <= end):
+                days.append(day)
+        return days
+
+    def load(self, day, columns, attempts=3):
+        """Memory-map columns of a partition, all from one version; None if the partition was removed"""
+        path = self.partition_path(day)
+        for _ in range(attempts):
+            try:
+                version = path.resolve(strict=True)
+                return {name: np.load(version / f'{name}.npy', mmap_mode='r') for name in columns}
+            except FileNotFoundError:
+                # Replaced and deleted between resolving and opening: read the new version
+                time.sleep(0.001)
+        return None
+
+    def scan(self, columns, start=None, end=None):
+        """Yield (day, {name: memory-mapped array}) for each partition in range"""
+        for day in self.partitions(start, end):
+            arrays = self.load(day, columns)
+            if arrays is not None:
+                yield day, arrays
+
+
+# Durations are binned to the 0.1 minute they are shown in; anything over a week shares the last bin
+DURATION_BIN_SECONDS = 6
+MAX_DURATION_BINS = 7 * 24 * 60 * 60 // DURATION_BIN_SECONDS
+
+
+class DurationStats:
+    """Running count, sum and histogram of durations in seconds"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.histogram = np.zeros(0, dtype=np.int64)
+
+    def add(self, values):
+        if not len(values):
+            return
+        self.count += len(values)
+        self.total += float(values.sum(dtype=np.float64))
+        bins = np.clip(values // DURATION_BIN_SECONDS, 0, MAX_DURATION_BINS - 1).astype(np.int64)
+        counts = np.bincount(bins)
+        if len(counts) > len(self.histogram):
+            self.histogram = np.pad(self.histogram, (0, len(counts) - len(self.histogram)))
+        self.histogram[:len(counts)] += counts
+
+    def percentile(self, q):
+        """q-th percentile in seconds, interpolated between ranks like np.percentile, to within a bin"""
+        position = q / 100 * (self.count - 1)
+        lower, upper = int(np.floor(position)), int(np.ceil(position))
+        # Bin of the 0-based rank: first bin whose running count exceeds it
+        cumulative = np.cumsum(self.histogram)
+        low, high = (np.searchsorted(cumulative, [lower, upper], side='right') + 0.5) * DURATION_BIN_SECONDS
+        return float(low + (high - low) * (position - lower))
+
+    def summary(self):
+        """Count, mean, median and 90th percentile in minutes"""
+        return {
+            'count': self.count,
+            'mean': round(self.total / self.count / 60, 1),
+            'median': round(self.percentile(50) / 60, 1),
+            'p90': round(self.percentile(90) / 60, 1),
+        }
+
+
+class HistoryTotals:
+    """Figures over many partitions, accumulated one partition at a time"""
+
+    columns = ['status', 'priority', 'assign_seconds', 'completion_seconds']
+    durations = ('assign_seconds', 'completion_seconds')
+
+    def __init__(self):
+        self.yearly = {}
+        self.statuses = np.zeros(len(STATUS_CODES), dtype=np.int64)
+        # Durations of completed requests per column and priority
+        self.stats = {column: {priority: DurationStats() for priority in PRIORITY_RANKS} for column in self.durations}
+
+    def add(self, day, arrays):
+        """Count one partition; its rows were all created on day (UTC)"""
+        statuses = arrays['status']
+        if not len(statuses):
+            return
+        self.yearly[day.year] = self.yearly.get(day.year, 0) + len(statuses)
+        self.statuses += np.bincount(statuses[statuses >= 0], minlength=len(STATUS_CODES))[:len(STATUS_CODES)]
+
+        completed = statuses == STATUS_CODES['completed']
+        ranks = arrays['priority']
+        for column in self.durations:
+            values = arrays[column]
+            mask = completed & ~np.isnan(values)
+            for priority, rank in PRIORITY_RANKS.items():
+                self.stats[column][priority].add(values[mask & (ranks == rank)])
+
+    def status_counts(self):
+        return {status: int(self.statuses[code]) for status, code in STATUS_CODES.items()}
+
+    def duration_stats(self, column):
+        """Stats per priority with any completed request, in minutes"""
+        return {
+            priority: stats.summary() for priority, stats in self.stats[column].items() if stats.count
+        }
+
+
+def history_summary(years=5):
+    """Multi-year figures for the admin reports page, or None if nothing has been exported"""
+    store = ColumnarStore()
+    exported_at = store.read_manifest().get('exported_at')
+    if exported_at is None:
+        return None
+    # The store only changes on export, so the summary is cached per export
+    cache_key = f'analytics-history:{years}:{exported_at}'
+    summary = cache.get(cache_key)
+    if summary is not None:
+        return summary
+
+    today = datetime.date.today()
+    totals = HistoryTotals()
+    for day, arrays in store.scan(totals.columns, start=today.replace(year=today.year - years + 1, month=1, day=1)):
+        totals.add(day, arrays)
+    if not totals.yearly:
+        return None
+    assign = totals.duration_stats('assign_seconds')
+    completion = totals.duration_stats('completion_seconds')
+    summary = {
+        'yearly_counts': sorted(totals.yearly.items()),
+        'status_counts': totals.status_counts(),
+        'response_times': [
+            {'priority': priority, 'assign': assign[priority], 'completion': completion.get(priority)}
+            for priority in PRIORITY_RANKS if priority in assign
+        ],
+        'exported_at': exported_at,
+    }
+    cache.set(cache_key, summary, None)
+    return summary
@@ -0,0 +1,126 @@
+"""
+Spatio-temporal duplicate-call detection.
+
+Pickup coordinates are bucketed into a fixed grid (``pickup_cell``). A new
+request is compared only against recent, still-open requests in its own cell
+and the eight neighbouring cells, which is a single range scan on the
+(pickup_cell, created_at) index.
+"""
+
+import math
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils import timezone
+
+EARTH_RADIUS_M = 6371000
+
+# Cells are encoded as lat_index * CELL_STRIDE + lng_index
+CELL_STRIDE = 10 ** 7
+
+CLOSED_STATUSES = ('completed', 'cancelled')
+
+
+def _cell_size():
+    return getattr(settings, 'DUPLICATE_CELL_SIZE_DEGREES', 0.005)
+
+
+def cell_for(latitude, longitude):
+    """Return the grid cell id for a coordinate pair, or None if incomplete"""
+    if latitude is None or longitude is None:
+        return None
+    size = _cell_size()
+    lat_index = int(math.floor((float(latitude) + 90) / size))
+    lng_index = int(math.floor((float(longitude) + 180) / size))
+    return lat_index * CELL_STRIDE + lng_index
+
+
+def neighbor_cells(cell):
+    """Return the cell and its eight neighbours"""
+    lat_index, lng_index = divmod(cell, CELL_STRIDE)
+    return [
+        (lat_index + d_lat) * CELL_STRIDE + (lng_index + d_lng)
+        for d_lat in (-1, 0, 1)
+        for d_lng in (-1, 0, 1)
+    ]
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    """Great-circle distance in metres"""
+    lat1, lng1, lat2, lng2 = map(math.radians, (float(lat1), float(lng1), float(lat2), float(lng2)))
+    a = (math.sin((lat2 - lat1) / 2) ** 2 +
+         math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+def find_duplicate_of(ambulance_request, now=None):
+    """
+    Return the id of the original request this one likely duplicates, or None.
+
+    Candidates are open requests created within the detection window whose
+    pickup lies within the detection radius. Duplicates are always linked to
+    the root of their cluster so clusters stay one level deep.
+    """
+    from .models import AmbulanceRequest
+
+    cell = ambulance_request.pickup_cell
+    if cell is None:
+        return None
+
+    now = now or timezone.now()
+    window = timedelta(minutes=getattr(settings, 'DUPLICATE_WINDOW_MINUTES', 30))
+    radius = getattr(settings, 'DUPLICATE_RADIUS_METERS', 300)
+
+    candidates = AmbulanceRequest.objects.filter(
+        pickup_cell__in=neighbor_cells(cell),
+        created_at__range=(now - window, now),
+    ).exclude(
+        status__in=CLOSED_STATUSES
+    ).exclude(
+        pk=ambulance_request.pk
+    ).order_by('created_at').values_list(
+        'id', 'duplicate_of_id', 'pickup_latitude', 'pickup_longitude'
+    )
+
+    for candidate_id, candidate_root, latitude, longitude in candidates:
+        distance = haversine_m(
+            ambulance_request.pickup_latitude, ambulance_request.pickup_longitude,
+            latitude, longitude,
+        )
+        if distance <= radius:
+            return candidate_root or candidate_id
+    return None
+
+
+def flag_duplicate(ambulance_request):
+    """Link a stored request to the cluster it duplicates, if any"""
+    from .changes import record
+    from .models import AmbulanceRequest
+
+    original_id = find_duplicate_of(ambulance_request, now=ambulance_request.created_at)
+    if original_id:
+        AmbulanceRequest.objects.filter(pk=ambulance_request.pk).update(duplicate_of_id=original_id)
+        record('request', [ambulance_request.pk])
+        ambulance_request.duplicate_of_id = original_id
+    return original_id
+
+
+def recent_clusters(hours=24, limit=10):
+    """Return recent duplicate clusters, newest activity first"""
+    from .models import AmbulanceRequest
+
+    since = timezone.now() - timedelta(hours=hours)
+    rows = list(
+        AmbulanceRequest.objects.filter(duplicate_of__isnull=False, created_at__gte=since)
+        .values('duplicate_of')
+        .annotate(count=Count('id'), latest=Max('created_at'))
+        .order_by('-latest')[:limit]
+    )
+    originals = AmbulanceRequest.objects.select_related('patient').in_bulk(
+        [row['duplicate_of'] for row in rows]
+    )
+    return [
+        {'original': originals[row['duplicate_of']], 'count': row['count'], 'latest': row['latest']}
+        for row in rows if row['duplicate_of'] in originals
+    ]
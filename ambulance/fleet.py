@@ -0,0 +1,152 @@
+"""
+In-process registry of the ambulance fleet.
+
+The fleet is small and read far more often than it changes: availability
+lists, dashboard counts and the offline sync response all need it. ``fleet`` keeps one ``FleetEntry`` (a ``__slots__`` record with
+the paramedic attached) per ambulance in each worker process and answers
+those reads from memory.
+
+Consistency:
+
+* Write-through: a saved or deleted ambulance updates this process's
+  snapshot once its transaction commits, and bumps the ``ambulances``
+  version counter (``emergency_ambulance.cache_versions``).
+* Cross-process: every read compares the snapshot's counters with the
+  shared ones (one cache ``get_many``) and reloads the whole fleet with one
+  query when another process, or a bulk ``update()`` that bumped the
+  counter, changed it. The ``paramedics`` counter is watched too, since
+  entries carry their paramedic; it only moves when a paramedic's
+  ``PARAMEDIC_FIELDS`` are saved, not on every user save (a login writes
+  ``last_login``).
+
+The snapshot is loaded on first use rather than in ``AppConfig.ready()``,
+where Django discourages queries (and ``migrate`` may not have created the
+table yet). With a per-process cache such as LocMemCache, other processes'
+writes are not seen; use a shared cache in production.
+"""
+
+import threading
+from operator import attrgetter
+
+from django.db import transaction
+
+from emergency_ambulance.cache_versions import bump, counters
+from .models import Ambulance
+
+COUNTERS = ('ambulances', 'paramedics')
+
+# User fields the API shows of an entry's paramedic (ParamedicSerializer)
+PARAMEDIC_FIELDS = frozenset({
+    'username', 'first_name', 'last_name', 'phone_number', 'is_available', 'license_number', 'profile_image',
+})
+
+STATUS_LABELS = dict(Ambulance.STATUS_CHOICES)
+
+
+class FleetEntry:
+    """One ambulance; attribute names follow the model, so ``AmbulanceSerializer`` accepts entries"""
+
+    __slots__ = (
+        'id', 'vehicle_number', 'license_plate', 'status', 'current_latitude', 'current_longitude',
+        'location_recorded_at', 'assigned_paramedic_id', 'assigned_paramedic', 'model', 'year',
+        'created_at', 'updated_at',
+    )
+
+    @classmethod
+    def from_ambulance(cls, ambulance, paramedic):
+        entry = cls()
+        for name in cls.__slots__:
+            if name != 'assigned_paramedic':
+                setattr(entry, name, getattr(ambulance, name))
+        entry.assigned_paramedic = paramedic
+        return entry
+
+    @property
+    def pk(self):
+        return self.id
+
+    @property
+    def is_available(self):
+        return self.status == 'available'
+
+    def get_status_display(self):
+        return STATUS_LABELS.get(self.status, self.status)
+
+
+class FleetRegistry:
+    """Snapshot of every ambulance, by id"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Replaced, never changed in place, so readers can iterate without the lock
+        self._entries = {}
+        # Counter values the entries reflect; None until loaded or after a missed update
+        self._version = None
+
+    def load(self):
+        # Read the counters first: a write during the query leaves the snapshot stale, never wrongly current
+        version = counters(*COUNTERS)
+        ambulances = Ambulance.objects.select_related('assigned_paramedic')
+        entries = {ambulance.pk: FleetEntry.from_ambulance(ambulance, ambulance.assigned_paramedic)
+                   for ambulance in ambulances}
+        with self._lock:
+            self._entries, self._version = entries, version
+        return entries
+
+    def entries(self):
+        """Current entries by id, reloaded if the fleet changed elsewhere"""
+        if self._version is None or self._version != counters(*COUNTERS):
+            return self.load()
+        return self._entries
+
+    def saved(self, ambulance):
+        """Write a saved ambulance through to the snapshot once its transaction commits"""
+        if ambulance.get_deferred_fields():
+            entry = None
+        else:
+            entry = FleetEntry.from_ambulance(ambulance, self._paramedic_of(ambulance))
+        transaction.on_commit(lambda: self._apply(ambulance.pk, entry))
+
+    def deleted(self, pk):
+        transaction.on_commit(lambda: self._apply(pk, None, deleted=True))
+
+    def _paramedic_of(self, ambulance):
+        if ambulance.assigned_paramedic_id is None:
+            return None
+        previous = self._entries.get(ambulance.pk)
+        if not Ambulance.assigned_paramedic.is_cached(ambulance) and previous is not None \
+                and previous.assigned_paramedic_id == ambulance.assigned_paramedic_id:
+            return previous.assigned_paramedic
+        return ambulance.assigned_paramedic
+
+    def _apply(self, pk, entry, deleted=False):
+        new = bump('ambulances')['ambulances']
+        with self._lock:
+            # Only the bump just made may separate the snapshot from the counter; otherwise reload later
+            if self._version is None or self._version['ambulances'] != new - 1 or (entry is None and not deleted):
+                self._version = None
+                return
+            entries = dict(self._entries)
+            if deleted:
+                entries.pop(pk, None)
+            else:
+                entries[pk] = entry
+            self._entries = entries
+            self._version = dict(self._version, ambulances=new)
+
+    def available(self):
+        """Available ambulances, by vehicle number"""
+        return sorted(
+            (entry for entry in self.entries().values() if entry.status == 'available'),
+            key=attrgetter('vehicle_number'),
+        )
+
+    def for_paramedic(self, user_id):
+        """The entry of the ambulance a paramedic is assigned to, or None"""
+        for entry in self.entries().values():
+            if entry.assigned_paramedic_id == user_id:
+                return entry
+        return None
+
+
+fleet = FleetRegistry()
@@ -1,3 +1,5 @@
+import uuid
+
 from django import forms
 from django.contrib.auth import get_user_model
 from .models import AmbulanceRequest, RequestStatusUpdate, Ambulance
@@ -8,6 +10,9 @@ User = get_user_model()
 class AmbulanceRequestForm(forms.ModelForm):
     """Form for creating ambulance requests"""
     
+    # Fresh for every rendered form; resubmitting the same form reuses it (see ambulance.idempotency)
+    idempotency_key = forms.CharField(widget=forms.HiddenInput(), required=False, max_length=64)
+    
     class Meta:
         model = AmbulanceRequest
         fields = [
@@ -30,7 +35,7 @@ class AmbulanceRequestForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         # Add Bootstrap classes
         for field_name, field in self.fields.items():
-            if field_name not in ['pickup_latitude', 'pickup_longitude', 'destination_latitude', 'destination_longitude']:
+            if field_name not in ['pickup_latitude', 'pickup_longitude', 'destination_latitude', 'destination_longitude', 'idempotency_key']:
                 if field_name == 'priority':
                     field.widget.attrs['class'] = 'form-select'
                 else:
@@ -40,6 +45,15 @@ class AmbulanceRequestForm(forms.ModelForm):
         self.fields['pickup_address'].required = True
         self.fields['description'].required = True
         self.fields['contact_phone'].required = True
+        
+        if not self.is_bound:
+            self.fields['idempotency_key'].initial = uuid.uuid4().hex
+    
+    def with_fresh_key(self):
+        """The same submitted data under a new key, so sending it again files a new request"""
+        data = self.data.copy()
+        data['idempotency_key'] = uuid.uuid4().hex
+        return type(self)(data)
 
 
 class RequestStatusUpdateForm(forms.ModelForm):
@@ -113,6 +127,11 @@ class AmbulanceForm(forms.ModelForm):
 class RequestFilterForm(forms.Form):
     """Form for filtering ambulance requests"""
     
+    q = forms.CharField(
+        required=False,
+        max_length=200,
+        widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Search addresses, descriptions and notes'})
+    )
     status = forms.ChoiceField(
         choices=[('', 'All Statuses')] + list(AmbulanceRequest.STATUS_CHOICES),
         required=False,
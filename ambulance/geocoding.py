@@ -0,0 +1,301 @@
+"""
+Local geocoding for ambulance request addresses.
+
+Lookups go through three layers, cheapest first:
+
+1. an in-process LRU of normalized address -> coordinates (hits only)
+2. the persistent ``GeocodedAddress`` table (shared by all workers); misses
+   are kept there too, but only for ``GEOCODER_MISS_TTL`` seconds, so
+   addresses added to the gazetteer later are found
+3. a local gazetteer file, loaded once and kept sorted
+
+Only an exact gazetteer entry, or the single entry that starts with every
+token of the address, is accepted: a pickup is never put at a look-alike
+address.
+
+The gazetteer is a tab-separated file (``settings.GEOCODER_GAZETTEER_PATH``)
+with one ``address<TAB>latitude<TAB>longitude`` entry per line. Lines starting
+with ``#`` are ignored. When the file is missing every lookup simply misses.
+"""
+
+import bisect
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+
+from .duplicates import cell_for, flag_duplicate
+
+logger = logging.getLogger(__name__)
+
+COORDINATE_PLACES = Decimal('0.000001')
+
+ABBREVIATIONS = {
+    'st': 'street',
+    'rd': 'road',
+    'ave': 'avenue',
+    'av': 'avenue',
+    'blvd': 'boulevard',
+    'dr': 'drive',
+    'ln': 'lane',
+    'ct': 'court',
+    'pl': 'place',
+    'hwy': 'highway',
+    'n': 'north',
+    's': 'south',
+    'e': 'east',
+    'w': 'west',
+}
+
+_NON_WORD = re.compile(r'[^\w\s]+')
+_WHITESPACE = re.compile(r'\s+')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def normalize_address(address):
+    """Lowercase, strip punctuation and expand common street abbreviations"""
+    if not address:
+        return ''
+    text = _NON_WORD.sub(' ', address.lower())
+    tokens = [ABBREVIATIONS.get(token, token) for token in _WHITESPACE.split(text) if token]
+    return ' '.join(tokens)[:255]
+
+
+class Gazetteer:
+    """Sorted in-memory index of the local gazetteer file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.keys = []
+        self.coordinates = []
+        self._load()
+
+    def _load(self):
+        entries = {}
+        try:
+            with open(self.path, encoding='utf-8') as handle:
+                for line in handle:
+                    if not line.strip() or line.startswith('#'):
+                        continue
+                    parts = line.rstrip('\n').split('\t')
+                    if len(parts) < 3:
+                        continue
+                    key = normalize_address(parts[0])
+                    try:
+                        coords = (_quantize(parts[1]), _quantize(parts[2]))
+                    except (InvalidOperation, ValueError):
+                        continue
+                    if key:
+                        entries.setdefault(key, coords)
+        except FileNotFoundError:
+            logger.info('Geocoder gazetteer %s not found; lookups will miss', self.path)
+        except OSError:
+            logger.exception('Could not read geocoder gazetteer %s', self.path)
+
+        self.keys = sorted(entries)
+        self.coordinates = [entries[key] for key in self.keys]
+
+    def lookup(self, normalized):
+        """
+        Find coordinates for a normalized address.
+
+        Tries the address itself, then without a leading house or unit
+        number (a token with digits). Each try takes an exact entry, or the
+        one entry that continues the address with more whole tokens (such as
+        the town); several such entries are ambiguous and miss.
+        """
+        tokens = normalized.split(' ')
+        candidates = [normalized]
+        if len(tokens) > 1 and any(char.isdigit() for char in tokens[0]):
+            candidates.append(' '.join(tokens[1:]))
+        for candidate in candidates:
+            index = bisect.bisect_left(self.keys, candidate)
+            if index < len(self.keys) and self.keys[index] == candidate:
+                return self.coordinates[index]
+            # Entries starting with "candidate " sort before "candidate!"
+            start = bisect.bisect_left(self.keys, candidate + ' ', index)
+            end = bisect.bisect_left(self.keys, candidate + '!', start)
+            if end - start == 1:
+                return self.coordinates[start]
+        return None
+
+
+@lru_cache(maxsize=1)
+def get_gazetteer():
+    return Gazetteer(settings.GEOCODER_GAZETTEER_PATH)
+
+
+def miss_ttl():
+    return getattr(settings, 'GEOCODER_MISS_TTL', 60 * 60 * 24)
+
+
+def _lookup(normalized):
+    from .models import GeocodedAddress
+
+    cached = GeocodedAddress.objects.filter(normalized_address=normalized).first()
+    if cached is not None:
+        if cached.latitude is not None:
+            return cached.latitude, cached.longitude
+        if (timezone.now() - cached.created_at).total_seconds() < miss_ttl():
+            return None
+
+    coords = get_gazetteer().lookup(normalized)
+    values = {
+        'latitude': coords[0] if coords else None,
+        'longitude': coords[1] if coords else None,
+        'source': 'gazetteer',
+    }
+    if cached is not None:
+        # An expired miss: look again from now
+        GeocodedAddress.objects.filter(pk=cached.pk).update(created_at=timezone.now(), **values)
+        return coords
+    try:
+        with transaction.atomic():
+            GeocodedAddress.objects.create(normalized_address=normalized, **values)
+    except IntegrityError:
+        # Another worker cached the same address first
+        pass
+    return coords
+
+
+class _Miss(Exception):
+    pass
+
+
+@lru_cache(maxsize=4096)
+def _cached_lookup(normalized):
+    coords = _lookup(normalized)
+    if coords is None:
+        # lru_cache does not keep exceptions, so misses are looked up again
+        raise _Miss
+    return coords
+
+
+def geocode(address):
+    """Return (latitude, longitude) for an address, or None when unknown"""
+    normalized = normalize_address(address)
+    if not normalized:
+        return None
+    try:
+        return _cached_lookup(normalized)
+    except _Miss:
+        return None
+
+
+def clear_caches():
+    """Drop the in-process LRU and reload the gazetteer on next lookup"""
+    _cached_lookup.cache_clear()
+    get_gazetteer.cache_clear()
+
+
+def forget_misses():
+    """Delete the cached misses, e.g. after adding entries to the gazetteer; returns how many"""
+    from .models import GeocodedAddress
+
+    deleted, _ = GeocodedAddress.objects.filter(latitude__isnull=True).delete()
+    return deleted
+
+
+def geocode_instance(ambulance_request):
+    """
+    Fill missing pickup/destination coordinates on an AmbulanceRequest.
+
+    Returns the list of changed field names; the instance is not saved.
+    """
+    changed = []
+    if ambulance_request.pickup_latitude is None and ambulance_request.pickup_address:
+        coords = geocode(ambulance_request.pickup_address)
+        if coords:
+            ambulance_request.pickup_latitude, ambulance_request.pickup_longitude = coords
+            ambulance_request.pickup_cell = cell_for(*coords)
+            changed += ['pickup_latitude', 'pickup_longitude', 'pickup_cell']
+    if ambulance_request.destination_latitude is None and ambulance_request.destination_address:
+        coords = geocode(ambulance_request.destination_address)
+        if coords:
+            ambulance_request.destination_latitude, ambulance_request.destination_longitude = coords
+            changed += ['destination_latitude', 'destination_longitude']
+    return changed
+
+
+def geocode_request(pk):
+    """Geocode a stored request, only filling coordinates that are still empty"""
+    from .changes import record
+    from .models import AmbulanceRequest
+
+    ambulance_request = AmbulanceRequest.objects.filter(pk=pk).only(
+        'created_at', 'pickup_address', 'pickup_latitude', 'pickup_longitude',
+        'destination_address', 'destination_latitude', 'destination_longitude',
+    ).first()
+    if ambulance_request is None:
+        return []
+
+    changed = geocode_instance(ambulance_request)
+    # update() skips auto_now; touch updated_at so cached rows are re-rendered
+    if 'pickup_latitude' in changed:
+        AmbulanceRequest.objects.filter(pk=pk, pickup_latitude__isnull=True).update(
+            pickup_latitude=ambulance_request.pickup_latitude,
+            pickup_longitude=ambulance_request.pickup_longitude,
+            pickup_cell=ambulance_request.pickup_cell,
+            updated_at=timezone.now(),
+        )
+        flag_duplicate(ambulance_request)
+    if 'destination_latitude' in changed:
+        AmbulanceRequest.objects.filter(pk=pk, destination_latitude__isnull=True).update(
+            destination_latitude=ambulance_request.destination_latitude,
+            destination_longitude=ambulance_request.destination_longitude,
+            updated_at=timezone.now(),
+        )
+    if changed:
+        record('request', [pk])
+    return changed
+
+
+def needs_geocoding(ambulance_request):
+    return bool(
+        (ambulance_request.pickup_latitude is None and ambulance_request.pickup_address) or
+        (ambulance_request.destination_latitude is None and ambulance_request.destination_address)
+    )
+
+
+def schedule_geocode(ambulance_request):
+    """Geocode a newly created request in the background once it is committed"""
+    if not needs_geocoding(ambulance_request):
+        return
+    pk = ambulance_request.pk
+    if getattr(settings, 'GEOCODER_ASYNC', True):
+        transaction.on_commit(lambda: _get_executor().submit(_run_in_worker, pk))
+    else:
+        transaction.on_commit(lambda: geocode_request(pk))
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'GEOCODER_WORKERS', 2),
+                thread_name_prefix='geocoder',
+            )
+    return _executor
+
+
+def _run_in_worker(pk):
+    close_old_connections()
+    try:
+        geocode_request(pk)
+    except Exception:
+        logger.exception('Geocoding failed for request #%s', pk)
+    finally:
+        close_old_connections()
+
+
+def _quantize(value):
+    return Decimal(str(value).strip()).quantize(COORDINATE_PLACES)
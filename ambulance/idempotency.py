@@ -0,0 +1,61 @@
+"""
+Idempotency keys for creating ambulance requests.
+
+A double-tapped submit button or a client resending a POST after a timeout
+must not file the same emergency twice. The request form carries a hidden
+per-render token and API clients send an ``Idempotency-Key`` header. The
+first POST with a key ``claim``s it in the transaction that creates the
+request and stores the response there (``complete``); a retry finds the
+entry with one lookup on the (user, scope, key) index and gets that
+response back without another insert. When two copies race, the unique
+index lets only one transaction commit; the other rolls back and replays.
+
+Keys expire after ``IDEMPOTENCY_KEY_TTL`` seconds. Each claim deletes the
+expired entries (through the ``expires_at`` index), so the table only holds
+live keys.
+"""
+
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+MAX_KEY_LENGTH = 64
+
+
+def key_ttl():
+    return getattr(settings, 'IDEMPOTENCY_KEY_TTL', 86400)
+
+
+def fingerprint(data):
+    """SHA-256 of submitted data, so a key reused for different data can be told apart"""
+    encoded = json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+def lookup(user, scope, key):
+    """The completed, unexpired entry for a key, or None"""
+    return IdempotencyKey.objects.filter(
+        user=user, scope=scope, key=key, expires_at__gt=timezone.now(), response_status__isnull=False
+    ).first()
+
+
+def claim(user, scope, key, data_fingerprint):
+    """Reserve a key inside the caller's transaction; raises IntegrityError if another has it"""
+    now = timezone.now()
+    IdempotencyKey.objects.filter(expires_at__lte=now).delete()
+    return IdempotencyKey.objects.create(
+        user=user, scope=scope, key=key, fingerprint=data_fingerprint,
+        expires_at=now + timezone.timedelta(seconds=key_ttl()),
+    )
+
+
+def complete(entry, status, body):
+    """Store the response a claimed key is to be answered with from now on"""
+    entry.response_status = status
+    entry.response_body = body
+    entry.save(update_fields=['response_status', 'response_body'])
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ambulance.archive import archivable_requests, archive_batch
+
+
+class Command(BaseCommand):
+    help = 'Move closed requests older than --days, with their status history, to the archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=90,
+                            help='Archive requests closed (last updated) more than this many days ago')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Requests moved per transaction; smaller batches hold write locks for less time')
+        parser.add_argument('--pause', type=float, default=0.05,
+                            help='Seconds to sleep between batches so other writers can get in')
+        parser.add_argument('--limit', type=int, default=None,
+                            help='Stop after archiving this many requests')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report how many requests would be archived')
+
+    def handle(self, *args, **options):
+        candidates = archivable_requests(options['days'])
+        if options['dry_run']:
+            self.stdout.write(f'{candidates.count()} requests would be archived')
+            return
+
+        batch_size = options['batch_size']
+        limit = options['limit']
+        archived = 0
+        while limit is None or archived < limit:
+            size = batch_size if limit is None else min(batch_size, limit - archived)
+            ids = list(candidates.values_list('pk', flat=True)[:size])
+            if not ids:
+                break
+            archived += archive_batch(ids)
+            self.stdout.write(f'Archived {archived} requests')
+            if options['pause']:
+                time.sleep(options['pause'])
+
+        self.stdout.write(self.style.SUCCESS(f'Done: archived {archived} requests'))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from ambulance.columnar import ColumnarStore
+
+
+class Command(BaseCommand):
+    help = 'Append closed requests to the columnar analytics store (ANALYTICS_STORE_DIR)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=20000,
+                            help='Requests read from the database per batch')
+        parser.add_argument('--path', default=None,
+                            help='Store directory (defaults to ANALYTICS_STORE_DIR)')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Delete the store and export all closed requests again')
+
+    def handle(self, *args, **options):
+        store = ColumnarStore(options['path'])
+        written = store.export(batch_size=options['batch_size'], rebuild=options['rebuild'])
+        partitions = len(store.partitions())
+        self.stdout.write(self.style.SUCCESS(
+            f'Done: exported {written} requests, {partitions} daily partitions in {store.path}'
+        ))
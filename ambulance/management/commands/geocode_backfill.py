@@ -0,0 +1,73 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from ambulance.changes import record
+from ambulance.duplicates import flag_duplicate
+from ambulance.geocoding import clear_caches, forget_misses, geocode_instance
+from ambulance.models import AmbulanceRequest
+
+
+class Command(BaseCommand):
+    help = 'Fill in missing pickup/destination coordinates from the local gazetteer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of requests to geocode per batch')
+        parser.add_argument('--limit', type=int, default=None,
+                            help='Stop after this many requests')
+        parser.add_argument('--reload', action='store_true',
+                            help='Reload the gazetteer file and forget cached misses before starting')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        limit = options['limit']
+        if options['reload']:
+            clear_caches()
+            self.stdout.write(f'Forgot {forget_misses()} cached misses')
+
+        missing = AmbulanceRequest.objects.filter(
+            Q(pickup_latitude__isnull=True) & ~Q(pickup_address='') |
+            Q(destination_latitude__isnull=True, destination_address__isnull=False) & ~Q(destination_address='')
+        ).only(
+            'created_at', 'pickup_address', 'pickup_latitude', 'pickup_longitude', 'pickup_cell',
+            'destination_address', 'destination_latitude', 'destination_longitude',
+        ).order_by('pk')
+
+        last_pk = 0
+        scanned = updated = 0
+        while limit is None or scanned < limit:
+            size = batch_size if limit is None else min(batch_size, limit - scanned)
+            batch = list(missing.filter(pk__gt=last_pk)[:size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            scanned += len(batch)
+
+            changed_rows = []
+            filled_pickups = []
+            changed_fields = set()
+            for ambulance_request in batch:
+                fields = geocode_instance(ambulance_request)
+                if fields:
+                    changed_rows.append(ambulance_request)
+                    changed_fields.update(fields)
+                if 'pickup_latitude' in fields:
+                    filled_pickups.append(ambulance_request)
+            if changed_rows:
+                # As geocode_request does: touch updated_at so cached rows are re-rendered, link
+                # duplicates of the filled pickups and tell delta-sync clients
+                now = timezone.now()
+                for ambulance_request in changed_rows:
+                    ambulance_request.updated_at = now
+                with transaction.atomic():
+                    AmbulanceRequest.objects.bulk_update(changed_rows, sorted(changed_fields) + ['updated_at'])
+                    for ambulance_request in filled_pickups:
+                        flag_duplicate(ambulance_request)
+                    record('request', [ambulance_request.pk for ambulance_request in changed_rows])
+                updated += len(changed_rows)
+
+            self.stdout.write(f'Scanned {scanned} requests, geocoded {updated}')
+
+        self.stdout.write(self.style.SUCCESS(f'Done: geocoded {updated} of {scanned} requests'))
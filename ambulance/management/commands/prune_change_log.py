@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from ambulance.changes import prune
+
+
+class Command(BaseCommand):
+    help = 'Delete delta-sync change log entries older than --days'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7,
+                            help='Keep entries from this many days; clients offline for longer reload everything')
+
+    def handle(self, *args, **options):
+        deleted = prune(options['days'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} change log entries'))
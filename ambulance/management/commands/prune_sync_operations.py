@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from ambulance.sync import prune
+
+
+class Command(BaseCommand):
+    help = 'Forget offline sync operation keys received more than --days ago'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30,
+                            help='Keep keys for this many days; a queue resent later would be applied again')
+
+    def handle(self, *args, **options):
+        deleted = prune(options['days'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} sync operation keys'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from ambulance.tracks import close, unsimplified_closed_tracks
+
+
+class Command(BaseCommand):
+    help = 'Simplify the GPS tracks of closed requests that were closed without a status update'
+
+    def handle(self, *args, **options):
+        ids = unsimplified_closed_tracks()
+        for request_id in ids:
+            close(request_id)
+        self.stdout.write(self.style.SUCCESS(f'Simplified {len(ids)} tracks'))
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.5 on 2026-10-19 07:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_pickup_cells(apps, schema_editor):
+    from ambulance.duplicates import cell_for
+    
+    AmbulanceRequest = apps.get_model('ambulance', 'AmbulanceRequest')
+    rows = AmbulanceRequest.objects.filter(pickup_latitude__isnull=False, pickup_longitude__isnull=False)
+    for row in rows.only('pickup_latitude', 'pickup_longitude').iterator():
+        row.pickup_cell = cell_for(row.pickup_latitude, row.pickup_longitude)
+        row.save(update_fields=['pickup_cell'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ambulance', '0003_geocodedaddress'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ambulancerequest',
+            name='duplicate_of',
+            field=models.ForeignKey(blank=True, help_text='Earlier request for the same emergency', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicates', to='ambulance.ambulancerequest'),
+        ),
+        migrations.AddField(
+            model_name='ambulancerequest',
+            name='pickup_cell',
+            field=models.BigIntegerField(blank=True, editable=False, help_text='Spatial grid cell of the pickup location', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='ambulancerequest',
+            index=models.Index(fields=['pickup_cell', 'created_at'], name='ambulance_req_cell_created'),
+        ),
+        migrations.RunPython(populate_pickup_cells, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,131 @@
+# Generated by Django 5.2.5 on 2026-10-19 07:24
+
+import ambulance.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+FTS_SQL = [
+    """
+    CREATE VIRTUAL TABLE ambulance_request_fts USING fts5(
+        pickup_address, destination_address, description, notes,
+        content='ambulance_request', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER ambulance_request_fts_insert AFTER INSERT ON ambulance_request BEGIN
+        INSERT INTO ambulance_request_fts(rowid, pickup_address, destination_address, description, notes)
+        VALUES (new.id, new.pickup_address, new.destination_address, new.description, new.notes);
+    END
+    """,
+    """
+    CREATE TRIGGER ambulance_request_fts_delete AFTER DELETE ON ambulance_request BEGIN
+        INSERT INTO ambulance_request_fts(ambulance_request_fts, rowid, pickup_address, destination_address, description, notes)
+        VALUES ('delete', old.id, old.pickup_address, old.destination_address, old.description, old.notes);
+    END
+    """,
+    """
+    CREATE TRIGGER ambulance_request_fts_update AFTER UPDATE ON ambulance_request
+    WHEN old.pickup_address IS NOT new.pickup_address
+        OR old.destination_address IS NOT new.destination_address
+        OR old.description IS NOT new.description
+        OR old.notes IS NOT new.notes
+    BEGIN
+        INSERT INTO ambulance_request_fts(ambulance_request_fts, rowid, pickup_address, destination_address, description, notes)
+        VALUES ('delete', old.id, old.pickup_address, old.destination_address, old.description, old.notes);
+        INSERT INTO ambulance_request_fts(rowid, pickup_address, destination_address, description, notes)
+        VALUES (new.id, new.pickup_address, new.destination_address, new.description, new.notes);
+    END
+    """,
+    "INSERT INTO ambulance_request_fts(ambulance_request_fts) VALUES ('rebuild')",
+    """
+    CREATE VIRTUAL TABLE ambulance_request_status_update_fts USING fts5(
+        notes,
+        content='ambulance_request_status_update', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER ambulance_request_status_update_fts_insert AFTER INSERT ON ambulance_request_status_update BEGIN
+        INSERT INTO ambulance_request_status_update_fts(rowid, notes) VALUES (new.id, new.notes);
+    END
+    """,
+    """
+    CREATE TRIGGER ambulance_request_status_update_fts_delete AFTER DELETE ON ambulance_request_status_update BEGIN
+        INSERT INTO ambulance_request_status_update_fts(ambulance_request_status_update_fts, rowid, notes)
+        VALUES ('delete', old.id, old.notes);
+    END
+    """,
+    """
+    CREATE TRIGGER ambulance_request_status_update_fts_update AFTER UPDATE ON ambulance_request_status_update
+    WHEN old.notes IS NOT new.notes
+    BEGIN
+        INSERT INTO ambulance_request_status_update_fts(ambulance_request_status_update_fts, rowid, notes)
+        VALUES ('delete', old.id, old.notes);
+        INSERT INTO ambulance_request_status_update_fts(rowid, notes) VALUES (new.id, new.notes);
+    END
+    """,
+    "INSERT INTO ambulance_request_status_update_fts(ambulance_request_status_update_fts) VALUES ('rebuild')",
+]
+
+DROP_FTS_SQL = [
+    'DROP TRIGGER IF EXISTS ambulance_request_fts_insert',
+    'DROP TRIGGER IF EXISTS ambulance_request_fts_delete',
+    'DROP TRIGGER IF EXISTS ambulance_request_fts_update',
+    'DROP TABLE IF EXISTS ambulance_request_fts',
+    'DROP TRIGGER IF EXISTS ambulance_request_status_update_fts_insert',
+    'DROP TRIGGER IF EXISTS ambulance_request_status_update_fts_delete',
+    'DROP TRIGGER IF EXISTS ambulance_request_status_update_fts_update',
+    'DROP TABLE IF EXISTS ambulance_request_status_update_fts',
+]
+
+
+def create_fts_index(apps, schema_editor):
+    # FTS5 is SQLite-only; other backends fall back to icontains search
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in FTS_SQL:
+        schema_editor.execute(statement)
+
+
+def drop_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in DROP_FTS_SQL:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ambulance', '0004_duplicate_detection'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AmbulanceRequestSearch',
+            fields=[
+                ('request', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='ambulance.ambulancerequest')),
+                ('document', ambulance.models.FullTextField(db_column='ambulance_request_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'ambulance_request_fts',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='RequestStatusUpdateSearch',
+            fields=[
+                ('status_update', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='ambulance.requeststatusupdate')),
+                ('document', ambulance.models.FullTextField(db_column='ambulance_request_status_update_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'ambulance_request_status_update_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(create_fts_index, drop_fts_index),
+    ]
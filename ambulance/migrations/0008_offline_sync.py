@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-19 08:33
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ambulance', '0007_change_log'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ambulance',
+            name='location_recorded_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='SyncOperation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64)),
+                ('kind', models.CharField(choices=[('status', 'Status transition'), ('location', 'Location stamp')], max_length=10)),
+                ('outcome', models.CharField(choices=[('applied', 'Applied'), ('rejected', 'Rejected'), ('superseded', 'Superseded')], max_length=10)),
+                ('detail', models.CharField(blank=True, max_length=255)),
+                ('recorded_at', models.DateTimeField(help_text='Device time at which the operation was queued')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'ambulance_sync_operation',
+                'constraints': [models.UniqueConstraint(fields=('user', 'key'), name='ambulance_sync_user_key')],
+            },
+        ),
+    ]
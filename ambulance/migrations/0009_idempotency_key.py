@@ -0,0 +1,35 @@
+# Generated by Django 5.2.5 on 2026-10-19 08:36
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ambulance', '0008_offline_sync'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('request_form', 'Request form'), ('request_api', 'Request API')], max_length=20)),
+                ('key', models.CharField(max_length=64)),
+                ('fingerprint', models.CharField(help_text='SHA-256 of the submitted data', max_length=64)),
+                ('response_status', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('response_body', models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'ambulance_idempotency_key',
+                'constraints': [models.UniqueConstraint(fields=('user', 'scope', 'key'), name='ambulance_idempotency_user_key')],
+            },
+        ),
+    ]
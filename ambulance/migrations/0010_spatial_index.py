@@ -0,0 +1,113 @@
+# Generated by Django 5.2.5 on 2026-10-19 08:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def rtree_sql(index, table, latitude, longitude):
+    """
+    An R*Tree over a table's coordinate pair, each point stored as a
+    zero-size box, and the triggers that keep it in sync. Rows without
+    coordinates are left out.
+    """
+    point = f'new.id, new.{latitude}, new.{latitude}, new.{longitude}, new.{longitude}'
+    located = f'new.{latitude} IS NOT NULL AND new.{longitude} IS NOT NULL'
+    return [
+        f'CREATE VIRTUAL TABLE {index} USING rtree(id, min_lat, max_lat, min_lng, max_lng)',
+        f"""
+        CREATE TRIGGER {index}_insert AFTER INSERT ON {table}
+        WHEN {located}
+        BEGIN
+            INSERT INTO {index} VALUES ({point});
+        END
+        """,
+        f"""
+        CREATE TRIGGER {index}_delete AFTER DELETE ON {table} BEGIN
+            DELETE FROM {index} WHERE id = old.id;
+        END
+        """,
+        f"""
+        CREATE TRIGGER {index}_update AFTER UPDATE ON {table}
+        WHEN old.{latitude} IS NOT new.{latitude} OR old.{longitude} IS NOT new.{longitude}
+        BEGIN
+            DELETE FROM {index} WHERE id = old.id;
+            INSERT INTO {index} SELECT {point} WHERE {located};
+        END
+        """,
+        f"""
+        INSERT INTO {index}
+        SELECT id, {latitude}, {latitude}, {longitude}, {longitude} FROM {table}
+        WHERE {latitude} IS NOT NULL AND {longitude} IS NOT NULL
+        """,
+    ]
+
+
+def drop_rtree_sql(index):
+    return [
+        f'DROP TRIGGER IF EXISTS {index}_insert',
+        f'DROP TRIGGER IF EXISTS {index}_delete',
+        f'DROP TRIGGER IF EXISTS {index}_update',
+        f'DROP TABLE IF EXISTS {index}',
+    ]
+
+
+RTREE_SQL = (
+    rtree_sql('ambulance_request_rtree', 'ambulance_request', 'pickup_latitude', 'pickup_longitude') +
+    rtree_sql('ambulance_vehicle_rtree', 'ambulance_vehicle', 'current_latitude', 'current_longitude')
+)
+
+DROP_RTREE_SQL = drop_rtree_sql('ambulance_request_rtree') + drop_rtree_sql('ambulance_vehicle_rtree')
+
+
+def create_rtree_index(apps, schema_editor):
+    # R*Tree is SQLite-only; other backends prefilter on the coordinate columns
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in RTREE_SQL:
+        schema_editor.execute(statement)
+
+
+def drop_rtree_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in DROP_RTREE_SQL:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ambulance', '0009_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AmbulanceLocation',
+            fields=[
+                ('ambulance', models.OneToOneField(db_column='id', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='location_index', serialize=False, to='ambulance.ambulance')),
+                ('min_lat', models.FloatField()),
+                ('max_lat', models.FloatField()),
+                ('min_lng', models.FloatField()),
+                ('max_lng', models.FloatField()),
+            ],
+            options={
+                'db_table': 'ambulance_vehicle_rtree',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='AmbulanceRequestLocation',
+            fields=[
+                ('request', models.OneToOneField(db_column='id', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='location_index', serialize=False, to='ambulance.ambulancerequest')),
+                ('min_lat', models.FloatField()),
+                ('max_lat', models.FloatField()),
+                ('min_lng', models.FloatField()),
+                ('max_lng', models.FloatField()),
+            ],
+            options={
+                'db_table': 'ambulance_request_rtree',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(create_rtree_index, drop_rtree_index),
+    ]
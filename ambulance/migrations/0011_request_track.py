@@ -0,0 +1,29 @@
+# Generated by Django 5.2.5 on 2026-10-19 08:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ambulance', '0010_spatial_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestTrack',
+            fields=[
+                ('request_id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('polyline', models.BinaryField(default=b'')),
+                ('point_count', models.PositiveIntegerField(default=0)),
+                ('fix_count', models.PositiveIntegerField(default=0, help_text='Fixes received, before simplification')),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('ended_at', models.DateTimeField(blank=True, null=True)),
+                ('simplified_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'ambulance_request_track',
+            },
+        ),
+    ]
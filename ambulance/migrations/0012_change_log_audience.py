@@ -0,0 +1,48 @@
+# Generated by Django 5.2.5 on 2026-10-19 09:16
+
+from django.db import migrations, models
+
+
+def fill_audiences(apps, schema_editor):
+    # Earlier entries did not note who saw the object: take the owner from the
+    # stored request and treat the rest as seen by everyone
+    ChangeLog = apps.get_model('ambulance', 'ChangeLog')
+    AmbulanceRequest = apps.get_model('ambulance', 'AmbulanceRequest')
+    ChangeLog.objects.update(public=True)
+    owners = dict(AmbulanceRequest.objects.values_list('pk', 'patient_id'))
+    entries = ChangeLog.objects.filter(kind='request').only('object_id')
+    for entry in entries.iterator():
+        if entry.object_id in owners:
+            entry.owner_id = owners[entry.object_id]
+            entry.save(update_fields=['owner_id'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ambulance', '0011_request_track'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='changelog',
+            name='assignee_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='changelog',
+            name='owner_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='changelog',
+            name='previous_assignee_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='changelog',
+            name='public',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(fill_audiences, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from django.utils import timezone
 
 
@@ -59,9 +60,27 @@ class AmbulanceRequest(models.Model):
     # Assigned ambulance (optional)
     ambulance = models.ForeignKey('Ambulance', on_delete=models.SET_NULL, null=True, blank=True, related_name='requests')
     
+    # Duplicate-call detection
+    pickup_cell = models.BigIntegerField(null=True, blank=True, editable=False, help_text="Spatial grid cell of the pickup location")
+    duplicate_of = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='duplicates', help_text="Earlier request for the same emergency")
+    
     def __str__(self):
         return f"Request #{self.id} - {self.patient.username} ({self.get_status_display()})"
     
+    def save(self, *args, **kwargs):
+        from .duplicates import cell_for, find_duplicate_of
+        
+        self.pickup_cell = cell_for(self.pickup_latitude, self.pickup_longitude)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'pickup_latitude' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'pickup_cell'}
+        
+        # Link likely duplicates at creation time
+        if self._state.adding and self.duplicate_of_id is None:
+            self.duplicate_of_id = find_duplicate_of(self)
+        
+        super().save(*args, **kwargs)
+    
     def assign_paramedic(self, paramedic):
         """Assign a paramedic to this request"""
         self.paramedic = paramedic
@@ -99,6 +118,9 @@ class AmbulanceRequest(models.Model):
     class Meta:
         db_table = 'ambulance_request'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['pickup_cell', 'created_at'], name='ambulance_req_cell_created'),
+        ]
 
 
 class RequestStatusUpdate(models.Model):
@@ -137,6 +159,8 @@ class Ambulance(models.Model):
     # Current location
     current_latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     current_longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    # Device time of the location stamp; older stamps synced later do not overwrite it
+    location_recorded_at = models.DateTimeField(null=True, blank=True)
     
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='available')
     
@@ -167,3 +191,282 @@ class Ambulance(models.Model):
     class Meta:
         db_table = 'ambulance_vehicle'
         ordering = ['vehicle_number']
+
+
+class GeocodedAddress(models.Model):
+    """Persistent cache of normalized address lookups (null coordinates mean not found, retried after GEOCODER_MISS_TTL)"""
+    
+    normalized_address = models.CharField(max_length=255, unique=True)
+    latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    source = models.CharField(max_length=20, default='gazetteer')
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.normalized_address} ({self.latitude}, {self.longitude})"
+    
+    class Meta:
+        db_table = 'ambulance_geocoded_address'
+
+
+class ArchivedAmbulanceRequest(models.Model):
+    """Closed request moved out of the hot table by ``archive_requests`` (keeps its original id)"""
+    
+    id = models.BigIntegerField(primary_key=True)
+    
+    # Foreign keys are not enforced so archiving never touches the referenced tables
+    patient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_constraint=False, related_name='+')
+    paramedic = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, db_constraint=False, related_name='+')
+    ambulance = models.ForeignKey(Ambulance, on_delete=models.SET_NULL, null=True, blank=True, db_constraint=False, db_index=False, related_name='+')
+    duplicate_of_id = models.BigIntegerField(null=True, blank=True)
+    
+    pickup_address = models.TextField()
+    pickup_latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    pickup_longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    pickup_cell = models.BigIntegerField(null=True, blank=True)
+    
+    destination_address = models.TextField(blank=True, null=True)
+    destination_latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    destination_longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    
+    description = models.TextField()
+    priority = models.CharField(max_length=10, choices=AmbulanceRequest.PRIORITY_CHOICES)
+    status = models.CharField(max_length=20, choices=AmbulanceRequest.STATUS_CHOICES)
+    contact_phone = models.CharField(max_length=15)
+    notes = models.TextField(blank=True, null=True)
+    
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    assigned_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    estimated_arrival_time = models.DateTimeField(null=True, blank=True)
+    actual_arrival_time = models.DateTimeField(null=True, blank=True)
+    
+    archived_at = models.DateTimeField()
+    
+    def __str__(self):
+        return f"Archived request #{self.id} ({self.get_status_display()})"
+    
+    @property
+    def is_active(self):
+        return False
+    
+    class Meta:
+        db_table = 'ambulance_request_archive'
+        ordering = ['-created_at']
+
+
+class ArchivedRequestStatusUpdate(models.Model):
+    """Status history of an archived request"""
+    
+    id = models.BigIntegerField(primary_key=True)
+    request = models.ForeignKey(ArchivedAmbulanceRequest, on_delete=models.CASCADE, related_name='status_updates')
+    updated_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_constraint=False, related_name='+')
+    
+    old_status = models.CharField(max_length=20, choices=AmbulanceRequest.STATUS_CHOICES)
+    new_status = models.CharField(max_length=20, choices=AmbulanceRequest.STATUS_CHOICES)
+    
+    notes = models.TextField(blank=True, null=True)
+    timestamp = models.DateTimeField()
+    
+    def __str__(self):
+        return f"Archived request #{self.request_id}: {self.old_status} → {self.new_status}"
+    
+    class Meta:
+        db_table = 'ambulance_request_status_update_archive'
+        ordering = ['-timestamp']
+
+
+class ChangeLog(models.Model):
+    """One entry per created, updated or deleted request or ambulance; the id is the delta-sync cursor"""
+    
+    KIND_CHOICES = (
+        ('request', 'Ambulance request'),
+        ('ambulance', 'Ambulance'),
+    )
+    
+    ACTION_CHOICES = (
+        ('upsert', 'Created or updated'),
+        ('delete', 'Deleted'),
+    )
+    
+    id = models.BigAutoField(primary_key=True)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES, default='upsert')
+    changed_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    # Who could see the object around the change; see ambulance.changes
+    owner_id = models.BigIntegerField(null=True, blank=True)
+    assignee_id = models.BigIntegerField(null=True, blank=True)
+    previous_assignee_id = models.BigIntegerField(null=True, blank=True)
+    public = models.BooleanField(default=False)
+    
+    def __str__(self):
+        return f"#{self.id} {self.action} {self.kind} {self.object_id}"
+    
+    class Meta:
+        db_table = 'ambulance_change_log'
+        ordering = ['id']
+
+
+class SyncOperation(models.Model):
+    """Offline operation already received from a client; its key makes resending a sync batch harmless"""
+    
+    KIND_CHOICES = (
+        ('status', 'Status transition'),
+        ('location', 'Location stamp'),
+    )
+    
+    OUTCOME_CHOICES = (
+        ('applied', 'Applied'),
+        ('rejected', 'Rejected'),
+        ('superseded', 'Superseded'),
+    )
+    
+    # The (user, key) constraint below doubles as the lookup index
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_index=False, related_name='+')
+    key = models.CharField(max_length=64)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    outcome = models.CharField(max_length=10, choices=OUTCOME_CHOICES)
+    detail = models.CharField(max_length=255, blank=True)
+    recorded_at = models.DateTimeField(help_text="Device time at which the operation was queued")
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    def __str__(self):
+        return f"{self.key} ({self.get_kind_display()}, {self.outcome})"
+    
+    class Meta:
+        db_table = 'ambulance_sync_operation'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='ambulance_sync_user_key'),
+        ]
+
+
+class IdempotencyKey(models.Model):
+    """Key sent with a request-creation POST and the response it got, replayed to retries until it expires"""
+    
+    SCOPE_CHOICES = (
+        ('request_form', 'Request form'),
+        ('request_api', 'Request API'),
+    )
+    
+    # The (user, scope, key) constraint below doubles as the lookup index
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_index=False, related_name='+')
+    scope = models.CharField(max_length=20, choices=SCOPE_CHOICES)
+    key = models.CharField(max_length=64)
+    fingerprint = models.CharField(max_length=64, help_text="SHA-256 of the submitted data")
+    
+    # Empty until the request is created, in the same transaction
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+    
+    def __str__(self):
+        return f"{self.key} ({self.get_scope_display()})"
+    
+    class Meta:
+        db_table = 'ambulance_idempotency_key'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'scope', 'key'], name='ambulance_idempotency_user_key'),
+        ]
+
+
+class RequestTrack(models.Model):
+    """Route driven for a request, stored as a compressed delta-encoded polyline (see ``ambulance.tracks``)"""
+    
+    # A plain id rather than a foreign key, so the track outlives the request's move to the archive
+    request_id = models.BigIntegerField(primary_key=True)
+    polyline = models.BinaryField(default=b'')
+    point_count = models.PositiveIntegerField(default=0)
+    fix_count = models.PositiveIntegerField(default=0, help_text="Fixes received, before simplification")
+    started_at = models.DateTimeField(null=True, blank=True)
+    ended_at = models.DateTimeField(null=True, blank=True)
+    simplified_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Track of request #{self.request_id} ({self.point_count} points)"
+    
+    class Meta:
+        db_table = 'ambulance_request_track'
+
+
+class FullTextField(models.TextField):
+    """Hidden FTS5 column named after its table; supports the ``match`` lookup"""
+
+
+@FullTextField.register_lookup
+class FullTextMatch(models.Lookup):
+    lookup_name = 'match'
+    
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', lhs_params + rhs_params
+
+
+class AmbulanceRequestSearch(models.Model):
+    """Read-only view of the SQLite FTS5 index over request text (kept in sync by triggers)"""
+    
+    request = models.OneToOneField(
+        AmbulanceRequest, on_delete=models.DO_NOTHING, primary_key=True,
+        db_column='rowid', db_constraint=False, related_name='search_index'
+    )
+    document = FullTextField(db_column='ambulance_request_fts')
+    rank = models.FloatField()
+    
+    class Meta:
+        managed = False
+        db_table = 'ambulance_request_fts'
+
+
+class RequestStatusUpdateSearch(models.Model):
+    """Read-only view of the SQLite FTS5 index over status update notes"""
+    
+    status_update = models.OneToOneField(
+        RequestStatusUpdate, on_delete=models.DO_NOTHING, primary_key=True,
+        db_column='rowid', db_constraint=False, related_name='search_index'
+    )
+    document = FullTextField(db_column='ambulance_request_status_update_fts')
+    rank = models.FloatField()
+    
+    class Meta:
+        managed = False
+        db_table = 'ambulance_request_status_update_fts'
+
+
+class AmbulanceRequestLocation(models.Model):
+    """Read-only view of the SQLite R*Tree index over pickup coordinates (kept in sync by triggers)"""
+    
+    request = models.OneToOneField(
+        AmbulanceRequest, on_delete=models.DO_NOTHING, primary_key=True,
+        db_column='id', db_constraint=False, related_name='location_index'
+    )
+    min_lat = models.FloatField()
+    max_lat = models.FloatField()
+    min_lng = models.FloatField()
+    max_lng = models.FloatField()
+    
+    class Meta:
+        managed = False
+        db_table = 'ambulance_request_rtree'
+
+
+class AmbulanceLocation(models.Model):
+    """Read-only view of the SQLite R*Tree index over ambulance positions"""
+    
+    ambulance = models.OneToOneField(
+        Ambulance, on_delete=models.DO_NOTHING, primary_key=True,
+        db_column='id', db_constraint=False, related_name='location_index'
+    )
+    min_lat = models.FloatField()
+    max_lat = models.FloatField()
+    min_lng = models.FloatField()
+    max_lng = models.FloatField()
+    
+    class Meta:
+        managed = False
+        db_table = 'ambulance_vehicle_rtree'
@@ -0,0 +1,95 @@
+"""
+Full-text search over ambulance requests and status update notes.
+
+On SQLite the FTS5 tables created in migration 0005 are queried through the
+unmanaged ``AmbulanceRequestSearch``/``RequestStatusUpdateSearch`` models, so
+a search is an indexed join ranked by bm25. Other database backends fall
+back to ``icontains`` filters.
+"""
+
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+REQUEST_TEXT_FIELDS = ('pickup_address', 'destination_address', 'description', 'notes')
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+def build_match_query(text):
+    """
+    Turn free text into a safe FTS5 query.
+
+    Every word becomes a quoted prefix term and all terms must match, so user
+    input can never be parsed as FTS5 query syntax.
+    """
+    tokens = _TOKEN.findall(text or '')
+    return ' '.join(f'"{token}"*' for token in tokens[:16])
+
+
+def fulltext_available():
+    return connection.vendor == 'sqlite'
+
+
+def search_requests(queryset, text, ranked=True):
+    """Filter an AmbulanceRequest queryset by free text, best matches first"""
+    match = build_match_query(text)
+    if not match:
+        return queryset
+
+    if not fulltext_available():
+        condition = Q()
+        for token in _TOKEN.findall(text):
+            token_condition = Q()
+            for field in REQUEST_TEXT_FIELDS:
+                token_condition |= Q(**{f'{field}__icontains': token})
+            condition &= token_condition
+        return queryset.filter(condition)
+
+    queryset = queryset.filter(search_index__document__match=match)
+    if ranked:
+        queryset = queryset.order_by('search_index__rank', '-created_at')
+    return queryset
+
+
+def matching_request_ids(text):
+    """Subquery of AmbulanceRequest ids matching free text (for OR-combined filters)"""
+    from .models import AmbulanceRequest, AmbulanceRequestSearch
+
+    match = build_match_query(text)
+    if not match:
+        return AmbulanceRequest.objects.none().values('pk')
+    if not fulltext_available():
+        return search_requests(AmbulanceRequest.objects.all(), text).values('pk')
+    return AmbulanceRequestSearch.objects.filter(document__match=match).values('request_id')
+
+
+def search_status_updates(queryset, text, ranked=True):
+    """Filter a RequestStatusUpdate queryset by free text in the notes"""
+    match = build_match_query(text)
+    if not match:
+        return queryset
+
+    if not fulltext_available():
+        condition = Q()
+        for token in _TOKEN.findall(text):
+            condition &= Q(notes__icontains=token)
+        return queryset.filter(condition)
+
+    queryset = queryset.filter(search_index__document__match=match)
+    if ranked:
+        queryset = queryset.order_by('search_index__rank', '-timestamp')
+    return queryset
+
+
+def matching_status_update_ids(text):
+    """Subquery of RequestStatusUpdate ids whose notes match free text"""
+    from .models import RequestStatusUpdate, RequestStatusUpdateSearch
+
+    match = build_match_query(text)
+    if not match:
+        return RequestStatusUpdate.objects.none().values('pk')
+    if not fulltext_available():
+        return search_status_updates(RequestStatusUpdate.objects.all(), text).values('pk')
+    return RequestStatusUpdateSearch.objects.filter(document__match=match).values('status_update_id')
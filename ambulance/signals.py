@@ -0,0 +1,120 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from emergency_ambulance.cache_versions import bump
+from emergency_ambulance.metrics import Counter, Histogram
+from .changes import audience, record, stored_audiences
+from .fleet import fleet
+from .models import Ambulance, AmbulanceRequest, RequestStatusUpdate
+from .tracks import CLOSED_STATUSES, close as close_track
+
+PENDING_BUCKETS = (15, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+
+REQUESTS_CREATED = Counter(
+    'ambulance_requests_created', 'Ambulance requests created by priority', ('priority',))
+STATUS_TRANSITIONS = Counter(
+    'ambulance_request_status_transitions', 'Request status changes', ('old_status', 'new_status'))
+PENDING_SECONDS = Histogram(
+    'ambulance_request_pending_seconds', 'Time a request spent pending before it was picked up or cancelled',
+    ('priority',), buckets=PENDING_BUCKETS)
+
+
+@receiver(post_save, sender=AmbulanceRequest)
+def count_created_request(sender, instance, created, **kwargs):
+    if created:
+        REQUESTS_CREATED.inc(priority=instance.priority)
+
+
+@receiver(post_save, sender=RequestStatusUpdate)
+def record_status_transition(sender, instance, created, **kwargs):
+    if not created:
+        return
+    
+    STATUS_TRANSITIONS.inc(old_status=instance.old_status, new_status=instance.new_status)
+    if instance.old_status == 'pending' and instance.new_status != 'pending':
+        # The request is already cached on the instance by the views that record updates
+        ambulance_request = instance.request
+        waited = (instance.timestamp - ambulance_request.created_at).total_seconds()
+        PENDING_SECONDS.observe(max(waited, 0.0), priority=ambulance_request.priority)
+
+
+@receiver(post_save, sender=RequestStatusUpdate)
+def simplify_closed_track(sender, instance, created, **kwargs):
+    """Simplify the route driven for a request once it is completed or cancelled"""
+    if created and instance.new_status in CLOSED_STATUSES:
+        close_track(instance.request_id)
+
+
+@receiver(post_save, sender=AmbulanceRequest)
+@receiver(post_delete, sender=AmbulanceRequest)
+def bump_request_version(sender, instance, **kwargs):
+    """Invalidate cached dashboard figures and rows built from requests"""
+    bump('requests')
+
+
+@receiver(post_save, sender=Ambulance)
+def write_through_fleet(sender, instance, **kwargs):
+    """Update the fleet registry; it bumps the ambulance counter once the change is committed"""
+    fleet.saved(instance)
+
+
+@receiver(post_delete, sender=Ambulance)
+def remove_from_fleet(sender, instance, **kwargs):
+    fleet.deleted(instance.pk)
+
+
+AUDIENCE_FIELDS = {
+    'request': {'patient', 'patient_id', 'paramedic', 'paramedic_id', 'status'},
+    'ambulance': {'assigned_paramedic', 'assigned_paramedic_id', 'status'},
+}
+
+
+def remember_audience(kind, instance, update_fields):
+    """Keep who could see the stored row, for the change log entry of this save"""
+    if instance._state.adding:
+        return
+    if update_fields is not None and not AUDIENCE_FIELDS[kind] & set(update_fields):
+        return
+    instance._audience_before = stored_audiences(kind, [instance.pk]).get(instance.pk)
+
+
+def log_saved(kind, instance):
+    after = audience(kind, instance)
+    before = getattr(instance, '_audience_before', None) or after
+    instance._audience_before = None
+    record(kind, [instance.pk], before={instance.pk: before}, after={instance.pk: after})
+
+
+def log_deleted(kind, instance):
+    record(kind, [instance.pk], action='delete', after={instance.pk: audience(kind, instance)})
+
+
+@receiver(pre_save, sender=AmbulanceRequest)
+def remember_request_audience(sender, instance, update_fields=None, **kwargs):
+    remember_audience('request', instance, update_fields)
+
+
+@receiver(post_save, sender=AmbulanceRequest)
+def log_request_saved(sender, instance, **kwargs):
+    """Append to the delta-sync change log"""
+    log_saved('request', instance)
+
+
+@receiver(post_delete, sender=AmbulanceRequest)
+def log_request_deleted(sender, instance, **kwargs):
+    log_deleted('request', instance)
+
+
+@receiver(pre_save, sender=Ambulance)
+def remember_ambulance_audience(sender, instance, update_fields=None, **kwargs):
+    remember_audience('ambulance', instance, update_fields)
+
+
+@receiver(post_save, sender=Ambulance)
+def log_ambulance_saved(sender, instance, **kwargs):
+    log_saved('ambulance', instance)
+
+
+@receiver(post_delete, sender=Ambulance)
+def log_ambulance_deleted(sender, instance, **kwargs):
+    log_deleted('ambulance', instance)
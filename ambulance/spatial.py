@@ -0,0 +1,106 @@
+"""
+Radius search over request pickups and ambulance positions.
+
+On SQLite, migration 0010 mirrors the coordinates into R*Tree tables that
+triggers keep in sync, queried through the unmanaged
+``AmbulanceRequestLocation``/``AmbulanceLocation`` models. ``within_radius``
+first takes the candidates inside the search circle's bounding box from the
+index, then keeps those within the exact haversine distance and orders them
+nearest first, annotated with ``distance_km``. Other database backends
+prefilter with range conditions on the coordinate columns instead.
+"""
+
+import math
+
+from django.db import connection
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import ASin, Cast, Cos, Power, Radians, Sin, Sqrt
+
+from .duplicates import EARTH_RADIUS_M
+from .models import Ambulance, AmbulanceLocation, AmbulanceRequest, AmbulanceRequestLocation
+
+EARTH_RADIUS_KM = EARTH_RADIUS_M / 1000
+
+# model -> (R*Tree index model, latitude field, longitude field)
+INDEXED = {
+    AmbulanceRequest: (AmbulanceRequestLocation, 'pickup_latitude', 'pickup_longitude'),
+    Ambulance: (AmbulanceLocation, 'current_latitude', 'current_longitude'),
+}
+
+
+def spatial_index_available():
+    return connection.vendor == 'sqlite'
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """
+    (min_lat, max_lat, longitude ranges) enclosing the circle. A circle
+    crossing the antimeridian gets two longitude ranges and one reaching a
+    pole spans every longitude.
+    """
+    angle = radius_km / EARTH_RADIUS_KM
+    delta_lat = math.degrees(angle)
+    min_lat, max_lat = latitude - delta_lat, latitude + delta_lat
+    if min_lat <= -90 or max_lat >= 90:
+        return max(min_lat, -90), min(max_lat, 90), [(-180, 180)]
+
+    # Widest longitude offset of a small circle, reached north of the centre's parallel
+    delta_lng = math.degrees(math.asin(math.sin(angle) / math.cos(math.radians(latitude))))
+    min_lng, max_lng = longitude - delta_lng, longitude + delta_lng
+    if min_lng < -180:
+        ranges = [(min_lng + 360, 180), (-180, max_lng)]
+    elif max_lng > 180:
+        ranges = [(min_lng, 180), (-180, max_lng - 360)]
+    else:
+        ranges = [(min_lng, max_lng)]
+    return min_lat, max_lat, ranges
+
+
+def haversine_km(latitude_field, longitude_field, latitude, longitude):
+    """Expression for the great-circle distance in km from a point to a row's coordinates"""
+    phi = Radians(Cast(F(latitude_field), FloatField()))
+    lam = Radians(Cast(F(longitude_field), FloatField()))
+    phi0, lam0 = math.radians(latitude), math.radians(longitude)
+    a = (Power(Sin((phi - Value(phi0)) / 2), 2) +
+         Value(math.cos(phi0)) * Cos(phi) * Power(Sin((lam - Value(lam0)) / 2), 2))
+    return Value(2 * EARTH_RADIUS_KM) * ASin(Sqrt(a))
+
+
+def within_radius(queryset, latitude, longitude, radius_km):
+    """Filter a request or ambulance queryset to a circle, nearest first, with ``distance_km``"""
+    index_model, latitude_field, longitude_field = INDEXED[queryset.model]
+    min_lat, max_lat, lng_ranges = bounding_box(latitude, longitude, radius_km)
+
+    if spatial_index_available():
+        # Boxes hold 32-bit floats rounded outwards, so the box test never drops a point inside it
+        in_box = Q()
+        for min_lng, max_lng in lng_ranges:
+            in_box |= Q(max_lng__gte=min_lng, min_lng__lte=max_lng)
+        candidates = index_model.objects.filter(in_box, max_lat__gte=min_lat, min_lat__lte=max_lat)
+        queryset = queryset.filter(pk__in=candidates.values('pk'))
+    else:
+        in_box = Q()
+        for min_lng, max_lng in lng_ranges:
+            in_box |= Q(**{f'{longitude_field}__range': (min_lng, max_lng)})
+        queryset = queryset.filter(in_box, **{f'{latitude_field}__range': (min_lat, max_lat)})
+
+    return queryset.annotate(
+        distance_km=haversine_km(latitude_field, longitude_field, latitude, longitude)
+    ).filter(distance_km__lte=radius_km).order_by('distance_km', 'pk')
+
+
+def rebuild_index(model):
+    """Refill a model's R*Tree from its table, e.g. after a bulk load with the triggers dropped"""
+    if model not in INDEXED or not spatial_index_available():
+        return
+    index_model, latitude_field, longitude_field = INDEXED[model]
+    quote = connection.ops.quote_name
+    index = quote(index_model._meta.db_table)
+    latitude = quote(model._meta.get_field(latitude_field).column)
+    longitude = quote(model._meta.get_field(longitude_field).column)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {index}')
+        cursor.execute(
+            f'INSERT INTO {index} SELECT id, {latitude}, {latitude}, {longitude}, {longitude} '
+            f'FROM {quote(model._meta.db_table)} WHERE {latitude} IS NOT NULL AND {longitude} IS NOT NULL'
+        )
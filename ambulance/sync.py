@@ -0,0 +1,165 @@
+"""
+Offline sync of paramedic status transitions and location stamps.
+
+A paramedic's app queues operations while out of signal and sends the whole
+queue once it reconnects, resending it until a response arrives. Every
+operation carries a client-generated key. ``apply_operations`` looks the
+batch's keys up in ``ambulance_sync_operation`` with one indexed query,
+applies the operations it has not seen in the order they were queued and
+records their outcomes, all in one transaction: a retried batch is answered
+from the recorded outcomes and changes nothing twice. When two copies of a
+batch arrive at once, the one that records its keys second fails on the
+unique key, rolls back and runs again against the outcomes the first one
+committed.
+
+Transitions are checked against the request as it is now, so one that a
+dispatcher overtook while the paramedic was offline (the request was
+cancelled, say) is rejected rather than forced through. Arrival, completion
+and assignment times and the status history are dated by the device clock.
+Only the newest location stamp is written to the ambulance; older ones in
+the batch, or older than what is stored, are superseded. Every new stamp is added to the track of
+the request it was taken for (``ambulance.tracks``).
+"""
+
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Ambulance, AmbulanceRequest, RequestStatusUpdate, SyncOperation
+from .tracks import record_fixes
+
+
+def apply_transition(user, operation):
+    """Apply one queued status change; returns (outcome, detail)"""
+    ambulance_request = AmbulanceRequest.objects.filter(pk=operation['request']).first()
+    if ambulance_request is None:
+        return 'rejected', 'Request not found.'
+    if not ambulance_request.is_active:
+        return 'rejected', f'Request is already {ambulance_request.get_status_display().lower()}.'
+
+    new_status = operation['status']
+    if ambulance_request.status == new_status:
+        return 'rejected', 'Request is already in this status.'
+
+    accepting = ambulance_request.status == 'pending' and new_status == 'assigned' and user.is_paramedic()
+    if not (accepting or user.is_admin_user() or
+            (user.is_paramedic() and ambulance_request.paramedic_id == user.pk)):
+        return 'rejected', 'Permission denied'
+
+    # Stamps from a fast device clock must not land in the future
+    recorded_at = min(operation['recorded_at'], timezone.now())
+    old_status = ambulance_request.status
+    ambulance_request.status = new_status
+    if accepting:
+        ambulance_request.paramedic = user
+        ambulance_request.assigned_at = recorded_at
+    elif new_status == 'arrived':
+        ambulance_request.actual_arrival_time = recorded_at
+    elif new_status == 'completed':
+        ambulance_request.completed_at = recorded_at
+    ambulance_request.save()
+
+    # Create status update record
+    status_update = RequestStatusUpdate.objects.create(
+        request=ambulance_request,
+        updated_by=user,
+        old_status=old_status,
+        new_status=new_status,
+        notes=operation.get('notes') or f'Offline update recorded at {recorded_at:%Y-%m-%d %H:%M:%S}'
+    )
+    # The history is dated by the device too (timestamp is auto_now_add), so it lines up with the GPS track
+    RequestStatusUpdate.objects.filter(pk=status_update.pk).update(timestamp=recorded_at)
+    return 'applied', ''
+
+
+def apply_location(user, operation):
+    """Store a location stamp on the user's ambulance unless a newer one is there"""
+    ambulance = Ambulance.objects.filter(assigned_paramedic=user).first()
+    if ambulance is None:
+        return 'rejected', 'No ambulance is assigned to you.'
+
+    recorded_at = min(operation['recorded_at'], timezone.now())
+    if ambulance.location_recorded_at and ambulance.location_recorded_at >= recorded_at:
+        return 'superseded', 'A newer location is already stored.'
+    ambulance.current_latitude = Decimal(f"{operation['latitude']:.6f}")
+    ambulance.current_longitude = Decimal(f"{operation['longitude']:.6f}")
+    ambulance.location_recorded_at = recorded_at
+    ambulance.save(update_fields=['current_latitude', 'current_longitude', 'location_recorded_at', 'updated_at'])
+    return 'applied', ''
+
+
+APPLY = {
+    'status': apply_transition,
+    'location': apply_location,
+}
+
+
+def recorded_outcomes(user, keys):
+    """Outcomes already recorded for the user's keys, by key"""
+    return {
+        row['key']: row for row in
+        SyncOperation.objects.filter(user=user, key__in=keys).values('key', 'outcome', 'detail')
+    }
+
+
+def apply_operations(user, operations):
+    """
+    Apply a queue of validated operations in order, in one transaction.
+
+    Returns one result per operation: its key, outcome, detail and whether
+    the key had been seen before (the outcome is then the recorded one).
+    """
+    try:
+        return _apply_operations(user, operations)
+    except IntegrityError:
+        # A concurrent copy of the batch recorded some of these keys first; answer them from its outcomes
+        return _apply_operations(user, operations)
+
+
+def _apply_operations(user, operations):
+    keys = [operation['key'] for operation in operations]
+    with transaction.atomic():
+        seen = recorded_outcomes(user, keys)
+
+        # Only the newest new location stamp can win, so the others are not written at all
+        locations = {}
+        for operation in operations:
+            if operation['type'] == 'location' and operation['key'] not in seen:
+                locations.setdefault(operation['key'], operation)
+        newest_location = max(locations.values(), key=lambda operation: operation['recorded_at'], default=None)
+
+        results = []
+        recorded = []
+        for operation in operations:
+            key = operation['key']
+            if key in seen:
+                results.append(dict(seen[key], duplicate=True))
+                continue
+
+            if operation['type'] == 'location' and operation is not newest_location:
+                outcome, detail = 'superseded', 'A newer location was sent in the same batch.'
+            else:
+                outcome, detail = APPLY[operation['type']](user, operation)
+            seen[key] = {'key': key, 'outcome': outcome, 'detail': detail}
+            results.append(dict(seen[key], duplicate=False))
+            recorded.append(SyncOperation(
+                user=user, key=key, kind=operation['type'], outcome=outcome, detail=detail,
+                recorded_at=operation['recorded_at'],
+            ))
+        SyncOperation.objects.bulk_create(recorded)
+
+        # Superseded stamps still belong on the route; filed after the transitions set the request times
+        now = timezone.now()
+        record_fixes(user, [
+            (min(operation['recorded_at'], now), operation['latitude'], operation['longitude'])
+            for operation in locations.values()
+        ])
+    return results
+
+
+def prune(days):
+    """Forget keys received more than days ago; a batch resent after that would be applied again"""
+    cutoff = timezone.now() - timezone.timedelta(days=days)
+    deleted, _ = SyncOperation.objects.filter(created_at__lt=cutoff).delete()
+    return deleted
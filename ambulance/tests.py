@@ -1,3 +1,257 @@
-from django.test import TestCase
+import datetime
+import io
+import os
+import shutil
+import tempfile
+import threading
+from decimal import Decimal
 
-# Create your tests here.
+import numpy as np
+
+from django.contrib.auth.models import update_last_login
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from accounts.models import User
+from api.authentication import issue_token
+from . import columnar, geocoding
+from .changes import current_cursor
+from .fleet import fleet
+from .models import Ambulance, AmbulanceRequest, GeocodedAddress, IdempotencyKey
+
+
+def make_request(patient, **fields):
+    values = {
+        'pickup_address': '1 Main Street', 'destination_address': 'City General Hospital',
+        'description': 'chest pain', 'priority': 'high', 'contact_phone': '555-0100',
+    }
+    values.update(fields)
+    return AmbulanceRequest.objects.create(patient=patient, **values)
+
+
+class GeocodingTests(TestCase):
+
+    def setUp(self):
+        self.gazetteer = tempfile.NamedTemporaryFile('w', suffix='.tsv', delete=False)
+        self.gazetteer.close()
+        self.addCleanup(os.unlink, self.gazetteer.name)
+        self.write_gazetteer(
+            'Main Street Springfield\t40.100000\t-74.100000',
+            'North Main Street\t40.200000\t-74.200000',
+            'Oak Avenue Springfield\t40.300000\t-74.300000',
+            'Oak Avenue Shelbyville\t40.400000\t-74.400000',
+        )
+        overrider = override_settings(GEOCODER_GAZETTEER_PATH=self.gazetteer.name)
+        overrider.enable()
+        self.addCleanup(overrider.disable)
+        geocoding.clear_caches()
+        self.addCleanup(geocoding.clear_caches)
+
+    def write_gazetteer(self, *lines):
+        with open(self.gazetteer.name, 'w', encoding='utf-8') as handle:
+            handle.write('\n'.join(lines) + '\n')
+
+    def test_exact_and_whole_token_matches(self):
+        self.assertEqual(geocoding.geocode('North Main St.'), (Decimal('40.2'), Decimal('-74.2')))
+        # The only entry continuing the address with whole tokens
+        self.assertEqual(geocoding.geocode('12 Main St'), (Decimal('40.1'), Decimal('-74.1')))
+
+    def test_no_guessing(self):
+        # Partial token, ambiguous town, or a different street with the same ending
+        self.assertIsNone(geocoding.geocode('Main Str'))
+        self.assertIsNone(geocoding.geocode('Oak Avenue'))
+        self.assertIsNone(geocoding.geocode('South Main Street Springfield'))
+
+    def test_misses_expire(self):
+        self.assertIsNone(geocoding.geocode('5 Elm Street'))
+        self.assertTrue(GeocodedAddress.objects.filter(normalized_address='5 elm street', latitude=None).exists())
+
+        self.write_gazetteer('Elm Street\t40.500000\t-74.500000')
+        geocoding.get_gazetteer.cache_clear()
+        self.assertIsNone(geocoding.geocode('5 Elm Street'))
+
+        GeocodedAddress.objects.update(created_at=timezone.now() - datetime.timedelta(days=2))
+        self.assertEqual(geocoding.geocode('5 Elm Street'), (Decimal('40.5'), Decimal('-74.5')))
+        self.assertEqual(GeocodedAddress.objects.get(normalized_address='5 elm street').latitude, Decimal('40.5'))
+
+    def test_backfill_reaches_delta_sync_clients(self):
+        patient = User.objects.create_user('patient', password='secret-pass', role='patient')
+        first = make_request(patient, pickup_address='Main Street Springfield')
+        second = make_request(patient, pickup_address='Main Street, Springfield')
+        since = current_cursor()
+
+        call_command('geocode_backfill', stdout=io.StringIO())
+
+        updated_at = second.updated_at
+        second.refresh_from_db()
+        self.assertEqual(second.duplicate_of_id, first.pk)
+        self.assertGreater(second.updated_at, updated_at)
+        client = APIClient(HTTP_AUTHORIZATION=f'Bearer {issue_token(patient)[0]}')
+        data = client.get('/api/v1/changes/', {'since': since}).json()
+        rows = {row['id']: row for row in data['requests']}
+        self.assertEqual(set(rows), {first.pk, second.pk})
+        self.assertEqual(rows[first.pk]['pickup_latitude'], '40.100000')
+
+    def test_backfill_reload_forgets_misses(self):
+        self.assertIsNone(geocoding.geocode('Elm Street'))
+        self.write_gazetteer('Elm Street\t40.500000\t-74.500000')
+        call_command('geocode_backfill', reload=True, stdout=io.StringIO())
+        self.assertFalse(GeocodedAddress.objects.filter(latitude=None).exists())
+        self.assertEqual(geocoding.geocode('Elm Street'), (Decimal('40.5'), Decimal('-74.5')))
+
+
+class RequestFormResubmitTests(TestCase):
+
+    def setUp(self):
+        self.patient = User.objects.create_user('patient', password='secret-pass', role='patient')
+        self.client.force_login(self.patient)
+        self.data = {
+            'pickup_address': '1 Main Street', 'destination_address': 'City General Hospital',
+            'description': 'chest pain', 'priority': 'high', 'contact_phone': '555-0100',
+            'idempotency_key': 'form-token-1',
+        }
+
+    def submit(self, **changes):
+        return self.client.post('/ambulance/request/create/', dict(self.data, **changes))
+
+    def test_resubmitted_form_goes_to_the_same_request(self):
+        first = self.submit()
+        second = self.submit()
+        self.assertEqual(AmbulanceRequest.objects.count(), 1)
+        self.assertEqual(second.status_code, 302)
+        self.assertEqual(second['Location'], first['Location'])
+
+    def test_edited_resubmission_is_not_dropped(self):
+        self.submit()
+        response = self.submit(description='chest pain, now unconscious')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(AmbulanceRequest.objects.count(), 1)
+        self.assertContains(response, 'your changes were not saved')
+        fresh_key = response.context['form']['idempotency_key'].value()
+        self.assertNotEqual(fresh_key, 'form-token-1')
+
+        # Sending it again files the edited request
+        self.submit(description='chest pain, now unconscious', idempotency_key=fresh_key)
+        self.assertEqual(
+            list(AmbulanceRequest.objects.order_by('pk').values_list('description', flat=True)),
+            ['chest pain', 'chest pain, now unconscious'],
+        )
+        self.assertEqual(IdempotencyKey.objects.count(), 2)
+
+
+class FleetRegistryTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.medic = User.objects.create_user('medic', password='secret-pass', role='paramedic', first_name='Ann')
+        Ambulance.objects.create(vehicle_number='A-1', license_plate='AMB-001', assigned_paramedic=self.medic)
+        fleet.load()
+
+    def test_login_keeps_the_snapshot(self):
+        update_last_login(None, self.medic)
+        User.objects.create_user('patient', password='secret-pass', role='patient')
+        with self.assertNumQueries(0):
+            self.assertEqual(len(fleet.entries()), 1)
+
+    def test_paramedic_change_reloads(self):
+        self.medic.first_name = 'Anne'
+        self.medic.save()
+        self.assertEqual(fleet.for_paramedic(self.medic.pk).assigned_paramedic.first_name, 'Anne')
+
+
+class AdminSearchTests(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('root', password='secret-pass', role='admin')
+        self.patient = User.objects.create_user('kowalczyk', password='secret-pass', role='patient')
+        self.other = User.objects.create_user('mary', password='secret-pass', role='patient')
+        self.by_username = make_request(self.patient, description='fell down the stairs')
+        self.by_text = make_request(self.other, description='chest pain, jonathan called it in')
+        make_request(self.other, description='broken arm')
+        self.client.force_login(self.admin)
+
+    def search(self, term):
+        response = self.client.get('/admin/ambulance/ambulancerequest/', {'q': term})
+        self.assertEqual(response.status_code, 200)
+        return {row.pk for row in response.context['cl'].result_list}
+
+    def test_username_prefix_and_full_text(self):
+        self.assertEqual(self.search('kowal'), {self.by_username.pk})
+        self.assertEqual(self.search('jonathan'), {self.by_text.pk})
+        self.assertEqual(self.search('stairs'), {self.by_username.pk})
+
+
+class ColumnarHistoryTests(TestCase):
+
+    def test_totals_match_whole_history_figures(self):
+        rng = np.random.default_rng(7)
+        store = columnar.ColumnarStore(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, store.path)
+        next_id = 1
+        for day in (datetime.date(2023, 12, 31), datetime.date(2024, 1, 1), datetime.date(2024, 6, 1)):
+            rows = []
+            created = int(datetime.datetime(day.year, day.month, day.day, tzinfo=datetime.timezone.utc).timestamp())
+            for _ in range(300):
+                status = columnar.STATUS_CODES[rng.choice(['completed', 'cancelled'])]
+                assign = float(rng.exponential(300))
+                rows.append((next_id, created, status, int(rng.integers(0, 4)), 40.7, -74.0,
+                             assign, assign + 600, assign + float(rng.exponential(1800))))
+                next_id += 1
+            store.append(day, rows)
+
+        totals = columnar.HistoryTotals()
+        for day, arrays in store.scan(totals.columns):
+            totals.add(day, arrays)
+
+        whole = {name: np.concatenate([arrays[name] for _, arrays in store.scan([name])]) for name in totals.columns}
+        self.assertEqual(totals.yearly, {2023: 300, 2024: 600})
+        self.assertEqual(sum(totals.status_counts().values()), 900)
+        for column in totals.durations:
+            stats = totals.duration_stats(column)
+            for priority, rank in columnar.PRIORITY_RANKS.items():
+                mask = (whole['status'] == columnar.STATUS_CODES['completed']) & (whole['priority'] == rank)
+                values = whole[column][mask]
+                self.assertEqual(stats[priority]['count'], len(values))
+                self.assertAlmostEqual(stats[priority]['mean'], float(values.mean()) / 60, delta=0.051)
+                # Histogram bins are 0.1 minute wide
+                self.assertAlmostEqual(stats[priority]['median'], float(np.median(values)) / 60, delta=0.11)
+                self.assertAlmostEqual(stats[priority]['p90'], float(np.percentile(values, 90)) / 60, delta=0.11)
+
+    def test_scans_never_see_a_partition_half_swapped(self):
+        store = columnar.ColumnarStore(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, store.path)
+        day = datetime.date(2024, 1, 1)
+        created = int(datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc).timestamp())
+
+        def row(pk):
+            return (pk, created + pk, columnar.STATUS_CODES['completed'], 1, 40.7, -74.0, 60.0, 600.0, 900.0)
+
+        store.append(day, [row(1)])
+        stop = threading.Event()
+        seen, errors = [], []
+
+        def scan():
+            while not stop.is_set():
+                try:
+                    for _, arrays in store.scan(['id', 'status']):
+                        self.assertEqual(len(arrays['id']), len(arrays['status']))
+                        seen.append(len(arrays['id']))
+                except Exception as error:
+                    errors.append(error)
+
+        reader = threading.Thread(target=scan)
+        reader.start()
+        try:
+            for pk in range(2, 200):
+                store.append(day, [row(pk)])
+        finally:
+            stop.set()
+            reader.join()
+        self.assertEqual(errors, [])
+        self.assertTrue(seen)
+        self.assertEqual(len(store.load(day, ['id'])['id']), 199)
+        # Only the current version is left next to the partition link
+        self.assertEqual(len(list(store.partition_path(day).parent.iterdir())), 2)
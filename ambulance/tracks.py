@@ -0,0 +1,255 @@
+"""
+GPS tracks of ambulance trips.
+
+Location stamps from a paramedic's app (offline sync) are filed under the
+request the paramedic was assigned to when each fix was taken. A request's
+whole track is one ``ambulance_request_track`` row: fixes are quantised to
+whole seconds and 1e-5 degrees (about a metre), delta-encoded against the
+previous fix as zigzag varints and zlib-compressed, a few bytes per fix
+instead of a table row each.
+
+Once the request is closed its track is simplified with Douglas-Peucker:
+fixes closer than ``TRACK_SIMPLIFY_TOLERANCE_METERS`` to the line through
+their neighbours are dropped. The ``simplify_tracks`` command catches
+requests closed some other way, such as a ``QuerySet.update()``.
+
+``replay`` merges a track with the request's status history for the replay
+endpoint.
+"""
+
+import math
+import zlib
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .duplicates import EARTH_RADIUS_M
+from .models import AmbulanceRequest, ArchivedAmbulanceRequest, RequestTrack
+
+FORMAT_VERSION = 1
+
+# Coordinates are stored as integers of 1e-5 degrees
+SCALE = 10 ** 5
+
+ACTIVE_STATUSES = ('assigned', 'en_route', 'arrived')
+CLOSED_STATUSES = ('completed', 'cancelled')
+
+
+def encode(points):
+    """Compress (epoch seconds, latitude, longitude) points, oldest first, into a polyline blob"""
+    data = bytearray()
+    previous = (0, 0, 0)
+    for timestamp, latitude, longitude in points:
+        values = (int(timestamp), round(latitude * SCALE), round(longitude * SCALE))
+        for value, last in zip(values, previous):
+            delta = value - last
+            # Zigzag: small negative deltas stay small
+            number = delta << 1 if delta >= 0 else (~delta << 1) | 1
+            while number >= 0x80:
+                data.append(number & 0x7f | 0x80)
+                number >>= 7
+            data.append(number)
+        previous = values
+    return bytes([FORMAT_VERSION]) + zlib.compress(bytes(data), 9)
+
+
+def decode(blob):
+    """Points of a polyline blob as (epoch seconds, latitude, longitude)"""
+    if not blob:
+        return []
+    blob = bytes(blob)
+    if blob[0] != FORMAT_VERSION:
+        raise ValueError(f'Unknown track format {blob[0]}')
+
+    data = zlib.decompress(blob[1:])
+    points = []
+    values = [0, 0, 0]
+    field = number = shift = 0
+    for byte in data:
+        number |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        values[field] += number >> 1 if not number & 1 else ~(number >> 1)
+        number = shift = 0
+        field += 1
+        if field == 3:
+            points.append((values[0], values[1] / SCALE, values[2] / SCALE))
+            field = 0
+    return points
+
+
+def _projection(points):
+    """Metres per degree of longitude and latitude around a track (equirectangular, enough for one trip)"""
+    metres_per_degree = math.pi * EARTH_RADIUS_M / 180
+    return metres_per_degree * math.cos(math.radians(points[0][1])), metres_per_degree
+
+
+def simplify(points, tolerance_m):
+    """Douglas-Peucker: the points the track cannot lose without straying more than tolerance_m"""
+    if len(points) < 3:
+        return list(points)
+    x_scale, y_scale = _projection(points)
+    xy = [(longitude * x_scale, latitude * y_scale) for _, latitude, longitude in points]
+
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        (x1, y1), (x2, y2) = xy[first], xy[last]
+        dx, dy = x2 - x1, y2 - y1
+        length_sq = dx * dx + dy * dy
+        farthest, index = 0.0, None
+        for i in range(first + 1, last):
+            px, py = xy[i]
+            # Distance to the segment rather than the line, so doubling back is kept
+            t = 0.0 if length_sq == 0 else max(0.0, min(1.0, ((px - x1) * dx + (py - y1) * dy) / length_sq))
+            distance = math.hypot(px - x1 - t * dx, py - y1 - t * dy)
+            if distance > farthest:
+                farthest, index = distance, i
+        if index is not None and farthest > tolerance_m:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+def path_length_m(points):
+    if len(points) < 2:
+        return 0.0
+    x_scale, y_scale = _projection(points)
+    return sum(
+        math.hypot((b[2] - a[2]) * x_scale, (b[1] - a[1]) * y_scale)
+        for a, b in zip(points, points[1:])
+    )
+
+
+def _datetime(timestamp):
+    return datetime.fromtimestamp(timestamp, tz=dt_timezone.utc)
+
+
+def _tolerance():
+    return getattr(settings, 'TRACK_SIMPLIFY_TOLERANCE_METERS', 10)
+
+
+def _store(track, points, simplified):
+    if simplified:
+        points = simplify(points, _tolerance())
+        track.simplified_at = timezone.now()
+    track.polyline = encode(points)
+    track.point_count = len(points)
+    track.started_at = _datetime(points[0][0]) if points else None
+    track.ended_at = _datetime(points[-1][0]) if points else None
+    track.save()
+
+
+def append(request_id, fixes, closed=False):
+    """Merge fixes into a request's track, simplifying it if the request is closed"""
+    with transaction.atomic():
+        track, _ = RequestTrack.objects.select_for_update().get_or_create(pk=request_id)
+        # One point per second; a fix already stored for that second wins
+        points = {point[0]: point for point in reversed(fixes)}
+        points.update((point[0], point) for point in decode(track.polyline))
+        track.fix_count += len(fixes)
+        _store(track, sorted(points.values()), closed)
+    return track
+
+
+def record_fixes(paramedic, fixes):
+    """
+    File a paramedic's (datetime, latitude, longitude) fixes under the
+    requests they were assigned to when each fix was taken.
+    """
+    if not fixes:
+        return
+    earliest = min(fix[0] for fix in fixes)
+    latest = max(fix[0] for fix in fixes)
+    # Active requests, and closed ones that were still open at the earliest fix
+    candidates = AmbulanceRequest.objects.filter(
+        Q(status__in=ACTIVE_STATUSES) | Q(status__in=CLOSED_STATUSES, updated_at__gte=earliest),
+        paramedic=paramedic, assigned_at__lte=latest,
+    ).order_by('-assigned_at').values_list('pk', 'status', 'assigned_at', 'completed_at', 'updated_at')
+    candidates = list(candidates)
+
+    by_request = {}
+    for recorded_at, latitude, longitude in fixes:
+        for pk, status, assigned_at, completed_at, updated_at in candidates:
+            ended_at = (completed_at or updated_at) if status in CLOSED_STATUSES else None
+            if assigned_at <= recorded_at and (ended_at is None or recorded_at <= ended_at):
+                by_request.setdefault((pk, status in CLOSED_STATUSES), []).append(
+                    (int(recorded_at.timestamp()), latitude, longitude)
+                )
+                break
+    for (pk, closed), request_fixes in by_request.items():
+        append(pk, request_fixes, closed=closed)
+
+
+def close(request_id):
+    """Simplify the track of a request that has just been closed"""
+    with transaction.atomic():
+        track = RequestTrack.objects.select_for_update().filter(pk=request_id, simplified_at__isnull=True).first()
+        if track is not None:
+            _store(track, decode(track.polyline), simplified=True)
+    return track
+
+
+def unsimplified_closed_tracks():
+    """Ids of tracks not yet simplified whose request is closed or archived"""
+    ids = set(RequestTrack.objects.filter(simplified_at__isnull=True).values_list('pk', flat=True))
+    closed = set(
+        AmbulanceRequest.objects.filter(pk__in=ids, status__in=CLOSED_STATUSES).values_list('pk', flat=True)
+    )
+    closed |= set(ArchivedAmbulanceRequest.objects.filter(pk__in=ids).values_list('pk', flat=True))
+    return sorted(closed)
+
+
+def replay(ambulance_request):
+    """A request's track merged with its status history, oldest first"""
+    track = RequestTrack.objects.filter(pk=ambulance_request.pk).first()
+    points = decode(track.polyline) if track else []
+    updates = list(ambulance_request.status_updates.select_related('updated_by').order_by('timestamp', 'pk'))
+
+    events = [
+        (update.timestamp, 0, {
+            'type': 'status',
+            'at': update.timestamp,
+            'old_status': update.old_status,
+            'new_status': update.new_status,
+            'updated_by': update.updated_by.username,
+            'notes': update.notes,
+        })
+        for update in updates
+    ]
+    events += [
+        (_datetime(timestamp), 1, {'type': 'fix', 'at': _datetime(timestamp), 'latitude': latitude,
+                                   'longitude': longitude})
+        for timestamp, latitude, longitude in points
+    ]
+    # Status changes sort before fixes of the same second; each fix carries the status it was taken in
+    events.sort(key=lambda event: event[:2])
+    status = updates[0].old_status if updates else ambulance_request.status
+    timeline = []
+    for _, _, event in events:
+        if event['type'] == 'status':
+            status = event['new_status']
+        else:
+            event['status'] = status
+        timeline.append(event)
+
+    return {
+        'request': ambulance_request.pk,
+        'status': ambulance_request.status,
+        'track': {
+            'points': len(points),
+            'fixes': track.fix_count if track else 0,
+            'simplified': bool(track and track.simplified_at),
+            'started_at': track.started_at if track else None,
+            'ended_at': track.ended_at if track else None,
+            'distance_km': round(path_length_m(points) / 1000, 3),
+        },
+        'timeline': timeline,
+    }
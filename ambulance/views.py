@@ -1,32 +1,72 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
 from django.core.paginator import Paginator
+from django.db import IntegrityError, transaction
 from django.db.models import Q, Count
 from django.utils import timezone
 from django.contrib.auth import get_user_model
 from accounts.decorators import patient_required, paramedic_required, admin_required, staff_required
+from emergency_ambulance.ratelimit import rate_limit
 from .models import AmbulanceRequest, RequestStatusUpdate, Ambulance
 from .forms import AmbulanceRequestForm, RequestStatusUpdateForm, AssignParamedicForm, AmbulanceForm, RequestFilterForm
+from .archive import get_request, is_archived
+from .geocoding import schedule_geocode
+from .idempotency import MAX_KEY_LENGTH, claim, complete, fingerprint, lookup
+from .search import search_requests
 
 User = get_user_model()
 
 
 @login_required
 @patient_required
+@rate_limit('emergency', methods=('POST',))
 def create_request(request):
     """Create new ambulance request (Patient only)"""
     if request.method == 'POST':
         form = AmbulanceRequestForm(request.POST)
-        if form.is_valid():
-            ambulance_request = form.save(commit=False)
-            ambulance_request.patient = request.user
-            ambulance_request.save()
-            
-            messages.success(request, 'Your ambulance request has been submitted successfully!')
-            return redirect('ambulance:request_detail', pk=ambulance_request.pk)
+        
+        # A resubmitted form (double tap, reload, retry) goes to the request it already created
+        key = request.POST.get('idempotency_key', '')[:MAX_KEY_LENGTH]
+        replay = lookup(request.user, 'request_form', key) if key else None
+        if replay is None and form.is_valid():
+            data_fingerprint = fingerprint(form.cleaned_data)
+            try:
+                with transaction.atomic():
+                    entry = claim(request.user, 'request_form', key, data_fingerprint) if key else None
+                    ambulance_request = form.save(commit=False)
+                    ambulance_request.patient = request.user
+                    ambulance_request.save()
+                    
+                    # Fill in missing coordinates in the background
+                    schedule_geocode(ambulance_request)
+                    
+                    location = reverse('ambulance:request_detail', args=[ambulance_request.pk])
+                    if entry:
+                        complete(entry, 302, {'location': location})
+            except IntegrityError:
+                # Another copy of this submission committed first
+                replay = lookup(request.user, 'request_form', key) if key else None
+                if replay is None:
+                    raise
+            else:
+                messages.success(request, 'Your ambulance request has been submitted successfully!')
+                return redirect(location)
+        
+        if replay is not None:
+            if form.is_valid() and replay.fingerprint == fingerprint(form.cleaned_data):
+                messages.info(request, 'This request was already submitted.')
+                return redirect(replay.response_body['location'])
+            # Edited after it was sent (e.g. through the back button): file it only if sent again
+            messages.warning(
+                request,
+                'This form was already submitted and your changes were not saved. '
+                'Submit it again to file them as a new request.'
+            )
+            form = form.with_fresh_key()
     else:
         form = AmbulanceRequestForm()
     
@@ -36,7 +76,9 @@ def create_request(request):
 @login_required
 def request_detail(request, pk):
     """View ambulance request details"""
-    ambulance_request = get_object_or_404(AmbulanceRequest, pk=pk)
+    # Closed requests may have been moved to the archive
+    ambulance_request = get_request(pk)
+    archived = is_archived(ambulance_request)
     
     # Check permissions
     if request.user.is_patient() and ambulance_request.patient != request.user:
@@ -52,15 +94,20 @@ def request_detail(request, pk):
     context = {
         'request': ambulance_request,
         'status_updates': status_updates,
+        'archived': archived,
     }
     
+    # Duplicate-call cluster (staff only)
+    if not request.user.is_patient() and not archived:
+        context['duplicates'] = ambulance_request.duplicates.only('id', 'status', 'created_at').order_by('created_at')
+    
     return render(request, 'ambulance/request_detail.html', context)
 
 
 @login_required
 def request_list(request):
     """List ambulance requests with filtering"""
-    requests = AmbulanceRequest.objects.all()
+    requests = AmbulanceRequest.objects.select_related('patient', 'paramedic')
     
     # Filter based on user role
     if request.user.is_patient():
@@ -71,8 +118,10 @@ def request_list(request):
         )
     
     # Apply filters
+    search_query = ''
     filter_form = RequestFilterForm(request.GET, user=request.user)
     if filter_form.is_valid():
+        search_query = filter_form.cleaned_data['q']
         if filter_form.cleaned_data['status']:
             requests = requests.filter(status=filter_form.cleaned_data['status'])
         if filter_form.cleaned_data['priority']:
@@ -87,8 +136,11 @@ def request_list(request):
             if filter_form.cleaned_data.get('paramedic'):
                 requests = requests.filter(paramedic=filter_form.cleaned_data['paramedic'])
     
-    # Order by priority and creation time
-    requests = requests.order_by('-priority', '-created_at')
+    # Full-text search results are ranked by relevance, otherwise order by priority and creation time
+    if search_query:
+        requests = search_requests(requests, search_query)
+    else:
+        requests = requests.order_by('-priority', '-created_at')
     
     # Pagination
     paginator = Paginator(requests, 10)
@@ -105,6 +157,7 @@ def request_list(request):
 
 @login_required
 @staff_required
+@rate_limit('emergency', methods=('POST',))
 def assign_paramedic(request, pk):
     """Assign paramedic to request (Admin/Paramedic)"""
     ambulance_request = get_object_or_404(AmbulanceRequest, pk=pk)
@@ -115,18 +168,19 @@ def assign_paramedic(request, pk):
             paramedic = form.cleaned_data['paramedic']
             notes = form.cleaned_data['notes']
             
-            # Update request
-            old_status = ambulance_request.status
-            ambulance_request.assign_paramedic(paramedic)
-            
-            # Create status update record
-            RequestStatusUpdate.objects.create(
-                request=ambulance_request,
-                updated_by=request.user,
-                old_status=old_status,
-                new_status='assigned',
-                notes=notes
-            )
+            # Save the change, its history record and queued notifications together
+            with transaction.atomic():
+                old_status = ambulance_request.status
+                ambulance_request.assign_paramedic(paramedic)
+                
+                # Create status update record
+                RequestStatusUpdate.objects.create(
+                    request=ambulance_request,
+                    updated_by=request.user,
+                    old_status=old_status,
+                    new_status='assigned',
+                    notes=notes
+                )
             
             messages.success(request, f'Request assigned to {paramedic.get_full_name() or paramedic.username}')
             return redirect('ambulance:request_detail', pk=pk)
@@ -143,6 +197,7 @@ def assign_paramedic(request, pk):
 
 @login_required
 @staff_required
+@rate_limit('emergency', methods=('POST',))
 def update_status(request, pk):
     """Update request status"""
     ambulance_request = get_object_or_404(AmbulanceRequest, pk=pk)
@@ -150,29 +205,31 @@ def update_status(request, pk):
     if request.method == 'POST':
         form = RequestStatusUpdateForm(request.POST)
         if form.is_valid():
-            old_status = ambulance_request.status
-            new_status = form.cleaned_data['new_status']
-            notes = form.cleaned_data['notes']
-            
-            # Update request status
-            ambulance_request.status = new_status
-            if new_status == 'arrived':
-                ambulance_request.mark_arrived()
-            elif new_status == 'completed':
-                ambulance_request.mark_completed()
-            elif new_status == 'cancelled':
-                ambulance_request.cancel_request()
-            else:
-                ambulance_request.save()
-            
-            # Create status update record
-            RequestStatusUpdate.objects.create(
-                request=ambulance_request,
-                updated_by=request.user,
-                old_status=old_status,
-                new_status=new_status,
-                notes=notes
-            )
+            # Save the change, its history record and queued notifications together
+            with transaction.atomic():
+                old_status = ambulance_request.status
+                new_status = form.cleaned_data['new_status']
+                notes = form.cleaned_data['notes']
+                
+                # Update request status
+                ambulance_request.status = new_status
+                if new_status == 'arrived':
+                    ambulance_request.mark_arrived()
+                elif new_status == 'completed':
+                    ambulance_request.mark_completed()
+                elif new_status == 'cancelled':
+                    ambulance_request.cancel_request()
+                else:
+                    ambulance_request.save()
+                
+                # Create status update record
+                RequestStatusUpdate.objects.create(
+                    request=ambulance_request,
+                    updated_by=request.user,
+                    old_status=old_status,
+                    new_status=new_status,
+                    notes=notes
+                )
             
             messages.success(request, f'Request status updated to {ambulance_request.get_status_display()}')
             return redirect('ambulance:request_detail', pk=pk)
@@ -189,23 +246,26 @@ def update_status(request, pk):
 
 @login_required
 @paramedic_required
+@rate_limit('emergency', methods=('POST',))
 def accept_request(request, pk):
     """Accept ambulance request (Paramedic only)"""
     ambulance_request = get_object_or_404(AmbulanceRequest, pk=pk, status='pending')
     
     if request.method == 'POST':
         # Assign current paramedic to request
-        old_status = ambulance_request.status
-        ambulance_request.assign_paramedic(request.user)
-        
-        # Create status update record
-        RequestStatusUpdate.objects.create(
-            request=ambulance_request,
-            updated_by=request.user,
-            old_status=old_status,
-            new_status='assigned',
-            notes='Request accepted by paramedic'
-        )
+        # Save the change, its history record and queued notifications together
+        with transaction.atomic():
+            old_status = ambulance_request.status
+            ambulance_request.assign_paramedic(request.user)
+            
+            # Create status update record
+            RequestStatusUpdate.objects.create(
+                request=ambulance_request,
+                updated_by=request.user,
+                old_status=old_status,
+                new_status='assigned',
+                notes='Request accepted by paramedic'
+            )
         
         messages.success(request, 'You have accepted this ambulance request.')
         return redirect('ambulance:request_detail', pk=pk)
@@ -314,6 +374,7 @@ def ambulance_delete(request, pk):
 
 @login_required
 @require_http_methods(["POST"])
+@rate_limit('emergency')
 def quick_status_update(request, pk):
     """Quick status update via AJAX"""
     ambulance_request = get_object_or_404(AmbulanceRequest, pk=pk)
@@ -327,27 +388,29 @@ def quick_status_update(request, pk):
     if new_status not in dict(AmbulanceRequest.STATUS_CHOICES):
         return JsonResponse({'error': 'Invalid status'}, status=400)
     
-    old_status = ambulance_request.status
-    ambulance_request.status = new_status
-    
-    # Handle special status updates
-    if new_status == 'arrived':
-        ambulance_request.mark_arrived()
-    elif new_status == 'completed':
-        ambulance_request.mark_completed()
-    elif new_status == 'cancelled':
-        ambulance_request.cancel_request()
-    else:
-        ambulance_request.save()
-    
-    # Create status update record
-    RequestStatusUpdate.objects.create(
-        request=ambulance_request,
-        updated_by=request.user,
-        old_status=old_status,
-        new_status=new_status,
-        notes='Quick status update'
-    )
+    # Save the change, its history record and queued notifications together
+    with transaction.atomic():
+        old_status = ambulance_request.status
+        ambulance_request.status = new_status
+        
+        # Handle special status updates
+        if new_status == 'arrived':
+            ambulance_request.mark_arrived()
+        elif new_status == 'completed':
+            ambulance_request.mark_completed()
+        elif new_status == 'cancelled':
+            ambulance_request.cancel_request()
+        else:
+            ambulance_request.save()
+        
+        # Create status update record
+        RequestStatusUpdate.objects.create(
+            request=ambulance_request,
+            updated_by=request.user,
+            old_status=old_status,
+            new_status=new_status,
+            notes='Quick status update'
+        )
     
     return JsonResponse({
         'success': True,
@@ -0,0 +1,143 @@
+"""
+Native async versions of the most-polled API endpoints.
+
+Dashboards and paramedic apps poll these every few seconds, so under WSGI
+each poll holds a worker thread while it waits on the database. Served by
+``emergency_ambulance.asgi`` these views wait on the async ORM instead and the
+worker's event loop keeps serving other requests in the meantime.
+
+The responses match their DRF counterparts in ``api.views``. DRF views are
+synchronous, so authentication is done here: a signed bearer token (one
+revocation query in a thread) or else the session user.
+"""
+
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.db.models import Count, Q
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+from rest_framework import exceptions
+
+from ambulance.fleet import fleet
+from ambulance.models import AmbulanceRequest
+from emergency_ambulance.ratelimit import check, throttled_response
+from .authentication import SignedTokenAuthentication
+from .serializers import (
+    AmbulanceRequestSerializer, AmbulanceSerializer, DashboardStatsSerializer, ParamedicSerializer
+)
+
+User = get_user_model()
+
+ACTIVE_STATUSES = ['assigned', 'en_route', 'arrived']
+
+
+def _unauthorized(detail):
+    response = JsonResponse({'detail': str(detail)}, status=401)
+    response['WWW-Authenticate'] = SignedTokenAuthentication().authenticate_header(None)
+    return response
+
+
+async def authenticate(request):
+    """Return (user, None) for an authenticated request, else (None, 401 response)"""
+    try:
+        result = await sync_to_async(SignedTokenAuthentication().authenticate)(request)
+    except exceptions.AuthenticationFailed as e:
+        return None, _unauthorized(e.detail)
+    if result is not None:
+        return result[0], None
+    user = await request.auser()
+    if not user.is_authenticated:
+        return None, _unauthorized(exceptions.NotAuthenticated.default_detail)
+    return user, None
+
+
+@require_GET
+async def dashboard_stats(request):
+    """Get dashboard statistics"""
+    user, error = await authenticate(request)
+    if error:
+        return error
+    allowed, wait = check(request, 'poll', user=user)
+    if not allowed:
+        return throttled_response(request, wait)
+
+    # The request counts share one scan; the other counts run alongside it
+    queries = [
+        AmbulanceRequest.objects.aaggregate(
+            total_requests=Count('pk'),
+            pending_requests=Count('pk', filter=Q(status='pending')),
+            active_requests=Count('pk', filter=Q(status__in=ACTIVE_STATUSES)),
+            completed_requests=Count('pk', filter=Q(status='completed')),
+        ),
+        User.objects.filter(role='paramedic', is_available=True).acount(),
+    ]
+    if user.is_patient():
+        queries.append(AmbulanceRequest.objects.filter(patient=user).acount())
+    elif user.is_paramedic():
+        queries.append(AmbulanceRequest.objects.filter(paramedic=user, status__in=ACTIVE_STATUSES).acount())
+    results = await asyncio.gather(*queries)
+
+    stats = dict(results[0], available_paramedics=results[1])
+    if user.is_patient():
+        stats['my_requests'] = results[2]
+    elif user.is_paramedic():
+        stats['assigned_to_me'] = results[2]
+    return JsonResponse(DashboardStatsSerializer(stats).data)
+
+
+@require_GET
+async def recent_requests(request):
+    """Get recent requests based on user role"""
+    user, error = await authenticate(request)
+    if error:
+        return error
+    allowed, wait = check(request, 'poll', user=user)
+    if not allowed:
+        return throttled_response(request, wait)
+
+    if user.is_patient():
+        requests = AmbulanceRequest.objects.filter(patient=user)
+    elif user.is_paramedic():
+        requests = AmbulanceRequest.objects.filter(Q(paramedic=user) | Q(status='pending'))
+    else:  # Admin
+        requests = AmbulanceRequest.objects.all()
+
+    # Related users are joined in, since serializing must not trigger (synchronous) lazy loads
+    requests = requests.select_related('patient', 'paramedic').order_by('-created_at')[:10]
+    rows = [row async for row in requests.aiterator()]
+    serializer = AmbulanceRequestSerializer(rows, many=True, context={'request': request})
+    return JsonResponse(serializer.data, safe=False)
+
+
+@require_GET
+async def available_paramedics(request):
+    """Get available paramedics"""
+    user, error = await authenticate(request)
+    if error:
+        return error
+    allowed, wait = check(request, 'poll', user=user)
+    if not allowed:
+        return throttled_response(request, wait)
+
+    paramedics = User.objects.filter(role='paramedic', is_available=True)
+    rows = [row async for row in paramedics.aiterator()]
+    serializer = ParamedicSerializer(rows, many=True, context={'request': request})
+    return JsonResponse(serializer.data, safe=False)
+
+
+@require_GET
+async def available_ambulances(request):
+    """Get available ambulances"""
+    user, error = await authenticate(request)
+    if error:
+        return error
+    allowed, wait = check(request, 'poll', user=user)
+    if not allowed:
+        return throttled_response(request, wait)
+
+    # The fleet registry answers from memory; it only queries (synchronously) to reload
+    rows = await sync_to_async(fleet.available)()
+    serializer = AmbulanceSerializer(rows, many=True, context={'request': request})
+    return JsonResponse(serializer.data, safe=False)
@@ -0,0 +1,178 @@
+"""
+Stateless signed API tokens.
+
+A token is a signed, timestamped payload carrying the user id, username and
+role, so authenticating a request needs no session and no full user load.
+Revocations are kept in the database, the durable source every worker reads:
+
+* ``RevokedToken`` rows for individually revoked tokens
+* a ``TokenCutoff`` per user to revoke every token the user holds, e.g. on
+  "log out everywhere" or after a password or role change
+
+With a cache shared by every worker (see ``accounts.backends.
+user_cache_enabled``) a request is verified without a database query: one
+``get_many`` reads the small list of live revoked token ids and the user's
+active flag and cutoff. Writers refresh both entries from the database once
+their transaction commits; readers that missed only ``add`` what they
+loaded, so a slow reader cannot overwrite a newer entry. A per-process cache
+such as LocMemCache would only be refreshed in the worker that revoked, so
+with one every request runs a single indexed query instead.
+
+Code that changes ``is_active`` with ``QuerySet.update()`` skips the signals
+and has to call ``refresh_token_user`` itself.
+
+Revoked tokens are deleted once they would have expired anyway, so the table
+and the cached list stay small.
+"""
+
+import secrets
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Subquery
+from django.utils import timezone
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+
+from accounts.backends import user_cache_enabled, user_cache_timeout
+from .models import RevokedToken, TokenCutoff, TokenUser
+
+TOKEN_SALT = 'api.authentication.signed-token'
+
+TOKEN_USER_KEY = 'token-user:{}'
+REVOKED_TOKENS_KEY = 'revoked-tokens'
+# Cached in place of the state of a user that no longer exists
+MISSING_USER = 'missing'
+
+
+def token_ttl():
+    return getattr(settings, 'API_TOKEN_TTL', 3600)
+
+
+def issue_token(user):
+    """Return a new signed token for user and its lifetime in seconds"""
+    payload = {
+        'uid': user.pk,
+        'usr': user.username,
+        'role': user.role,
+        'jti': secrets.token_urlsafe(9),
+        'iat': round(time.time(), 3),
+    }
+    return signing.dumps(payload, salt=TOKEN_SALT), token_ttl()
+
+
+def read_token(token):
+    """Verify a token's signature and age and return its payload"""
+    try:
+        return signing.loads(token, salt=TOKEN_SALT, max_age=token_ttl())
+    except signing.SignatureExpired:
+        raise exceptions.AuthenticationFailed('Token has expired.')
+    except signing.BadSignature:
+        raise exceptions.AuthenticationFailed('Invalid token.')
+
+
+def cutoff_of(user):
+    return Subquery(TokenCutoff.objects.filter(user=user).values('not_before'))
+
+
+def load_token_user(user_id):
+    """(is_active, not_before) of a user from the database, or MISSING_USER"""
+    state = TokenUser.objects.filter(pk=user_id).values_list('is_active', cutoff_of(OuterRef('pk'))).first()
+    return MISSING_USER if state is None else state
+
+
+def load_revoked_tokens():
+    """Ids of the revoked tokens that have not expired yet"""
+    return frozenset(RevokedToken.objects.filter(expires_at__gte=timezone.now()).values_list('jti', flat=True))
+
+
+def refresh_token_user(user_id):
+    """Replace a user's cached token state once the current transaction commits"""
+    if user_cache_enabled():
+        transaction.on_commit(lambda: cache.set(
+            TOKEN_USER_KEY.format(user_id), load_token_user(user_id), user_cache_timeout()
+        ))
+
+
+def refresh_revoked_tokens():
+    """Replace the cached revocation list once the current transaction commits"""
+    if user_cache_enabled():
+        transaction.on_commit(lambda: cache.set(REVOKED_TOKENS_KEY, load_revoked_tokens(), user_cache_timeout()))
+
+
+def token_state(payload):
+    """(is_active, not_before, revoked) for a token, or None when its user no longer exists"""
+    if not user_cache_enabled():
+        return TokenUser.objects.filter(pk=payload['uid']).values_list(
+            'is_active',
+            cutoff_of(OuterRef('pk')),
+            Exists(RevokedToken.objects.filter(jti=payload['jti'])),
+        ).first()
+
+    user_key = TOKEN_USER_KEY.format(payload['uid'])
+    cached = cache.get_many([user_key, REVOKED_TOKENS_KEY])
+    user_state = cached.get(user_key)
+    if user_state is None:
+        user_state = load_token_user(payload['uid'])
+        cache.add(user_key, user_state, user_cache_timeout())
+    revoked = cached.get(REVOKED_TOKENS_KEY)
+    if revoked is None:
+        revoked = load_revoked_tokens()
+        cache.add(REVOKED_TOKENS_KEY, revoked, user_cache_timeout())
+    if user_state == MISSING_USER:
+        return None
+    is_active, not_before = user_state
+    return is_active, not_before, payload['jti'] in revoked
+
+
+def revoke_token(payload):
+    """Revoke a single token until it would have expired anyway"""
+    expires_at = datetime.fromtimestamp(payload['iat'] + token_ttl() + 1, tz=dt_timezone.utc)
+    RevokedToken.objects.get_or_create(jti=payload['jti'], defaults={'expires_at': expires_at})
+    RevokedToken.objects.filter(expires_at__lt=timezone.now()).delete()
+    refresh_revoked_tokens()
+
+
+def revoke_user_tokens(user_id):
+    """Revoke every token issued to a user up to now"""
+    TokenCutoff.objects.update_or_create(user_id=user_id, defaults={'not_before': round(time.time(), 3)})
+    refresh_token_user(user_id)
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    """
+    Authenticate ``Authorization: Bearer <token>`` requests.
+    
+    request.user is a TokenUser built from the token payload and request.auth
+    is the payload itself.
+    """
+    
+    keyword = 'Bearer'
+    
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed('Invalid token header.')
+        
+        try:
+            token = auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed('Invalid token header.')
+        
+        payload = read_token(token)
+        state = token_state(payload)
+        if state is None or not state[0]:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+        is_active, not_before, revoked = state
+        if revoked or (not_before is not None and payload['iat'] <= not_before):
+            raise exceptions.AuthenticationFailed('Token has been revoked.')
+        return TokenUser.from_token(payload), payload
+    
+    def authenticate_header(self, request):
+        return f'{self.keyword} realm="api"'
@@ -1,3 +1,50 @@
+from django.contrib.auth import get_user_model
 from django.db import models
 
-# Create your models here.
+User = get_user_model()
+
+
+class TokenUser(User):
+    """
+    User rebuilt from a signed API token without a database read.
+    
+    Only the fields carried in the token are set. The first access to any
+    other field loads all remaining fields in a single query.
+    """
+    
+    class Meta:
+        proxy = True
+    
+    @classmethod
+    def from_token(cls, payload, using='default'):
+        # SignedTokenAuthentication only accepts tokens of active users
+        known = {'id': payload['uid'], 'username': payload['usr'], 'role': payload['role'], 'is_active': True}
+        # from_db expects values in concrete field order
+        field_names = [f.attname for f in cls._meta.concrete_fields if f.attname in known]
+        return cls.from_db(using, field_names, [known[name] for name in field_names])
+    
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        deferred = self.get_deferred_fields()
+        if fields is not None and deferred and set(fields) <= deferred:
+            fields = deferred
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+
+
+class RevokedToken(models.Model):
+    """A single revoked API token, kept until it would have expired anyway"""
+    
+    jti = models.CharField(max_length=32, primary_key=True)
+    expires_at = models.DateTimeField(db_index=True)
+    
+    class Meta:
+        db_table = 'api_revoked_token'
+
+
+class TokenCutoff(models.Model):
+    """Every API token a user was issued up to not_before (epoch seconds) is revoked"""
+    
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    not_before = models.FloatField()
+    
+    class Meta:
+        db_table = 'api_token_cutoff'
@@ -1,24 +1,184 @@
+import decimal
+from datetime import timezone as dt_timezone
+
 from rest_framework import serializers
+from rest_framework.settings import ISO_8601, api_settings
 from django.contrib.auth import get_user_model
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
 from accounts.models import UserProfile
-from ambulance.models import AmbulanceRequest, RequestStatusUpdate, Ambulance
+from accounts.thumbnails import avatar_url
+from ambulance.models import AmbulanceRequest, RequestStatusUpdate, Ambulance, SyncOperation
 
 User = get_user_model()
 
 
-class UserSerializer(serializers.ModelSerializer):
+class AvatarURLField(serializers.Field):
+    """Absolute URL of a user's avatar thumbnail ('' when there is no profile image)"""
+    
+    def __init__(self, size='medium', **kwargs):
+        self.size = size
+        kwargs.update(source='*', read_only=True)
+        super().__init__(**kwargs)
+    
+    def to_representation(self, user):
+        url = avatar_url(user, self.size)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if url and request else url
+
+
+class DecimalField(serializers.DecimalField):
+    """DecimalField with its quantum and context built once per field instead of once per value"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.decimal_places is not None:
+            self.quantum = decimal.Decimal(1).scaleb(-self.decimal_places)
+            self.decimal_context = decimal.getcontext().copy()
+            if self.max_digits is not None:
+                self.decimal_context.prec = self.max_digits
+    
+    def quantize(self, value):
+        if self.decimal_places is None:
+            return value
+        return value.quantize(self.quantum, rounding=self.rounding, context=self.decimal_context)
+
+
+class DateTimeField(serializers.DateTimeField):
+    """DateTimeField that formats the UTC datetimes the database returns without converting them"""
+    
+    utc_iso_output = None
+    
+    def to_representation(self, value):
+        if value and getattr(value, 'tzinfo', None) is dt_timezone.utc:
+            if self.utc_iso_output is None:
+                # Decided once per field: the output must be ISO 8601 in UTC
+                field_timezone = self.timezone if hasattr(self, 'timezone') else self.default_timezone()
+                output_format = getattr(self, 'format', api_settings.DATETIME_FORMAT)
+                self.utc_iso_output = (
+                    output_format is not None and output_format.lower() == ISO_8601 and
+                    (field_timezone is dt_timezone.utc or getattr(field_timezone, 'key', None) == 'UTC')
+                )
+            if self.utc_iso_output:
+                return value.isoformat()[:-6] + 'Z'
+        return super().to_representation(value)
+
+
+class SparseFieldsMixin:
+    """
+    Serializer taking ``fields`` (the names to render) and ``expand`` (the
+    nested relations to render in full; the others become their id). By
+    default every field is rendered; relations are expanded unless only some
+    fields are asked for. Expanding a relation also includes it.
+    
+    ``Meta.column_sources`` names the model columns behind fields that are
+    not columns themselves (properties, display methods, annotations), so
+    ``trim_queryset`` can load just what the chosen fields read.
+    """
+    
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        self.fieldset = self.select_fields(fields, expand)
+        super().__init__(*args, **kwargs)
+    
+    @classmethod
+    def field_names(cls):
+        return list(getattr(cls.Meta, 'fields', None) or cls._declared_fields)
+    
+    @classmethod
+    def expandable_fields(cls):
+        """Nested serializers, keyed by field name"""
+        return {
+            name: field for name, field in cls._declared_fields.items()
+            if isinstance(field, serializers.BaseSerializer)
+        }
+    
+    @classmethod
+    def select_fields(cls, fields=None, expand=None):
+        """(names to render, relations to expand), or None for the full representation"""
+        if fields is None and expand is None:
+            return None
+        names = cls.field_names()
+        expandable = cls.expandable_fields()
+        
+        unknown = [name for name in fields or () if name not in names]
+        if unknown:
+            raise serializers.ValidationError({'fields': [f'Unknown fields: {", ".join(unknown)}.']})
+        unknown = [name for name in expand or () if name not in expandable]
+        if unknown:
+            raise serializers.ValidationError({'expand': [f'Cannot expand: {", ".join(unknown)}.']})
+        
+        if expand is None:
+            expand = expandable if fields is None else ()
+        keep = set(names if fields is None else fields) | set(expand)
+        return [name for name in names if name in keep], set(expand)
+    
+    @classmethod
+    def trim_queryset(cls, queryset, fields=None, expand=None):
+        """Join the expanded relations and, where every field maps to columns, load only those columns"""
+        fieldset = cls.select_fields(fields, expand)
+        names, expand = fieldset or (cls.field_names(), cls.expandable_fields())
+        related = [cls._declared_fields[name].source or name for name in expand]
+        if related:
+            queryset = queryset.select_related(*related)
+        if fieldset is None:
+            return queryset
+        
+        column_sources = getattr(cls.Meta, 'column_sources', {})
+        columns = set(related)
+        for name in names:
+            if name in column_sources:
+                columns.update(column_sources[name])
+                continue
+            declared = cls._declared_fields.get(name)
+            source = (declared.source if declared is not None else None) or name
+            try:
+                field = queryset.model._meta.get_field(source)
+            except FieldDoesNotExist:
+                field = None
+            if field is None or not field.concrete:
+                # Reading it would load deferred columns row by row; load them all instead
+                return queryset
+            columns.add(source)
+        return queryset.only(*columns)
+    
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.fieldset is None:
+            return fields
+        names, expand = self.fieldset
+        for name, field in self.expandable_fields().items():
+            if name in names and name not in expand:
+                kwargs = {'source': field.source} if field.source not in (None, name) else {}
+                fields[name] = serializers.PrimaryKeyRelatedField(read_only=True, **kwargs)
+        return {name: fields[name] for name in names}
+
+
+class ModelSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """ModelSerializer building the faster decimal and datetime fields above, with sparse fieldsets"""
+    
+    serializer_field_mapping = {
+        **serializers.ModelSerializer.serializer_field_mapping,
+        models.DecimalField: DecimalField,
+        models.DateTimeField: DateTimeField,
+    }
+
+
+class UserSerializer(ModelSerializer):
     """Serializer for User model"""
     
+    avatar_url = AvatarURLField()
+    
     class Meta:
         model = User
         fields = [
             'id', 'username', 'email', 'first_name', 'last_name', 
-            'role', 'phone_number', 'is_available', 'date_joined'
+            'role', 'phone_number', 'is_available', 'date_joined', 'avatar_url'
         ]
         read_only_fields = ['id', 'username', 'date_joined']
+        column_sources = {'avatar_url': ['profile_image']}
 
 
-class UserProfileSerializer(serializers.ModelSerializer):
+class UserProfileSerializer(ModelSerializer):
     """Serializer for UserProfile model"""
     
     user = UserSerializer(read_only=True)
@@ -31,25 +191,30 @@ class UserProfileSerializer(serializers.ModelSerializer):
         ]
 
 
-class ParamedicSerializer(serializers.ModelSerializer):
+class ParamedicSerializer(ModelSerializer):
     """Serializer for Paramedic users"""
     
+    avatar_url = AvatarURLField()
+    
     class Meta:
         model = User
         fields = [
             'id', 'username', 'first_name', 'last_name', 
-            'phone_number', 'is_available', 'license_number'
+            'phone_number', 'is_available', 'license_number', 'avatar_url'
         ]
         read_only_fields = ['id', 'username']
+        column_sources = {'avatar_url': ['profile_image']}
 
 
-class AmbulanceRequestSerializer(serializers.ModelSerializer):
+class AmbulanceRequestSerializer(ModelSerializer):
     """Serializer for AmbulanceRequest model"""
     
     patient = UserSerializer(read_only=True)
     paramedic = ParamedicSerializer(read_only=True)
     status_display = serializers.CharField(source='get_status_display', read_only=True)
     priority_display = serializers.CharField(source='get_priority_display', read_only=True)
+    # Only present in radius searches
+    distance_km = serializers.FloatField(read_only=True)
     
     class Meta:
         model = AmbulanceRequest
@@ -58,21 +223,26 @@ class AmbulanceRequestSerializer(serializers.ModelSerializer):
             'pickup_latitude', 'pickup_longitude', 'destination_latitude', 'destination_longitude',
             'description', 'priority', 'priority_display', 'status', 'status_display',
             'contact_phone', 'created_at', 'updated_at', 'assigned_at', 'completed_at',
-            'estimated_arrival_time', 'actual_arrival_time', 'notes', 'is_active'
+            'estimated_arrival_time', 'actual_arrival_time', 'notes', 'is_active', 'duplicate_of',
+            'distance_km'
         ]
         read_only_fields = [
             'id', 'patient', 'paramedic', 'created_at', 'updated_at', 
-            'assigned_at', 'completed_at', 'actual_arrival_time', 'is_active'
+            'assigned_at', 'completed_at', 'actual_arrival_time', 'is_active', 'duplicate_of'
         ]
+        column_sources = {
+            'status_display': ['status'], 'priority_display': ['priority'], 'is_active': ['status'],
+            'distance_km': [],
+        }
 
 
-class AmbulanceRequestCreateSerializer(serializers.ModelSerializer):
+class AmbulanceRequestCreateSerializer(ModelSerializer):
     """Serializer for creating AmbulanceRequest"""
     
     class Meta:
         model = AmbulanceRequest
         fields = [
-            'pickup_address', 'destination_address', 'pickup_latitude', 'pickup_longitude',
+            'id', 'pickup_address', 'destination_address', 'pickup_latitude', 'pickup_longitude',
             'destination_latitude', 'destination_longitude', 'description', 
             'priority', 'contact_phone'
         ]
@@ -83,7 +253,7 @@ class AmbulanceRequestCreateSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class RequestStatusUpdateSerializer(serializers.ModelSerializer):
+class RequestStatusUpdateSerializer(ModelSerializer):
     """Serializer for RequestStatusUpdate model"""
     
     updated_by = UserSerializer(read_only=True)
@@ -97,22 +267,26 @@ class RequestStatusUpdateSerializer(serializers.ModelSerializer):
             'new_status', 'new_status_display', 'notes', 'timestamp'
         ]
         read_only_fields = ['id', 'updated_by', 'timestamp']
+        column_sources = {'old_status_display': ['old_status'], 'new_status_display': ['new_status']}
 
 
-class AmbulanceSerializer(serializers.ModelSerializer):
+class AmbulanceSerializer(ModelSerializer):
     """Serializer for Ambulance model"""
     
     assigned_paramedic = ParamedicSerializer(read_only=True)
     status_display = serializers.CharField(source='get_status_display', read_only=True)
+    # Only present in radius searches
+    distance_km = serializers.FloatField(read_only=True)
     
     class Meta:
         model = Ambulance
         fields = [
             'id', 'vehicle_number', 'license_plate', 'current_latitude', 'current_longitude',
             'status', 'status_display', 'assigned_paramedic', 'model', 'year',
-            'created_at', 'updated_at', 'is_available'
+            'location_recorded_at', 'created_at', 'updated_at', 'is_available', 'distance_km'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at', 'is_available']
+        read_only_fields = ['id', 'location_recorded_at', 'created_at', 'updated_at', 'is_available']
+        column_sources = {'status_display': ['status'], 'is_available': ['status'], 'distance_km': []}
 
 
 class AssignParamedicSerializer(serializers.Serializer):
@@ -144,6 +318,36 @@ class StatusUpdateSerializer(serializers.Serializer):
         return value
 
 
+class SyncOperationSerializer(serializers.Serializer):
+    """Serializer for one operation queued by an offline client"""
+    
+    key = serializers.CharField(max_length=64)
+    type = serializers.ChoiceField(choices=SyncOperation.KIND_CHOICES)
+    recorded_at = serializers.DateTimeField()
+    
+    # Status transitions
+    request = serializers.IntegerField(required=False)
+    status = serializers.ChoiceField(choices=AmbulanceRequest.STATUS_CHOICES, required=False)
+    notes = serializers.CharField(required=False, allow_blank=True)
+    
+    # Location stamps; devices report more decimals than are stored, so they are rounded when applied
+    latitude = serializers.FloatField(min_value=-90, max_value=90, required=False)
+    longitude = serializers.FloatField(min_value=-180, max_value=180, required=False)
+    
+    def validate(self, attrs):
+        required = ('request', 'status') if attrs['type'] == 'status' else ('latitude', 'longitude')
+        missing = {name: "This field is required." for name in required if attrs.get(name) is None}
+        if missing:
+            raise serializers.ValidationError(missing)
+        return attrs
+
+
+class SyncBatchSerializer(serializers.Serializer):
+    """Serializer for a queue of offline operations, in the order they were made"""
+    
+    operations = SyncOperationSerializer(many=True, allow_empty=False, max_length=500)
+
+
 class DashboardStatsSerializer(serializers.Serializer):
     """Serializer for dashboard statistics"""
     
@@ -0,0 +1,56 @@
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import receiver
+
+from accounts.models import User
+from .authentication import refresh_token_user, revoke_user_tokens
+from .models import TokenUser
+
+# Fields whose change revokes a user's API tokens, besides the password
+CREDENTIAL_FIELDS = ('role', 'is_active')
+
+
+def credentials_of(user):
+    # Deferred fields are not in __dict__; None stands for "not loaded"
+    return tuple(user.__dict__.get(name) for name in CREDENTIAL_FIELDS)
+
+
+@receiver(post_init, sender=User)
+@receiver(post_init, sender=TokenUser)
+def remember_credentials(sender, instance, **kwargs):
+    """Keep the role and active flag a user was loaded with, so saves can tell they changed without a query"""
+    instance._loaded_credentials = credentials_of(instance)
+
+
+@receiver(pre_save)
+def revoke_tokens_on_credential_change(sender, instance, update_fields=None, **kwargs):
+    """Revoke a user's API tokens when their password, role or active flag changes"""
+    # Tokens of deleted or deactivated users fail authentication anyway
+    # Connected without a sender so saves through proxies such as TokenUser are seen too
+    if not isinstance(instance, User) or instance._state.adding:
+        return
+
+    if instance._password is not None:
+        revoke_user_tokens(instance.pk)
+        return
+
+    if update_fields is not None and not set(CREDENTIAL_FIELDS) & set(update_fields):
+        return
+    loaded = getattr(instance, '_loaded_credentials', (None,) * len(CREDENTIAL_FIELDS))
+    if any(new is not None and new != old for old, new in zip(loaded, credentials_of(instance))):
+        revoke_user_tokens(instance.pk)
+
+
+@receiver(post_save)
+def refresh_token_state(sender, instance, update_fields=None, **kwargs):
+    """Keep the cached active flag of a saved user current"""
+    if not isinstance(instance, User):
+        return
+    instance._loaded_credentials = credentials_of(instance)
+    if update_fields is None or 'is_active' in update_fields:
+        refresh_token_user(instance.pk)
+
+
+@receiver(post_delete)
+def forget_token_state(sender, instance, **kwargs):
+    if isinstance(instance, User):
+        refresh_token_user(instance.pk)
@@ -1,3 +1,441 @@
-from django.test import TestCase
+import time
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient
+
+from accounts.models import User
+from ambulance import sync
+from ambulance.changes import current_cursor
+from ambulance.models import Ambulance, AmbulanceRequest, RequestStatusUpdate, SyncOperation
+from emergency_ambulance import ratelimit
+from .authentication import (
+    SignedTokenAuthentication, issue_token, read_token, revoke_token, revoke_user_tokens
+)
+
+
+def make_request(patient, **fields):
+    values = {
+        'pickup_address': '1 Main Street', 'destination_address': 'City General Hospital',
+        'description': 'chest pain', 'priority': 'high', 'contact_phone': '555-0100',
+    }
+    values.update(fields)
+    return AmbulanceRequest.objects.create(patient=patient, **values)
+
+
+def api_client(user):
+    return APIClient(HTTP_AUTHORIZATION=f'Bearer {issue_token(user)[0]}')
+
+
+class TokenRevocationTests(TestCase):
+    """Revocations live in the database, so every worker sees them"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('medic', password='secret-pass', role='paramedic')
+
+    def get_stats(self, token):
+        client = APIClient(HTTP_AUTHORIZATION=f'Bearer {token}')
+        return client.get('/api/v1/dashboard/stats/')
+
+    def test_valid_token_authenticates(self):
+        token, _ = issue_token(self.user)
+        self.assertEqual(self.get_stats(token).status_code, 200)
+
+    def test_revoked_token_is_refused(self):
+        token, _ = issue_token(self.user)
+        other, _ = issue_token(self.user)
+        revoke_token(read_token(token))
+
+        response = self.get_stats(token)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['detail'], 'Token has been revoked.')
+        self.assertEqual(self.get_stats(other).status_code, 200)
+
+    def test_revoke_endpoint(self):
+        token, _ = issue_token(self.user)
+        client = APIClient(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(client.post('/api/v1/auth/token/revoke/').status_code, 204)
+        self.assertEqual(self.get_stats(token).status_code, 401)
+
+    def test_refresh_revokes_the_old_token(self):
+        token, _ = issue_token(self.user)
+        client = APIClient(HTTP_AUTHORIZATION=f'Bearer {token}')
+        fresh = client.post('/api/v1/auth/token/refresh/').json()['token']
+        self.assertEqual(self.get_stats(token).status_code, 401)
+        self.assertEqual(self.get_stats(fresh).status_code, 200)
+
+    def test_revoke_all_tokens(self):
+        tokens = [issue_token(self.user)[0] for _ in range(2)]
+        revoke_user_tokens(self.user.pk)
+        for token in tokens:
+            self.assertEqual(self.get_stats(token).status_code, 401)
+        # Tokens issued in the same millisecond as the cutoff count as revoked
+        time.sleep(0.002)
+        token, _ = issue_token(self.user)
+        self.assertEqual(self.get_stats(token).status_code, 200)
+
+    def test_deactivated_user_is_refused(self):
+        token, _ = issue_token(self.user)
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        response = self.get_stats(token)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['detail'], 'User inactive or deleted.')
+
+    def test_password_change_revokes_tokens(self):
+        token, _ = issue_token(self.user)
+        self.user.set_password('new-secret-pass')
+        self.user.save()
+        self.assertEqual(self.get_stats(token).status_code, 401)
+
+    def test_deleted_user_is_refused(self):
+        token, _ = issue_token(self.user)
+        self.user.delete()
+        self.assertEqual(self.get_stats(token).status_code, 401)
+
+    def test_profile_save_runs_no_credential_query(self):
+        user = User.objects.get(pk=self.user.pk)
+        user.first_name = 'Ann'
+        with self.assertNumQueries(1):
+            user.save()
+
+    def test_role_change_revokes_tokens(self):
+        token, _ = issue_token(self.user)
+        user = User.objects.get(pk=self.user.pk)
+        user.role = 'patient'
+        user.save()
+        self.assertEqual(self.get_stats(token).status_code, 401)
+
+    async def test_async_endpoint_checks_revocation(self):
+        token, _ = issue_token(self.user)
+        headers = {'Authorization': f'Bearer {token}'}
+        response = await self.async_client.get('/api/v1/async/dashboard/stats/', headers=headers)
+        self.assertEqual(response.status_code, 200)
+
+        await sync_to_async(revoke_user_tokens)(self.user.pk)
+        response = await self.async_client.get('/api/v1/async/dashboard/stats/', headers=headers)
+        self.assertEqual(response.status_code, 401)
+
+
+
+@mock.patch('api.authentication.user_cache_enabled', return_value=True)
+class SharedCacheTokenTests(TestCase):
+    """With a shared cache, tokens are checked against cached revocations"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('medic', password='secret-pass', role='paramedic')
+
+    def authenticate(self, token):
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        return SignedTokenAuthentication().authenticate(request)
+
+    def test_verified_without_a_query(self, enabled):
+        token, _ = issue_token(self.user)
+        self.authenticate(token)
+        with self.assertNumQueries(0):
+            user, payload = self.authenticate(token)
+        self.assertEqual(user.pk, self.user.pk)
+
+    def test_revocations_replace_the_cached_state(self, enabled):
+        token, _ = issue_token(self.user)
+        other, _ = issue_token(self.user)
+        self.authenticate(token)
+        with self.captureOnCommitCallbacks(execute=True):
+            revoke_token(read_token(token))
+        with self.assertNumQueries(0):
+            with self.assertRaisesMessage(AuthenticationFailed, 'Token has been revoked.'):
+                self.authenticate(token)
+            self.authenticate(other)
+
+        time.sleep(0.002)
+        with self.captureOnCommitCallbacks(execute=True):
+            revoke_user_tokens(self.user.pk)
+        with self.assertRaisesMessage(AuthenticationFailed, 'Token has been revoked.'):
+            self.authenticate(other)
+
+    def test_deactivation_and_deletion(self, enabled):
+        token, _ = issue_token(self.user)
+        self.authenticate(token)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        with self.assertRaisesMessage(AuthenticationFailed, 'User inactive or deleted.'):
+            self.authenticate(token)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        with self.assertRaisesMessage(AuthenticationFailed, 'User inactive or deleted.'):
+            self.authenticate(token)
+
+    def test_evicted_entries_are_reloaded(self, enabled):
+        token, _ = issue_token(self.user)
+        revoke_token(read_token(token))
+        cache.clear()
+        with self.assertRaisesMessage(AuthenticationFailed, 'Token has been revoked.'):
+            self.authenticate(token)
+
+
+class ChangesVisibilityTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.patient = User.objects.create_user('patient', password='secret-pass', role='patient')
+        self.other = User.objects.create_user('other', password='secret-pass', role='patient')
+        self.medic = User.objects.create_user('medic', password='secret-pass', role='paramedic')
+        self.second_medic = User.objects.create_user('second', password='secret-pass', role='paramedic')
+        self.admin = User.objects.create_user('admin', password='secret-pass', role='admin')
+
+    def changes(self, user, since):
+        response = api_client(user).get('/api/v1/changes/', {'since': since})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_patient_is_not_told_about_other_requests(self):
+        since = current_cursor()
+        own = make_request(self.patient)
+        others = make_request(self.other)
+        others.status = 'cancelled'
+        others.save()
+        AmbulanceRequest.objects.get(pk=others.pk).delete()
+
+        data = self.changes(self.patient, since)
+        self.assertEqual([row['id'] for row in data['requests']], [own.pk])
+        self.assertEqual(data['removed']['requests'], [])
+        # The admin sees every removal
+        self.assertEqual(self.changes(self.admin, since)['removed']['requests'], [others.pk])
+
+    def test_patient_is_told_about_own_deleted_request(self):
+        own = make_request(self.patient)
+        since = current_cursor()
+        AmbulanceRequest.objects.get(pk=own.pk).delete()
+        self.assertEqual(self.changes(self.patient, since)['removed']['requests'], [own.pk])
+
+    def test_paramedics_lose_requests_taken_by_someone_else(self):
+        taken = make_request(self.patient)
+        since = current_cursor()
+        taken.paramedic = self.second_medic
+        taken.status = 'assigned'
+        taken.save()
+
+        # Pending before the change, so every paramedic had it
+        self.assertEqual(self.changes(self.medic, since)['removed']['requests'], [taken.pk])
+        data = self.changes(self.second_medic, since)
+        self.assertEqual([row['id'] for row in data['requests']], [taken.pk])
+        self.assertEqual(data['removed']['requests'], [])
+
+        # Moved on from second to medic: second loses it, a third paramedic never had it
+        since = current_cursor()
+        taken.paramedic = self.medic
+        taken.save()
+        third = User.objects.create_user('third', password='secret-pass', role='paramedic')
+        self.assertEqual(self.changes(self.second_medic, since)['removed']['requests'], [taken.pk])
+        self.assertEqual(self.changes(third, since)['removed']['requests'], [])
+
+    def test_admin_bulk_action_notes_previous_audience(self):
+        pending = make_request(self.patient)
+        since = current_cursor()
+        self.client.force_login(User.objects.create_superuser('root', password='secret-pass', role='admin'))
+        self.client.post('/admin/ambulance/ambulancerequest/', {
+            'action': 'mark_as_completed', '_selected_action': [pending.pk],
+        })
+        self.assertEqual(AmbulanceRequest.objects.get(pk=pending.pk).status, 'completed')
+        self.assertEqual(self.changes(self.medic, since)['removed']['requests'], [pending.pk])
+
+    def test_ambulances_leaving_service(self):
+        available = Ambulance.objects.create(vehicle_number='A-1', license_plate='AMB-001')
+        hidden = Ambulance.objects.create(vehicle_number='A-2', license_plate='AMB-002', status='maintenance')
+        since = current_cursor()
+        available.status = 'maintenance'
+        available.save()
+        hidden.license_plate = 'AMB-003'
+        hidden.save()
+
+        self.assertEqual(self.changes(self.patient, since)['removed']['ambulances'], [available.pk])
+        self.assertEqual(self.changes(self.admin, since)['removed']['ambulances'], [])
+
+
+class OfflineSyncTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.patient = User.objects.create_user('patient', password='secret-pass', role='patient')
+        self.medic = User.objects.create_user('medic', password='secret-pass', role='paramedic')
+        self.client = api_client(self.medic)
+        self.request = make_request(self.patient)
+        self.batch = {'operations': [
+            {'key': 'accept-1', 'type': 'status', 'request': self.request.pk, 'status': 'assigned',
+             'recorded_at': '2024-01-01T10:00:00Z'},
+            {'key': 'route-1', 'type': 'status', 'request': self.request.pk, 'status': 'en_route',
+             'recorded_at': '2024-01-01T10:01:00Z'},
+        ]}
+
+    def sync(self):
+        response = self.client.post('/api/v1/paramedic/sync/', self.batch, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_batch_is_applied_once(self):
+        first = self.sync()
+        self.assertEqual([(row['outcome'], row['duplicate']) for row in first], [('applied', False)] * 2)
+        second = self.sync()
+        self.assertEqual([(row['outcome'], row['duplicate']) for row in second], [('applied', True)] * 2)
+
+        self.request.refresh_from_db()
+        self.assertEqual((self.request.status, self.request.paramedic_id), ('en_route', self.medic.pk))
+        self.assertEqual(RequestStatusUpdate.objects.filter(request=self.request).count(), 2)
+        self.assertEqual(SyncOperation.objects.count(), 2)
+
+    def test_concurrent_copy_is_answered_from_recorded_outcomes(self):
+        self.sync()
+        recorded_outcomes = sync.recorded_outcomes
+        looked_up = []
+
+        def committed_after_lookup(user, keys):
+            # The first lookup runs before the other copy commits
+            looked_up.append(keys)
+            return {} if len(looked_up) == 1 else recorded_outcomes(user, keys)
+
+        with mock.patch('ambulance.sync.recorded_outcomes', side_effect=committed_after_lookup):
+            results = self.sync()
+        self.assertEqual(len(looked_up), 2)
+        self.assertEqual([(row['outcome'], row['duplicate']) for row in results], [('applied', True)] * 2)
+        self.assertEqual(RequestStatusUpdate.objects.filter(request=self.request).count(), 2)
+
+
+class IdempotentCreateTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.patient = User.objects.create_user('patient', password='secret-pass', role='patient')
+        self.client = api_client(self.patient)
+        self.data = {
+            'pickup_address': '1 Main Street', 'destination_address': 'City General Hospital',
+            'description': 'chest pain', 'priority': 'high', 'contact_phone': '555-0100',
+        }
+
+    def create(self, data, key='key-1'):
+        return self.client.post('/api/v1/requests/', data, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_the_original_response(self):
+        first = self.create(self.data)
+        self.assertEqual(first.status_code, 201)
+        second = self.create(self.data)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(second.json()['id'], first.json()['id'])
+        self.assertEqual(AmbulanceRequest.objects.count(), 1)
+
+        self.assertEqual(self.create(self.data, key='key-2').status_code, 201)
+        self.assertEqual(AmbulanceRequest.objects.count(), 2)
+
+    def test_key_reused_for_different_data(self):
+        self.create(self.data)
+        response = self.create(dict(self.data, description='broken arm'))
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(AmbulanceRequest.objects.count(), 1)
+
+
+class SparseFieldsetTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.patient = User.objects.create_user('patient', password='secret-pass', role='patient')
+        self.medic = User.objects.create_user('medic', password='secret-pass', role='paramedic')
+        self.request = make_request(self.patient, paramedic=self.medic, status='assigned')
+        self.client = api_client(self.patient)
+
+    def get(self, path, **params):
+        return self.client.get(path, params)
+
+    def test_full_representation_by_default(self):
+        row = self.get('/api/v1/requests/').json()['results'][0]
+        self.assertEqual(row['patient']['username'], 'patient')
+        self.assertEqual(row['paramedic']['username'], 'medic')
+        self.assertIn('description', row)
+
+    def test_fields_collapse_relations_to_ids(self):
+        row = self.get(f'/api/v1/requests/{self.request.pk}/', fields='id,status,paramedic').json()
+        self.assertEqual(row, {'id': self.request.pk, 'status': 'assigned', 'paramedic': self.medic.pk})
+
+    def test_expand_returns_relations_in_full(self):
+        rows = self.get('/api/v1/requests/', fields='id', expand='paramedic').json()['results']
+        self.assertEqual(set(rows[0]), {'id', 'paramedic'})
+        self.assertEqual(rows[0]['paramedic']['username'], 'medic')
+
+        row = self.get(f'/api/v1/requests/{self.request.pk}/', expand='').json()
+        self.assertEqual((row['patient'], row['paramedic']), (self.patient.pk, self.medic.pk))
+        self.assertIn('description', row)
+
+    def test_trimmed_list_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.get('/api/v1/requests/', fields='id,status').status_code, 200)
+        sql = next(query['sql'] for query in queries if 'FROM "ambulance_request"' in query['sql']
+                   and 'COUNT' not in query['sql'])
+        self.assertNotIn('"description"', sql)
+        self.assertNotIn('JOIN', sql)
+
+    def test_unknown_names_are_rejected(self):
+        response = self.get('/api/v1/requests/', fields='id,secret')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'fields': ['Unknown fields: secret.']})
+        response = self.get('/api/v1/requests/', expand='description')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'expand': ['Cannot expand: description.']})
+
+
+@override_settings(RATE_LIMITS={'poll': '2/min', 'emergency': '3/min', 'critical': '5/min'})
+class RateLimitTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.patient = User.objects.create_user('patient', password='secret-pass', role='patient')
+        self.request = RequestFactory().post('/api/v1/requests/')
+
+    def check(self, scope, priority=None, user=None):
+        return ratelimit.check(self.request, scope, user=user or self.patient, priority=priority)
+
+    def test_bucket_refills_over_the_period(self):
+        now = 6000.0
+        self.assertEqual([ratelimit.take('bucket', 2, 60, now)[0] for _ in range(3)], [True, True, False])
+        # Half a period later half of the previous period's tokens have drained
+        self.assertEqual(ratelimit.take('bucket', 2, 60, now + 90), (True, 0))
+        self.assertFalse(ratelimit.take('bucket', 2, 60, now + 90)[0])
+
+    def test_refused_requests_wait_and_give_their_token_back(self):
+        for _ in range(2):
+            self.check('poll')
+        allowed, wait = self.check('poll')
+        self.assertFalse(allowed)
+        self.assertTrue(1 <= wait <= 60)
+        self.assertFalse(self.check('poll')[0])
+        # Buckets are per client
+        other = User.objects.create_user('other', password='secret-pass', role='patient')
+        self.assertTrue(self.check('poll', user=other)[0])
+
+    def test_critical_calls_have_their_own_bounded_bucket(self):
+        self.assertEqual([self.check('emergency', 'high')[0] for _ in range(4)], [True, True, True, False])
+        self.assertEqual([self.check('emergency', 'critical')[0] for _ in range(6)], [True] * 5 + [False])
+        # Neither bucket drew from the other
+        self.assertFalse(self.check('emergency', 'high')[0])
+
+    @override_settings(RATE_LIMITS={'emergency': '3/min'})
+    def test_critical_calls_fall_back_to_the_emergency_rate(self):
+        self.assertEqual([self.check('emergency', 'critical')[0] for _ in range(4)], [True, True, True, False])
+
+    def test_api_create(self):
+        client = api_client(self.patient)
+        data = {
+            'pickup_address': '1 Main Street', 'description': 'chest pain', 'contact_phone': '555-0100',
+            'priority': 'high',
+        }
+        statuses = [client.post('/api/v1/requests/', data, format='json').status_code for _ in range(4)]
+        self.assertEqual(statuses, [201, 201, 201, 429])
+        data['priority'] = 'critical'
+        statuses = [client.post('/api/v1/requests/', data, format='json').status_code for _ in range(6)]
+        self.assertEqual(statuses, [201] * 5 + [429])
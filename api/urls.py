@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from . import views
+from . import async_views, views
 
 # Create a router and register our viewsets with it
 router = DefaultRouter()
@@ -18,8 +18,21 @@ urlpatterns = [
     # Additional API endpoints
     path('dashboard/stats/', views.dashboard_stats, name='dashboard_stats'),
     path('dashboard/recent-requests/', views.recent_requests, name='recent_requests'),
+    path('changes/', views.changes, name='changes'),
+    path('paramedic/sync/', views.sync_operations, name='sync_operations'),
     path('paramedic/toggle-availability/', views.toggle_paramedic_availability, name='toggle_availability'),
     
+    # Async versions of the polled endpoints (best served through emergency_ambulance.asgi)
+    path('async/dashboard/stats/', async_views.dashboard_stats, name='async_dashboard_stats'),
+    path('async/dashboard/recent-requests/', async_views.recent_requests, name='async_recent_requests'),
+    path('async/paramedics/available/', async_views.available_paramedics, name='async_available_paramedics'),
+    path('async/ambulances/available/', async_views.available_ambulances, name='async_available_ambulances'),
+    
+    # Signed API tokens
+    path('auth/token/', views.obtain_token, name='obtain_token'),
+    path('auth/token/refresh/', views.refresh_token, name='refresh_token'),
+    path('auth/token/revoke/', views.revoke_current_token, name='revoke_token'),
+    
     # DRF Auth
     path('auth/', include('rest_framework.urls', namespace='rest_framework')),
 ]
@@ -1,51 +1,201 @@
+import math
+
 from rest_framework import viewsets, status, permissions
-from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.decorators import action, api_view, authentication_classes, permission_classes, throttle_classes
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
-from django.contrib.auth import get_user_model
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from django.contrib.auth import authenticate, get_user_model
+from django.db import IntegrityError, transaction
+from django.conf import settings
 from django.db.models import Q, Count
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from accounts.models import UserProfile
+from accounts.search import prefix_search, role_counts
+from ambulance.archive import get_request
+from ambulance.changes import changes_since, current_cursor, seen_ids
+from ambulance.fleet import fleet
+from ambulance.idempotency import MAX_KEY_LENGTH, claim, complete, fingerprint, lookup
 from ambulance.models import AmbulanceRequest, RequestStatusUpdate, Ambulance
+from ambulance.geocoding import schedule_geocode
+from ambulance.search import search_requests
+from ambulance.spatial import within_radius
+from ambulance.sync import apply_operations
+from ambulance.tracks import replay
+from emergency_ambulance.ratelimit import EmergencyThrottle, PollThrottle
+from .authentication import (
+    SignedTokenAuthentication, issue_token, revoke_token, revoke_user_tokens
+)
 from .serializers import (
     UserSerializer, UserProfileSerializer, ParamedicSerializer,
     AmbulanceRequestSerializer, AmbulanceRequestCreateSerializer,
     RequestStatusUpdateSerializer, AmbulanceSerializer,
-    AssignParamedicSerializer, StatusUpdateSerializer, DashboardStatsSerializer
+    AssignParamedicSerializer, StatusUpdateSerializer, DashboardStatsSerializer, SyncBatchSerializer,
+    SparseFieldsMixin
 )
 
 User = get_user_model()
 
+CHANGES_PAGE_SIZE = 500
+CHANGES_MAX_PAGE_SIZE = 1000
+
+
+def visible_requests(user):
+    """Requests a user may see through the API"""
+    queryset = AmbulanceRequest.objects.all()
+    if user.is_patient():
+        queryset = queryset.filter(patient=user)
+    elif user.is_paramedic():
+        queryset = queryset.filter(
+            Q(paramedic=user) | Q(status='pending')
+        )
+    return queryset
+
+
+def visible_ambulances(user):
+    """Ambulances a user may see through the API"""
+    if user.is_admin_user():
+        return Ambulance.objects.all()
+    elif user.is_paramedic():
+        return Ambulance.objects.filter(
+            Q(assigned_paramedic=user) | Q(status='available')
+        )
+    else:
+        return Ambulance.objects.filter(status='available')
+
+
+def seen_requests(user):
+    """Change log entries of requests the user could see before or after the change"""
+    if user.is_patient():
+        return Q(owner_id=user.pk)
+    elif user.is_paramedic():
+        return Q(assignee_id=user.pk) | Q(previous_assignee_id=user.pk) | Q(public=True)
+    return Q()
+
 
-class UserViewSet(viewsets.ReadOnlyModelViewSet):
+def seen_ambulances(user):
+    """Change log entries of ambulances the user could see before or after the change"""
+    if user.is_admin_user():
+        return Q()
+    elif user.is_paramedic():
+        return Q(assignee_id=user.pk) | Q(previous_assignee_id=user.pk) | Q(public=True)
+    else:
+        return Q(public=True)
+
+
+def near_params(query_params):
+    """(latitude, longitude, radius_km) from ?near=lat,lng&radius_km=, or None without near"""
+    near = query_params.get('near')
+    if not near:
+        return None
+    try:
+        latitude, longitude = (float(value) for value in near.split(','))
+        if not (math.isfinite(latitude) and math.isfinite(longitude)) or abs(latitude) > 90 or abs(longitude) > 180:
+            raise ValueError
+    except ValueError:
+        raise ValidationError({'near': ['Expected "latitude,longitude" in degrees.']})
+    
+    max_radius = settings.NEAR_MAX_RADIUS_KM
+    try:
+        radius_km = float(query_params.get('radius_km', settings.NEAR_DEFAULT_RADIUS_KM))
+        if not 0 < radius_km <= max_radius:
+            raise ValueError
+    except ValueError:
+        raise ValidationError({'radius_km': [f'Expected a distance in km above 0 and at most {max_radius}.']})
+    return latitude, longitude, radius_km
+
+
+def fieldset_params(query_params):
+    """(fields, expand) name lists from ?fields=a,b&expand=c; None for a parameter not given"""
+    fields, expand = query_params.get('fields'), query_params.get('expand')
+    fields = [name.strip() for name in fields.split(',') if name.strip()] if fields else None
+    expand = [name.strip() for name in expand.split(',') if name.strip()] if expand is not None else None
+    return fields, expand
+
+
+class SparseFieldsetMixin:
+    """
+    Viewset whose GET responses honour ?fields= and ?expand=, with list and
+    detail querysets loading only the columns and relations those need
+    """
+    
+    def get_fieldset(self):
+        if self.request is None or self.request.method != 'GET':
+            return None, None
+        return fieldset_params(self.request.query_params)
+    
+    def trim_queryset(self, queryset):
+        serializer_class = self.get_serializer_class()
+        if not issubclass(serializer_class, SparseFieldsMixin):
+            return queryset
+        return serializer_class.trim_queryset(queryset, *self.get_fieldset())
+    
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        # Actions that write load whole rows
+        if self.action in ('list', 'retrieve'):
+            queryset = self.trim_queryset(queryset)
+        return queryset
+    
+    def get_serializer(self, *args, **kwargs):
+        fields, expand = self.get_fieldset()
+        if fields is not None or expand is not None:
+            kwargs.update(fields=fields, expand=expand)
+        return super().get_serializer(*args, **kwargs)
+
+
+class UserViewSet(SparseFieldsetMixin, viewsets.ReadOnlyModelViewSet):
     """API ViewSet for User model"""
     
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        if self.request.user.is_admin_user():
-            return User.objects.all()
-        else:
+        if not self.request.user.is_admin_user():
             return User.objects.filter(id=self.request.user.id)
+        
+        queryset = User.objects.all().order_by('-date_joined')
+        
+        # Filter by role
+        role = self.request.query_params.get('role')
+        if role:
+            queryset = queryset.filter(role=role)
+        
+        # Indexed prefix search on username, email and phone
+        search = self.request.query_params.get('search')
+        if search:
+            queryset = prefix_search(queryset, search)
+        
+        return queryset
+    
+    @action(detail=False, methods=['get'])
+    def role_counts(self, request):
+        """Get user totals per role (Admin only)"""
+        if not request.user.is_admin_user():
+            return Response(
+                {'error': 'Permission denied'}, 
+                status=status.HTTP_403_FORBIDDEN
+            )
+        return Response(role_counts(User.objects.all()))
     
     @action(detail=False, methods=['get'])
     def profile(self, request):
         """Get current user's profile"""
-        serializer = UserSerializer(request.user)
+        serializer = UserSerializer(request.user, context={'request': request})
         return Response(serializer.data)
     
     @action(detail=False, methods=['put', 'patch'])
     def update_profile(self, request):
         """Update current user's profile"""
-        serializer = UserSerializer(request.user, data=request.data, partial=True)
+        serializer = UserSerializer(request.user, data=request.data, partial=True, context={'request': request})
         if serializer.is_valid():
             serializer.save()
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class ParamedicViewSet(viewsets.ReadOnlyModelViewSet):
+class ParamedicViewSet(SparseFieldsetMixin, viewsets.ReadOnlyModelViewSet):
     """API ViewSet for Paramedic users"""
     
     serializer_class = ParamedicSerializer
@@ -54,15 +204,15 @@ class ParamedicViewSet(viewsets.ReadOnlyModelViewSet):
     def get_queryset(self):
         return User.objects.filter(role='paramedic')
     
-    @action(detail=False, methods=['get'])
+    @action(detail=False, methods=['get'], throttle_classes=[PollThrottle])
     def available(self, request):
         """Get available paramedics"""
-        paramedics = User.objects.filter(role='paramedic', is_available=True)
+        paramedics = self.trim_queryset(User.objects.filter(role='paramedic', is_available=True))
         serializer = self.get_serializer(paramedics, many=True)
         return Response(serializer.data)
 
 
-class AmbulanceRequestViewSet(viewsets.ModelViewSet):
+class AmbulanceRequestViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     """API ViewSet for AmbulanceRequest model"""
     
     permission_classes = [IsAuthenticated]
@@ -72,16 +222,16 @@ class AmbulanceRequestViewSet(viewsets.ModelViewSet):
             return AmbulanceRequestCreateSerializer
         return AmbulanceRequestSerializer
     
+    def get_throttles(self):
+        # Calls for help and status changes have their own allowance, apart from list polling
+        if self.action in ('create', 'assign_paramedic', 'update_status', 'accept'):
+            return [EmergencyThrottle()]
+        if self.action == 'list':
+            return [PollThrottle()]
+        return super().get_throttles()
+    
     def get_queryset(self):
-        user = self.request.user
-        queryset = AmbulanceRequest.objects.all()
-        
-        if user.is_patient():
-            queryset = queryset.filter(patient=user)
-        elif user.is_paramedic():
-            queryset = queryset.filter(
-                Q(paramedic=user) | Q(status='pending')
-            )
+        queryset = visible_requests(self.request.user)
         
         # Filter by status
         status_filter = self.request.query_params.get('status')
@@ -93,10 +243,56 @@ class AmbulanceRequestViewSet(viewsets.ModelViewSet):
         if priority_filter:
             queryset = queryset.filter(priority=priority_filter)
         
-        return queryset.order_by('-created_at')
+        # Radius search around a point, nearest first
+        near = near_params(self.request.query_params)
+        if near:
+            queryset = within_radius(queryset, *near)
+        
+        # Full-text search, ranked by relevance unless sorted by distance
+        search = self.request.query_params.get('search')
+        if search:
+            return search_requests(queryset, search, ranked=not near)
+        
+        return queryset if near else queryset.order_by('-created_at')
+    
+    def create(self, request, *args, **kwargs):
+        """Create a request; a retry with the same Idempotency-Key gets the original response"""
+        key = request.headers.get('Idempotency-Key', '').strip()
+        if not key:
+            return super().create(request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {'error': f'Idempotency-Key must be at most {MAX_KEY_LENGTH} characters'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        data_fingerprint = fingerprint(request.data)
+        try:
+            replay = lookup(request.user, 'request_api', key)
+            if replay is None:
+                serializer = self.get_serializer(data=request.data)
+                serializer.is_valid(raise_exception=True)
+                with transaction.atomic():
+                    entry = claim(request.user, 'request_api', key, data_fingerprint)
+                    self.perform_create(serializer)
+                    complete(entry, status.HTTP_201_CREATED, serializer.data)
+                return Response(serializer.data, status=status.HTTP_201_CREATED)
+        except IntegrityError:
+            # Another copy of this request committed first
+            replay = lookup(request.user, 'request_api', key)
+            if replay is None:
+                raise
+        
+        if replay.fingerprint != data_fingerprint:
+            return Response(
+                {'error': 'Idempotency-Key was already used for a different request'},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY
+            )
+        return Response(replay.response_body, status=replay.response_status, headers={'Idempotent-Replayed': 'true'})
     
     def perform_create(self, serializer):
-        serializer.save(patient=self.request.user)
+        ambulance_request = serializer.save(patient=self.request.user)
+        schedule_geocode(ambulance_request)
     
     @action(detail=True, methods=['post'])
     def assign_paramedic(self, request, pk=None):
@@ -115,21 +311,23 @@ class AmbulanceRequestViewSet(viewsets.ModelViewSet):
             notes = serializer.validated_data.get('notes', '')
             
             paramedic = get_object_or_404(User, id=paramedic_id, role='paramedic')
-            old_status = ambulance_request.status
-            ambulance_request.assign_paramedic(paramedic)
-            
-            # Create status update record
-            RequestStatusUpdate.objects.create(
-                request=ambulance_request,
-                updated_by=request.user,
-                old_status=old_status,
-                new_status='assigned',
-                notes=notes
-            )
+            # Save the change, its history record and queued notifications together
+            with transaction.atomic():
+                old_status = ambulance_request.status
+                ambulance_request.assign_paramedic(paramedic)
+                
+                # Create status update record
+                RequestStatusUpdate.objects.create(
+                    request=ambulance_request,
+                    updated_by=request.user,
+                    old_status=old_status,
+                    new_status='assigned',
+                    notes=notes
+                )
             
             return Response({
                 'message': f'Request assigned to {paramedic.get_full_name() or paramedic.username}',
-                'request': AmbulanceRequestSerializer(ambulance_request).data
+                'request': AmbulanceRequestSerializer(ambulance_request, context={'request': request}).data
             })
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -153,33 +351,35 @@ class AmbulanceRequestViewSet(viewsets.ModelViewSet):
         )
         
         if serializer.is_valid():
-            old_status = ambulance_request.status
-            new_status = serializer.validated_data['status']
-            notes = serializer.validated_data.get('notes', '')
-            
-            # Update request status
-            ambulance_request.status = new_status
-            if new_status == 'arrived':
-                ambulance_request.mark_arrived()
-            elif new_status == 'completed':
-                ambulance_request.mark_completed()
-            elif new_status == 'cancelled':
-                ambulance_request.cancel_request()
-            else:
-                ambulance_request.save()
-            
-            # Create status update record
-            RequestStatusUpdate.objects.create(
-                request=ambulance_request,
-                updated_by=request.user,
-                old_status=old_status,
-                new_status=new_status,
-                notes=notes
-            )
+            # Save the change, its history record and queued notifications together
+            with transaction.atomic():
+                old_status = ambulance_request.status
+                new_status = serializer.validated_data['status']
+                notes = serializer.validated_data.get('notes', '')
+                
+                # Update request status
+                ambulance_request.status = new_status
+                if new_status == 'arrived':
+                    ambulance_request.mark_arrived()
+                elif new_status == 'completed':
+                    ambulance_request.mark_completed()
+                elif new_status == 'cancelled':
+                    ambulance_request.cancel_request()
+                else:
+                    ambulance_request.save()
+                
+                # Create status update record
+                RequestStatusUpdate.objects.create(
+                    request=ambulance_request,
+                    updated_by=request.user,
+                    old_status=old_status,
+                    new_status=new_status,
+                    notes=notes
+                )
             
             return Response({
                 'message': f'Status updated to {ambulance_request.get_status_display()}',
-                'request': AmbulanceRequestSerializer(ambulance_request).data
+                'request': AmbulanceRequestSerializer(ambulance_request, context={'request': request}).data
             })
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -194,21 +394,23 @@ class AmbulanceRequestViewSet(viewsets.ModelViewSet):
             )
         
         ambulance_request = get_object_or_404(AmbulanceRequest, pk=pk, status='pending')
-        old_status = ambulance_request.status
-        ambulance_request.assign_paramedic(request.user)
-        
-        # Create status update record
-        RequestStatusUpdate.objects.create(
-            request=ambulance_request,
-            updated_by=request.user,
-            old_status=old_status,
-            new_status='assigned',
-            notes='Request accepted by paramedic'
-        )
+        # Save the change, its history record and queued notifications together
+        with transaction.atomic():
+            old_status = ambulance_request.status
+            ambulance_request.assign_paramedic(request.user)
+            
+            # Create status update record
+            RequestStatusUpdate.objects.create(
+                request=ambulance_request,
+                updated_by=request.user,
+                old_status=old_status,
+                new_status='assigned',
+                notes='Request accepted by paramedic'
+            )
         
         return Response({
             'message': 'Request accepted successfully',
-            'request': AmbulanceRequestSerializer(ambulance_request).data
+            'request': AmbulanceRequestSerializer(ambulance_request, context={'request': request}).data
         })
     
     @action(detail=True, methods=['get'])
@@ -218,34 +420,48 @@ class AmbulanceRequestViewSet(viewsets.ModelViewSet):
         status_updates = ambulance_request.status_updates.all().order_by('-timestamp')
         serializer = RequestStatusUpdateSerializer(status_updates, many=True)
         return Response(serializer.data)
+    
+    @action(detail=True, methods=['get'])
+    def replay(self, request, pk=None):
+        """Get the route driven for a request merged with its status history (Admin only)"""
+        if not request.user.is_admin_user():
+            return Response(
+                {'error': 'Permission denied'}, 
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        # Archived requests keep their tracks
+        if not str(pk).isdigit():
+            raise Http404
+        return Response(replay(get_request(int(pk))))
 
 
-class AmbulanceViewSet(viewsets.ModelViewSet):
+class AmbulanceViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     """API ViewSet for Ambulance model"""
     
     serializer_class = AmbulanceSerializer
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        if self.request.user.is_admin_user():
-            return Ambulance.objects.all()
-        elif self.request.user.is_paramedic():
-            return Ambulance.objects.filter(
-                Q(assigned_paramedic=self.request.user) | Q(status='available')
-            )
-        else:
-            return Ambulance.objects.filter(status='available')
+        queryset = visible_ambulances(self.request.user)
+        
+        # Radius search around a point, nearest first
+        near = near_params(self.request.query_params)
+        if near:
+            queryset = within_radius(queryset, *near)
+        return queryset
     
-    @action(detail=False, methods=['get'])
+    @action(detail=False, methods=['get'], throttle_classes=[PollThrottle])
     def available(self, request):
         """Get available ambulances"""
-        ambulances = Ambulance.objects.filter(status='available')
-        serializer = self.get_serializer(ambulances, many=True)
+        # Served from the in-process fleet registry
+        serializer = self.get_serializer(fleet.available(), many=True)
         return Response(serializer.data)
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@throttle_classes([PollThrottle])
 def dashboard_stats(request):
     """Get dashboard statistics"""
     user = request.user
@@ -275,6 +491,7 @@ def dashboard_stats(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@throttle_classes([PollThrottle])
 def recent_requests(request):
     """Get recent requests based on user role"""
     user = request.user
@@ -289,10 +506,97 @@ def recent_requests(request):
         requests = AmbulanceRequest.objects.all()
     
     requests = requests.order_by('-created_at')[:10]
-    serializer = AmbulanceRequestSerializer(requests, many=True)
+    serializer = AmbulanceRequestSerializer(requests, many=True, context={'request': request})
     return Response(serializer.data)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([PollThrottle])
+def changes(request):
+    """Requests and ambulances changed since a cursor (delta sync)"""
+    try:
+        since = request.query_params.get('since')
+        since = None if since is None else int(since)
+        limit = min(int(request.query_params.get('limit', CHANGES_PAGE_SIZE)), CHANGES_MAX_PAGE_SIZE)
+        if (since is not None and since < 0) or limit < 1:
+            raise ValueError
+    except ValueError:
+        return Response(
+            {'error': 'since and limit must be non-negative integers'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    # Without a cursor the client loads the full lists first and continues from here
+    if since is None:
+        return Response({
+            'cursor': current_cursor(), 'has_more': False, 'reset': True,
+            'requests': [], 'ambulances': [], 'removed': {'requests': [], 'ambulances': []},
+        })
+    
+    ids, cursor, has_more, reset = changes_since(since, limit)
+    requests = list(
+        visible_requests(request.user).filter(pk__in=ids['request']).select_related('patient', 'paramedic')
+    )
+    ambulances = list(
+        visible_ambulances(request.user).filter(pk__in=ids['ambulance']).select_related('assigned_paramedic')
+    )
+    # Deleted rows and rows the user can no longer see are both removed from the client's copy,
+    # but only when the log shows the user could see them around one of the changes
+    removed = {
+        'requests': seen_ids(
+            'request', ids['request'] - {row.pk for row in requests}, since, cursor,
+            seen_requests(request.user)
+        ),
+        'ambulances': seen_ids(
+            'ambulance', ids['ambulance'] - {row.pk for row in ambulances}, since, cursor,
+            seen_ambulances(request.user)
+        ),
+    }
+    context = {'request': request}
+    return Response({
+        'cursor': cursor,
+        'has_more': has_more,
+        'reset': reset,
+        'requests': AmbulanceRequestSerializer(requests, many=True, context=context).data,
+        'ambulances': AmbulanceSerializer(ambulances, many=True, context=context).data,
+        'removed': removed,
+    })
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([EmergencyThrottle])
+def sync_operations(request):
+    """Apply status transitions and location stamps queued while offline (Paramedic or Admin)"""
+    user = request.user
+    if not (user.is_paramedic() or user.is_admin_user()):
+        return Response(
+            {'error': 'Permission denied'}, 
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    serializer = SyncBatchSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    operations = serializer.validated_data['operations']
+    results = apply_operations(user, operations)
+    
+    # Reconciled state: the user's open requests and every request the batch referred to
+    touched = {operation['request'] for operation in operations if operation['type'] == 'status'}
+    requests = visible_requests(user).filter(
+        Q(paramedic=user, status__in=['assigned', 'en_route', 'arrived']) | Q(pk__in=touched)
+    ).select_related('patient', 'paramedic').order_by('-created_at')
+    ambulance = fleet.for_paramedic(user.pk)
+    context = {'request': request}
+    return Response({
+        'results': results,
+        'requests': AmbulanceRequestSerializer(requests, many=True, context=context).data,
+        'ambulance': AmbulanceSerializer(ambulance, context=context).data if ambulance else None,
+    })
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def toggle_paramedic_availability(request):
@@ -310,3 +614,45 @@ def toggle_paramedic_availability(request):
         'is_available': request.user.is_available,
         'status_text': 'Available' if request.user.is_available else 'Unavailable'
     })
+
+
+@api_view(['POST'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def obtain_token(request):
+    """Exchange username and password for a signed API token"""
+    user = authenticate(
+        request,
+        username=request.data.get('username'),
+        password=request.data.get('password'),
+    )
+    if user is None:
+        return Response(
+            {'error': 'Invalid username or password'},
+            status=status.HTTP_401_UNAUTHORIZED
+        )
+    
+    token, expires_in = issue_token(user)
+    return Response({'token': token, 'token_type': 'Bearer', 'expires_in': expires_in})
+
+
+@api_view(['POST'])
+@authentication_classes([SignedTokenAuthentication])
+@permission_classes([IsAuthenticated])
+def refresh_token(request):
+    """Issue a fresh token and revoke the one used for this request"""
+    token, expires_in = issue_token(request.user)
+    revoke_token(request.auth)
+    return Response({'token': token, 'token_type': 'Bearer', 'expires_in': expires_in})
+
+
+@api_view(['POST'])
+@authentication_classes([SignedTokenAuthentication])
+@permission_classes([IsAuthenticated])
+def revoke_current_token(request):
+    """Revoke the token used for this request (or all of the user's tokens)"""
+    if request.data.get('all'):
+        revoke_user_tokens(request.user.pk)
+    else:
+        revoke_token(request.auth)
+    return Response(status=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,115 @@
+"""
+Benchmark scripts for the Emergency Ambulance Request System.
+
+Each module is runnable on its own, for example::
+
+    python -m benchmarks.fulltext_search --rows 1000000
+
+Benchmarks run against a throwaway test database (in-memory SQLite unless
+``--db-file`` is given), never against ``db.sqlite3``.
+"""
+
+import json
+import os
+import statistics
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup_django():
+    """Configure Django for a standalone benchmark script"""
+    if str(BASE_DIR) not in sys.path:
+        sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'emergency_ambulance.settings')
+
+    import django
+    django.setup()
+
+    # Benchmarks drive the views far beyond any client's rate limit; they measure the views
+    from django.conf import settings
+    settings.RATE_LIMITS = {}
+
+
+def add_common_arguments(parser):
+    parser.add_argument('--db-file', default=None,
+                        help='Run against this SQLite file instead of an in-memory database')
+    parser.add_argument('--output', default=None,
+                        help='Write the JSON report to this path')
+
+
+@contextmanager
+def bench_database(db_file=None):
+    """Create a fresh, fully migrated database for the duration of a benchmark"""
+    from django.conf import settings
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    if db_file:
+        settings.DATABASES['default'].setdefault('TEST', {})['NAME'] = db_file
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        with connection.cursor() as cursor:
+            # Loading speed matters more than durability for throwaway data
+            cursor.execute('PRAGMA synchronous = OFF')
+            cursor.execute('PRAGMA journal_mode = MEMORY')
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+@contextmanager
+def count_queries(connection):
+    """Collect the SQL run on connection (unaffected by reset_queries between requests)"""
+    queries = []
+
+    def wrapper(execute, sql, params, many, context):
+        queries.append(sql)
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(wrapper):
+        yield queries
+
+
+def time_call(func, repeat=5, warmup=1):
+    """Run func repeatedly and return timing statistics in milliseconds"""
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return summarize(samples)
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+    return {
+        'runs': len(ordered),
+        'min_ms': round(ordered[0], 3),
+        'median_ms': round(statistics.median(ordered), 3),
+        'p95_ms': round(percentile(ordered, 95), 3),
+        'p99_ms': round(percentile(ordered, 99), 3),
+        'max_ms': round(ordered[-1], 3),
+    }
+
+
+def percentile(ordered, pct):
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def write_report(report, output=None):
+    """Print a JSON report and optionally save it to a file"""
+    text = json.dumps(report, indent=2, default=str)
+    print(text)
+    if output:
+        Path(output).write_text(text + '\n')
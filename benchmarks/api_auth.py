@@ -0,0 +1,84 @@
+"""
+Compare authenticated API throughput with signed tokens and with sessions.
+
+Tokens are measured twice: with the per-process cache of the default
+settings, where each request checks revocations with one query, and as with
+a shared cache (``token_shared_cache``), where revocations are read from the
+cache and verifying a token needs no query.
+
+    python -m benchmarks.api_auth --requests 2000
+"""
+
+import argparse
+import time
+from unittest import mock
+
+from benchmarks import (
+    add_common_arguments, bench_database, count_queries, setup_django, summarize, write_report
+)
+
+ENDPOINTS = ['/api/v1/dashboard/recent-requests/', '/api/v1/users/']
+
+
+def make_clients(user):
+    from django.test import Client
+    from api.authentication import issue_token
+
+    session_client = Client()
+    session_client.force_login(user)
+
+    token, _ = issue_token(user)
+    token_client = Client(HTTP_AUTHORIZATION=f'Bearer {token}')
+    return {'session': session_client, 'token': token_client}
+
+
+def measure(client, path, requests):
+    from django.db import connection
+
+    with count_queries(connection) as queries:
+        response = client.get(path)
+    assert response.status_code == 200, (path, response.status_code)
+
+    samples = []
+    start = time.perf_counter()
+    for _ in range(requests):
+        began = time.perf_counter()
+        client.get(path)
+        samples.append((time.perf_counter() - began) * 1000)
+    elapsed = time.perf_counter() - start
+    return {
+        'queries_per_request': len(queries),
+        'requests_per_second': round(requests / elapsed, 1),
+        'latency': summarize(samples),
+    }
+
+
+def run(requests, db_file):
+    report = {'benchmark': 'api_auth', 'requests': requests, 'endpoints': {}}
+    with bench_database(db_file):
+        from accounts.models import User
+
+        user = User.objects.create_user(username='bench_patient', password='bench-pass', role='patient')
+        clients = make_clients(user)
+        for path in ENDPOINTS:
+            report['endpoints'][path] = {
+                name: measure(client, path, requests) for name, client in clients.items()
+            }
+            # The locmem cache stands in for a shared one; only this process reads it here
+            with mock.patch('api.authentication.user_cache_enabled', return_value=True):
+                report['endpoints'][path]['token_shared_cache'] = measure(clients['token'], path, requests)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=2000)
+    add_common_arguments(parser)
+    args = parser.parse_args()
+
+    setup_django()
+    write_report(run(args.requests, args.db_file), args.output)
+
+
+if __name__ == '__main__':
+    main()
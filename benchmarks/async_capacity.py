@@ -0,0 +1,212 @@
+"""
+Concurrent-client capacity of the polled endpoints: WSGI worker threads vs ASGI.
+
+    python -m benchmarks.async_capacity --clients 1,10,50,200 --db-latency 5
+
+Django's real WSGIHandler and ASGIHandler are driven in-process, so no server
+needs to be installed:
+
+* ``wsgi`` - the DRF views on a pool of ``--wsgi-threads`` threads, like a
+  threaded WSGI server; a poll holds a thread until its queries return
+* ``asgi_sync`` - the same DRF views behind ASGIHandler, which runs them on
+  a thread per in-flight request
+* ``asgi`` - the async views from ``api.async_views`` on one event loop
+
+Each client polls the four endpoints in turn, closed loop, for ``--seconds``.
+A local SQLite database answers in microseconds, which hides the waiting the
+async views are meant to avoid, so ``--db-latency`` adds a fixed delay to
+every query, like the round trip to a networked database server.
+"""
+
+import argparse
+import asyncio
+import io
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import add_common_arguments, bench_database, setup_django, summarize, write_report
+
+SYNC_PATHS = [
+    '/api/v1/dashboard/stats/',
+    '/api/v1/dashboard/recent-requests/',
+    '/api/v1/paramedics/available/',
+    '/api/v1/ambulances/available/',
+]
+ASYNC_PATHS = [
+    '/api/v1/async/dashboard/stats/',
+    '/api/v1/async/dashboard/recent-requests/',
+    '/api/v1/async/paramedics/available/',
+    '/api/v1/async/ambulances/available/',
+]
+
+
+def add_db_latency(seconds):
+    """Delay every query on every connection, including ones opened later by other threads"""
+    from django.db import connections
+    from django.db.backends.signals import connection_created
+
+    def slow(execute, sql, params, many, context):
+        time.sleep(seconds)
+        return execute(sql, params, many, context)
+
+    def install(sender, connection, **kwargs):
+        if slow not in connection.execute_wrappers:
+            connection.execute_wrappers.append(slow)
+
+    connection_created.connect(install, weak=False)
+    install(None, connections['default'])
+
+
+def wsgi_environ(path, token):
+    return {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'SCRIPT_NAME': '', 'QUERY_STRING': '',
+        'SERVER_NAME': 'testserver', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+        'REMOTE_ADDR': '127.0.0.1', 'HTTP_AUTHORIZATION': f'Bearer {token}',
+        'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+    }
+
+
+def run_wsgi(paths, token, clients, seconds, threads):
+    from django.core.handlers.wsgi import WSGIHandler
+
+    app = WSGIHandler()
+    samples, errors = [], []
+    deadline = time.perf_counter() + seconds
+
+    def call(path):
+        status = []
+        body = app(wsgi_environ(path, token), lambda code, headers, exc_info=None: status.append(code))
+        try:
+            for _ in body:
+                pass
+        finally:
+            body.close()
+        return int(status[0].split()[0])
+
+    def client(offset):
+        with_pool = pool.submit
+        index = offset
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            code = with_pool(call, paths[index % len(paths)]).result()
+            (samples if code == 200 else errors).append((time.perf_counter() - start) * 1000)
+            index += 1
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        workers = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    return samples, errors
+
+
+async def asgi_get(app, path, token):
+    """Send one GET through an ASGI application and return the status code"""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+        'headers': [(b'host', b'testserver'), (b'authorization', f'Bearer {token}'.encode())],
+        'client': ('127.0.0.1', 50000), 'server': ('testserver', 80),
+    }
+    sent = asyncio.Event()
+    status = []
+
+    async def receive():
+        if not sent.is_set():
+            sent.set()
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # The client never disconnects; Django cancels this wait once the response is sent
+        await asyncio.Future()
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+
+    await app(scope, receive, send)
+    return status[0]
+
+
+def run_asgi(paths, token, clients, seconds):
+    from django.core.handlers.asgi import ASGIHandler
+
+    app = ASGIHandler()
+    samples, errors = [], []
+
+    async def client(offset, deadline):
+        index = offset
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            code = await asgi_get(app, paths[index % len(paths)], token)
+            (samples if code == 200 else errors).append((time.perf_counter() - start) * 1000)
+            index += 1
+
+    async def main():
+        deadline = time.perf_counter() + seconds
+        await asyncio.gather(*(client(i, deadline) for i in range(clients)))
+
+    asyncio.run(main())
+    return samples, errors
+
+
+def seed():
+    from django.core.management import call_command
+
+    from accounts.models import User
+    from ambulance.models import Ambulance
+    from api.authentication import issue_token
+
+    call_command('seed_synthetic', users=500, requests=5000, ambulances=50, days=7, verbosity=0)
+    Ambulance.objects.filter(pk__in=list(Ambulance.objects.values_list('pk', flat=True)[::3])).update(
+        status='available'
+    )
+    token, _ = issue_token(User.objects.filter(role='paramedic').first())
+    return token
+
+
+def run(db_file, levels, seconds, threads, db_latency):
+    report = {
+        'benchmark': 'async_capacity', 'seconds': seconds, 'wsgi_threads': threads,
+        'db_latency_ms': db_latency, 'levels': {},
+    }
+    with bench_database(db_file):
+        token = seed()
+        add_db_latency(db_latency / 1000)
+        modes = {
+            'wsgi': lambda clients: run_wsgi(SYNC_PATHS, token, clients, seconds, threads),
+            'asgi_sync': lambda clients: run_asgi(SYNC_PATHS, token, clients, seconds),
+            'asgi': lambda clients: run_asgi(ASYNC_PATHS, token, clients, seconds),
+        }
+        for clients in levels:
+            level = report['levels'][str(clients)] = {}
+            for mode, measure in modes.items():
+                samples, errors = measure(clients)
+                level[mode] = {
+                    'requests': len(samples),
+                    'requests_per_second': round(len(samples) / seconds, 1),
+                    'errors': len(errors),
+                    'latency': summarize(samples) if samples else None,
+                }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', default='1,10,50,200',
+                        help='Comma-separated numbers of concurrent polling clients')
+    parser.add_argument('--seconds', type=float, default=5.0, help='Duration of each measurement')
+    parser.add_argument('--wsgi-threads', type=int, default=8, help='Worker threads of the WSGI server model')
+    parser.add_argument('--db-latency', type=float, default=5.0, help='Milliseconds added to every query')
+    add_common_arguments(parser)
+    args = parser.parse_args()
+
+    setup_django()
+    levels = [int(level) for level in args.clients.split(',')]
+    write_report(run(args.db_file, levels, args.seconds, args.wsgi_threads, args.db_latency), args.output)
+
+
+if __name__ == '__main__':
+    main()
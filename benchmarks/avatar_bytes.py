@@ -0,0 +1,131 @@
+"""
+Image bytes a browser downloads per page render for avatars, originals vs thumbnails.
+
+    python -m benchmarks.avatar_bytes --users 25 --width 2400 --height 1800
+
+Every user gets a camera-sized JPEG (with EXIF) as profile image. Each page
+is rendered twice through the test client with an empty media directory for
+thumbnails: the cold render links to the lazy ``accounts:avatar`` view, so
+fetching its images generates the thumbnails; the warm render links straight
+to the stored files. For each render the report lists the HTML size, the
+bytes of the ``<img>`` sources fetched (following redirects) and what the
+same avatars would have cost as full-size originals.
+"""
+
+import argparse
+import io
+import re
+import tempfile
+import time
+
+from benchmarks import add_common_arguments, bench_database, setup_django, write_report
+
+IMG_SRC = re.compile(r'<img src="([^"]+)"')
+
+# (role of the viewer, path); {user} is filled with a user that has a profile image
+PAGES = [
+    ('admin', '/accounts/manage-users/'),
+    ('admin', '/accounts/admin/edit-user/{user}/'),
+    ('patient', '/accounts/profile/'),
+]
+
+
+def photo(width, height, seed):
+    """A JPEG with some texture (so it compresses like a photo) and an EXIF orientation tag"""
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width]
+    base = np.stack([x * 255 // width, y * 255 // height, (x + y) * 255 // (width + height)], axis=-1)
+    pixels = np.clip(base + rng.normal(0, 18, base.shape), 0, 255).astype(np.uint8)
+    exif = Image.Exif()
+    exif[0x0112] = 1  # Orientation
+    exif[0x010F] = 'Benchmark Camera'  # Make
+    output = io.BytesIO()
+    Image.fromarray(pixels).save(output, 'JPEG', quality=90, exif=exif)
+    return output.getvalue()
+
+
+def seed(count, width, height):
+    from django.core.files.base import ContentFile
+
+    from accounts.models import User, UserProfile
+
+    users = []
+    for index in range(count):
+        role = 'admin' if index == 0 else 'patient'
+        user = User.objects.create_user(username=f'bench_{index}', password='bench-pass', role=role)
+        UserProfile.objects.create(user=user)
+        user.profile_image.save(f'photo_{index}.jpg', ContentFile(photo(width, height, index)))
+        users.append(user)
+    return users
+
+
+def fetch(client, url):
+    """Bytes of the final response for url, following redirects"""
+    response = client.get(url, follow=True)
+    assert response.status_code == 200, (url, response.status_code)
+    if response.streaming:
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.content)
+
+
+def render(client, path, original_bytes):
+    start = time.perf_counter()
+    response = client.get(path)
+    assert response.status_code == 200, (path, response.status_code)
+    sources = IMG_SRC.findall(response.content.decode())
+    image_bytes = sum(fetch(client, src) for src in sources)
+    return {
+        'ms': round((time.perf_counter() - start) * 1000, 1),
+        'html_bytes': len(response.content),
+        'images': len(sources),
+        'image_bytes': image_bytes,
+        'original_bytes': sum(original_bytes.get(src, 0) for src in sources),
+    }
+
+
+def run(db_file, count, width, height):
+    from django.core.cache import cache
+    from django.test import Client, override_settings
+
+    from accounts.thumbnails import SIZES, avatar_url
+
+    report = {'benchmark': 'avatar_bytes', 'users': count, 'original_size': f'{width}x{height}', 'pages': {}}
+    with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+        with bench_database(db_file):
+            cache.clear()
+            users = seed(count, width, height)
+            report['original_bytes_mean'] = sum(user.profile_image.size for user in users) // len(users)
+            clients = {}
+            for role, user in (('admin', users[0]), ('patient', users[1])):
+                clients[role] = Client()
+                clients[role].force_login(user)
+
+            for phase in ('cold', 'warm'):
+                for role, path in PAGES:
+                    path = path.format(user=users[1].pk)
+                    # Avatar URL -> size of the original it stands for; URLs change once thumbnails exist
+                    original_bytes = {
+                        avatar_url(user, size): user.profile_image.size for user in users for size in SIZES
+                    }
+                    page = report['pages'].setdefault(f'{role} {path}', {})
+                    page[phase] = render(clients[role], path, original_bytes)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=25, help='Users with a profile image (one page of Manage Users)')
+    parser.add_argument('--width', type=int, default=2400)
+    parser.add_argument('--height', type=int, default=1800)
+    add_common_arguments(parser)
+    args = parser.parse_args()
+
+    setup_django()
+    write_report(run(args.db_file, args.users, args.width, args.height), args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+"""
+Template render time of each dashboard with 10, 100 and 1,000 request rows.
+
+    python -m benchmarks.dashboard_render --rows 10,100,1000 --repeat 20
+
+Only rendering is timed: the context is built once per size from evaluated
+querysets, so the numbers isolate template work from the queries behind it.
+Each dashboard is rendered in four profiles:
+
+* ``uncached_loader`` - templates re-read and re-compiled on every render,
+  fragment caching disabled (a dummy cache backend), i.e. the DEBUG setup
+* ``cached_loader`` - compiled templates kept in memory, no fragment cache
+* ``fragments_cold`` - cached loader, fragment cache cleared before each render
+* ``fragments_warm`` - cached loader, every row and KPI fragment already cached
+"""
+
+import argparse
+import copy
+
+from benchmarks import add_common_arguments, bench_database, setup_django, time_call, write_report
+
+LOADERS = {
+    'uncached': [
+        'django.template.loaders.filesystem.Loader',
+        'django.template.loaders.app_directories.Loader',
+    ],
+    'cached': [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ],
+}
+
+DUMMY_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                            'LOCATION': 'dashboard-render-bench', 'OPTIONS': {'MAX_ENTRIES': 10000}}}
+
+# Profile -> (loader, cache, clear the cache before every render)
+PROFILES = {
+    'uncached_loader': ('uncached', DUMMY_CACHE, False),
+    'cached_loader': ('cached', DUMMY_CACHE, False),
+    'fragments_cold': ('cached', LOCMEM_CACHE, True),
+    'fragments_warm': ('cached', LOCMEM_CACHE, False),
+}
+
+
+def templates_setting(loader):
+    from django.conf import settings
+
+    templates = copy.deepcopy(settings.TEMPLATES)
+    templates[0]['APP_DIRS'] = False
+    templates[0]['OPTIONS']['loaders'] = LOADERS[loader]
+    return templates
+
+
+def seed(rows):
+    from accounts.models import User
+    from ambulance.models import AmbulanceRequest
+
+    users = {role: User.objects.create_user(username=f'bench_{role}', password='bench-pass', role=role)
+             for role in ('patient', 'paramedic', 'admin')}
+    statuses = ['pending', 'assigned', 'en_route', 'arrived', 'completed', 'cancelled']
+    priorities = ['low', 'medium', 'high', 'critical']
+    AmbulanceRequest.objects.bulk_create([
+        AmbulanceRequest(
+            patient=users['patient'], paramedic=None if index % 6 == 0 else users['paramedic'],
+            status=statuses[index % 6], priority=priorities[index % 4],
+            pickup_address=f'{index} Main Street', pickup_latitude=40.7, pickup_longitude=-74.0,
+            description='chest pain', contact_phone='555-0100',
+        )
+        for index in range(rows)
+    ])
+    return users
+
+
+def contexts(users, rows):
+    """(name, template, user, context) for each dashboard, shaped like the views build them"""
+    from django.core.paginator import Paginator
+    from django.db.models import Count
+
+    from ambulance.forms import RequestFilterForm
+    from ambulance.models import AmbulanceRequest
+
+    requests = AmbulanceRequest.objects.select_related('patient', 'paramedic').order_by('-created_at')
+    recent = list(requests[:rows])
+    counts = {row['status']: row['count'] for row in requests.values('status').annotate(count=Count('pk')).order_by()}
+    active = sum(counts.get(status, 0) for status in ('assigned', 'en_route', 'arrived'))
+    patient_stats = {
+        'total_requests': sum(counts.values()), 'pending_requests': counts.get('pending', 0),
+        'active_requests': active, 'completed_requests': counts.get('completed', 0),
+    }
+    return [
+        ('patient', 'dashboard/patient_dashboard.html', users['patient'], {
+            'stats': patient_stats, 'kpi_version': 'bench', 'recent_requests': recent,
+        }),
+        ('paramedic', 'dashboard/paramedic_dashboard.html', users['paramedic'], {
+            'stats': {'assigned_to_me': active, 'completed_by_me': counts.get('completed', 0),
+                      'pending_requests': counts.get('pending', 0), 'total_handled': sum(counts.values())},
+            'kpi_version': 'bench',
+            'recent_assigned': [r for r in recent if r.paramedic_id],
+            'recent_pending': [r for r in recent if r.status == 'pending'],
+        }),
+        ('admin', 'dashboard/admin_dashboard.html', users['admin'], {
+            'stats': dict(patient_stats, cancelled_requests=counts.get('cancelled', 0), total_users=3,
+                          patients=1, paramedics=1, available_paramedics=1, total_ambulances=0,
+                          available_ambulances=0),
+            'kpi_version': 'bench', 'recent_requests': recent,
+            'priority_stats': [], 'status_stats': [], 'recent_users': [], 'duplicate_clusters': [],
+        }),
+        ('request_list', 'ambulance/request_list.html', users['admin'], {
+            'page_obj': Paginator(recent, rows).get_page(1),
+            'filter_form': RequestFilterForm(user=users['admin']),
+        }),
+    ]
+
+
+def render_profile(profile, dashboards, repeat):
+    from django.core.cache import cache
+    from django.template.loader import render_to_string
+    from django.test import RequestFactory, override_settings
+
+    loader, caches, clear = PROFILES[profile]
+    factory = RequestFactory()
+    results = {}
+    with override_settings(TEMPLATES=templates_setting(loader), CACHES=caches):
+        for name, template, user, context in dashboards:
+            request = factory.get('/')
+            request.user = user
+            context = dict(context, user=user)
+
+            def render():
+                if clear:
+                    cache.clear()
+                return render_to_string(template, context, request=request)
+
+            results[name] = time_call(render, repeat=repeat, warmup=1)
+    return results
+
+
+def run(db_file, sizes, repeat):
+    report = {'benchmark': 'dashboard_render', 'repeat': repeat, 'sizes': {}}
+    with bench_database(db_file):
+        users = seed(max(sizes))
+        for rows in sizes:
+            dashboards = contexts(users, rows)
+            size_report = report['sizes'][str(rows)] = {}
+            for profile in PROFILES:
+                for name, timing in render_profile(profile, dashboards, repeat).items():
+                    size_report.setdefault(name, {})[profile] = timing
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', default='10,100,1000',
+                        help='Comma-separated numbers of request rows per dashboard')
+    parser.add_argument('--repeat', type=int, default=20, help='Timed renders per dashboard and profile')
+    add_common_arguments(parser)
+    args = parser.parse_args()
+
+    setup_django()
+    sizes = [int(size) for size in args.rows.split(',')]
+    write_report(run(args.db_file, sizes, args.repeat), args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,439 @@
+"""
+Simulated dispatch day driven through the real ``/api/v1/`` endpoints.
+
+    python -m benchmarks.dispatch_day --hours 2 --speed 60 --clients 8 --db-file /tmp/sim.sqlite3
+    python -m benchmarks.dispatch_day --record calls.jsonl --hours 24
+    python -m benchmarks.dispatch_day --replay calls.jsonl --speed 120
+    python -m benchmarks.dispatch_day --base-url http://127.0.0.1:8000 --accounts accounts.json
+
+Emergency calls arrive as a Poisson process following a day/night curve (or
+are replayed from a JSON-lines file of ``{"at": seconds, "priority": ...}``).
+Patients create requests and poll them while they are open; idle paramedics
+poll the pending list and race each other to accept; the winner walks the
+request through ``en_route``, ``arrived`` and ``completed``. Polling stands
+in for telemetry, since the API has no location endpoint.
+
+Simulated time runs ``--speed`` times faster than wall time. A pool of
+``--clients`` threads executes the scheduled actions, so the report shows
+what the API sustains: throughput, latency per action, ``database is locked``
+errors, accept conflicts, time-to-assign in simulated seconds, and how far
+clients fell behind schedule.
+
+By default the API runs in-process against a throwaway database seeded with
+``seed_synthetic`` (use ``--db-file`` so threads share a real SQLite file).
+With ``--base-url`` requests go over HTTP to a running server instead; the
+accounts file lists ``{"patients": [[username, password], ...],
+"paramedics": [...]}`` to log in with.
+"""
+
+import argparse
+import heapq
+import itertools
+import json
+import math
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from benchmarks import add_common_arguments, bench_database, setup_django, summarize, write_report
+
+PRIORITIES = ['low', 'medium', 'high', 'critical']
+PRIORITY_WEIGHTS = [20, 45, 25, 10]
+
+# Simulated seconds spent in each state before the paramedic moves on
+TRANSITIONS = [
+    ('en_route', (60, 180)),
+    ('arrived', (300, 900)),
+    ('completed', (600, 1800)),
+]
+
+
+def hourly_rate(hour, calls_per_hour):
+    """Call rate with a night low around 04:00 and an evening peak around 18:00"""
+    return calls_per_hour * (1 + 0.6 * math.sin((hour - 12) / 24 * 2 * math.pi))
+
+
+def generate_calls(hours, calls_per_hour, rng):
+    """Arrival times (simulated seconds) and priorities for a synthetic day"""
+    calls, at = [], 0.0
+    peak = calls_per_hour * 1.6 / 3600
+    # Thinning: draw at the peak rate and keep each arrival with rate(t) / peak
+    while True:
+        at += rng.expovariate(peak)
+        if at >= hours * 3600:
+            return calls
+        if rng.random() * peak <= hourly_rate(at / 3600 % 24, calls_per_hour) / 3600:
+            calls.append({'at': round(at, 3), 'priority': rng.choices(PRIORITIES, PRIORITY_WEIGHTS)[0]})
+
+
+def load_calls(path):
+    with open(path) as f:
+        return sorted((json.loads(line) for line in f if line.strip()), key=lambda call: call['at'])
+
+
+class LocalTransport:
+    """Send requests through the Django test client, one client per thread"""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def request(self, method, path, token=None, data=None):
+        from django.test import Client
+
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = Client(raise_request_exception=False)
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {token}'} if token else {}
+        body = json.dumps(data) if data is not None else ''
+        response = client.generic(method, path, body, content_type='application/json', **headers)
+        error = ''
+        if getattr(response, 'exc_info', None):
+            error = str(response.exc_info[1])
+        try:
+            payload = json.loads(response.content) if response.content else None
+        except ValueError:
+            payload = None
+        return response.status_code, payload, error
+
+    def close(self):
+        from django.db import connection
+
+        connection.close()
+
+
+class HttpTransport:
+    """Send requests to a running server"""
+
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def request(self, method, path, token=None, data=None):
+        headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        body = json.dumps(data).encode() if data is not None else None
+        request = urllib.request.Request(self.base_url + path, data=body, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                status, content = response.status, response.read()
+        except urllib.error.HTTPError as e:
+            status, content = e.code, e.read()
+        except (urllib.error.URLError, OSError) as e:
+            return 0, None, str(e)
+        try:
+            return status, json.loads(content) if content else None, ''
+        except ValueError:
+            # Debug error pages are HTML; keep the text so lock errors are still recognised
+            return status, None, content[:2000].decode(errors='replace')
+
+    def close(self):
+        pass
+
+
+class Simulation:
+    def __init__(self, transport, patients, paramedics, calls, speed, clients,
+                 poll_interval=30, track_interval=120, drain_hours=2, seed=42):
+        self.transport = transport
+        self.patients = patients
+        self.paramedics = paramedics
+        self.calls = calls
+        self.speed = speed
+        self.clients = clients
+        self.poll_interval = poll_interval
+        self.track_interval = track_interval
+        self.last_call = calls[-1]['at'] if calls else 0
+        self.end = self.last_call + drain_hours * 3600
+        self.rng = random.Random(seed)
+
+        self._queue = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._stats_lock = threading.Lock()
+        self._pending_events = 0
+        self.open_requests = {}
+        self.busy = set()
+        self.latencies = {}
+        self.statuses = {}
+        self.errors = {'lock': 0, 'accept_conflict': 0, 'lost_assignment': 0, 'server': 0, 'client': 0,
+                       'transport': 0}
+        self.lags = []
+        self.time_to_assign = []
+        self.completed = 0
+
+    def schedule(self, at, action, *args):
+        with self._condition:
+            heapq.heappush(self._queue, (at, next(self._sequence), action, args))
+            self._pending_events += 1
+            self._condition.notify()
+
+    def sim_time(self):
+        return (time.perf_counter() - self.started) * self.speed
+
+    def wall_due(self, at):
+        return self.started + at / self.speed
+
+    def call(self, action, method, path, token, data=None):
+        start = time.perf_counter()
+        status, payload, error = self.transport.request(method, path, token, data)
+        elapsed = (time.perf_counter() - start) * 1000
+        with self._stats_lock:
+            self.latencies.setdefault(action, []).append(elapsed)
+            counts = self.statuses.setdefault(action, {})
+            counts[status] = counts.get(status, 0) + 1
+            if 'database is locked' in error or 'database table is locked' in error:
+                self.errors['lock'] += 1
+            elif status == 0:
+                self.errors['transport'] += 1
+            elif status >= 500:
+                self.errors['server'] += 1
+            elif status == 404 and action == 'accept':
+                self.errors['accept_conflict'] += 1
+            elif status >= 400:
+                self.errors['client'] += 1
+        return status, payload
+
+    # Actions
+
+    def create(self, at, call):
+        patient = self.rng.choice(self.patients)
+        lat, lng = 40.7 + self.rng.uniform(-0.2, 0.2), -74.0 + self.rng.uniform(-0.2, 0.2)
+        status, payload = self.call('create', 'POST', '/api/v1/requests/', patient['token'], {
+            'pickup_address': f'{self.rng.randint(1, 999)} Simulated Street',
+            'pickup_latitude': f'{lat:.6f}',
+            'pickup_longitude': f'{lng:.6f}',
+            'description': 'Simulated emergency call',
+            'priority': call.get('priority', 'medium'),
+            'contact_phone': '5550000000',
+        })
+        if status != 201:
+            return
+        pk = payload['id']
+        with self._stats_lock:
+            self.open_requests[pk] = {'created': self.sim_time(), 'patient': patient}
+        self.schedule(at + self.track_interval, 'track', pk)
+
+    def track(self, at, pk):
+        with self._stats_lock:
+            request = self.open_requests.get(pk)
+        if request is None or at > self.end:
+            return
+        self.call('track', 'GET', f'/api/v1/requests/{pk}/', request['patient']['token'])
+        self.schedule(at + self.track_interval, 'track', pk)
+
+    def finished(self, at):
+        return at > self.end or (at > self.last_call and not self.open_requests)
+
+    def poll(self, at, paramedic):
+        if self.finished(at):
+            return
+        if paramedic['id'] not in self.busy:
+            status, listing = self.call('poll_pending', 'GET', '/api/v1/requests/?status=pending',
+                                        paramedic['token'])
+            candidates = [row for row in (listing or {}).get('results', []) if row['id'] in self.open_requests]
+            if status == 200 and candidates:
+                # Oldest first, with some spread so paramedics do not all chase the same call
+                target = self.rng.choice(candidates[-3:])['id']
+                if self.accept(at, paramedic, target):
+                    return
+        self.schedule(at + self.poll_interval * self.rng.uniform(0.5, 1.5), 'poll', paramedic)
+
+    def accept(self, at, paramedic, pk):
+        status, _ = self.call('accept', 'POST', f'/api/v1/requests/{pk}/accept/', paramedic['token'])
+        if status != 200:
+            return False
+        with self._stats_lock:
+            self.busy.add(paramedic['id'])
+            request = self.open_requests.get(pk)
+            if request is not None:
+                self.time_to_assign.append(self.sim_time() - request['created'])
+        self.schedule(at + self.rng.uniform(*TRANSITIONS[0][1]), 'transition', paramedic, pk, 0)
+        return True
+
+    def transition(self, at, paramedic, pk, step):
+        new_status = TRANSITIONS[step][0]
+        status, _ = self.call(new_status, 'POST', f'/api/v1/requests/{pk}/update_status/',
+                              paramedic['token'], {'status': new_status})
+        if status in (403, 404):
+            # Another paramedic's accept won the race for this request
+            with self._stats_lock:
+                self.errors['lost_assignment'] += 1
+                self.busy.discard(paramedic['id'])
+            self.schedule(at, 'poll', paramedic)
+            return
+        if status != 200:
+            # Retry the same transition on the next poll
+            if at > self.end:
+                return
+            self.schedule(at + self.poll_interval, 'transition', paramedic, pk, step)
+            return
+        if step + 1 < len(TRANSITIONS):
+            self.schedule(at + self.rng.uniform(*TRANSITIONS[step + 1][1]), 'transition', paramedic, pk, step + 1)
+            return
+        with self._stats_lock:
+            self.open_requests.pop(pk, None)
+            self.busy.discard(paramedic['id'])
+            self.completed += 1
+        self.schedule(at, 'poll', paramedic)
+
+    # Scheduler
+
+    def worker(self):
+        try:
+            while True:
+                with self._condition:
+                    while True:
+                        if not self._queue:
+                            if self._pending_events == 0:
+                                self._condition.notify_all()
+                                return
+                            self._condition.wait()
+                            continue
+                        due = self.wall_due(self._queue[0][0])
+                        delay = due - time.perf_counter()
+                        if delay <= 0:
+                            at, _, action, args = heapq.heappop(self._queue)
+                            break
+                        self._condition.wait(delay)
+                lag = max(0.0, time.perf_counter() - due)
+                try:
+                    getattr(self, action)(at, *args)
+                finally:
+                    with self._condition:
+                        self.lags.append(lag * 1000)
+                        self._pending_events -= 1
+                        self._condition.notify_all()
+        finally:
+            self.transport.close()
+
+    def run(self):
+        self.started = time.perf_counter()
+        for call in self.calls:
+            self.schedule(call['at'], 'create', call)
+        for index, paramedic in enumerate(self.paramedics):
+            self.schedule(index * self.poll_interval / max(1, len(self.paramedics)), 'poll', paramedic)
+
+        threads = [threading.Thread(target=self.worker, name=f'client-{i}') for i in range(self.clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.report(time.perf_counter() - self.started)
+
+    def report(self, wall_seconds):
+        actions = sum(len(samples) for samples in self.latencies.values())
+        return {
+            'benchmark': 'dispatch_day',
+            'speed': self.speed,
+            'clients': self.clients,
+            'calls': len(self.calls),
+            'completed': self.completed,
+            'left_open': len(self.open_requests),
+            'wall_seconds': round(wall_seconds, 2),
+            'throughput_rps': round(actions / wall_seconds, 2) if wall_seconds else None,
+            'errors': self.errors,
+            'actions': {
+                action: {**summarize(samples), 'status': self.statuses[action]}
+                for action, samples in sorted(self.latencies.items())
+            },
+            'time_to_assign': seconds_summary(self.time_to_assign) if self.time_to_assign else None,
+            'schedule_lag': summarize(self.lags) if self.lags else None,
+        }
+
+
+def seconds_summary(samples):
+    """summarize() for simulated seconds instead of milliseconds"""
+    return {key.replace('_ms', '_s'): value for key, value in summarize(samples).items()}
+
+
+def local_accounts(patient_count, paramedic_count, history):
+    """Seed a throwaway database and issue tokens for simulated users"""
+    from django.core.management import call_command
+    from accounts.models import User
+    from ambulance.models import AmbulanceRequest
+    from api.authentication import issue_token
+
+    call_command('seed_synthetic', users=max(100, patient_count + paramedic_count * 20),
+                 requests=history, ambulances=max(10, paramedic_count), days=30, verbosity=0)
+    # Historic requests stay out of the way of the simulated pending queue
+    AmbulanceRequest.objects.filter(status='pending').update(status='cancelled')
+    User.objects.filter(role='paramedic').update(is_available=True)
+
+    def accounts(role, count):
+        users = User.objects.filter(role=role).order_by('pk')[:count]
+        return [{'id': user.pk, 'token': issue_token(user)[0]} for user in users]
+
+    return accounts('patient', patient_count), accounts('paramedic', paramedic_count)
+
+
+def remote_accounts(transport, path):
+    """Log in to a running server with the usernames and passwords in path"""
+    with open(path) as f:
+        listing = json.load(f)
+
+    def accounts(role):
+        result = []
+        for username, password in listing[role]:
+            status, payload, error = transport.request(
+                'POST', '/api/v1/auth/token/', data={'username': username, 'password': password})
+            if status != 200:
+                raise SystemExit(f'Login failed for {username}: {status} {error or payload}')
+            result.append({'id': username, 'token': payload['token']})
+        return result
+
+    return accounts('patients'), accounts('paramedics')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hours', type=float, default=2, help='Simulated hours of incoming calls')
+    parser.add_argument('--calls-per-hour', type=float, default=60)
+    parser.add_argument('--speed', type=float, default=60,
+                        help='Simulated seconds per wall second')
+    parser.add_argument('--clients', type=int, default=8, help='Concurrent virtual client threads')
+    parser.add_argument('--patients', type=int, default=200)
+    parser.add_argument('--paramedics', type=int, default=20)
+    parser.add_argument('--history', type=int, default=10000, help='Historic requests to seed (local mode)')
+    parser.add_argument('--poll-interval', type=float, default=30,
+                        help='Simulated seconds between pending-list polls of idle paramedics')
+    parser.add_argument('--track-interval', type=float, default=120,
+                        help='Simulated seconds between patient polls of an open request')
+    parser.add_argument('--replay', help='Replay calls from a JSON-lines file')
+    parser.add_argument('--record', help='Write the generated calls to a JSON-lines file and exit')
+    parser.add_argument('--base-url', help='Drive a running server instead of the in-process API')
+    parser.add_argument('--accounts', help='JSON file of accounts to log in with (with --base-url)')
+    parser.add_argument('--seed', type=int, default=42)
+    add_common_arguments(parser)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    calls = load_calls(args.replay) if args.replay else generate_calls(args.hours, args.calls_per_hour, rng)
+    if args.speed <= 0:
+        parser.error('--speed must be positive')
+    if args.record:
+        with open(args.record, 'w') as f:
+            f.writelines(json.dumps(call) + '\n' for call in calls)
+        print(f'Wrote {len(calls)} calls to {args.record}')
+        return
+
+    options = dict(speed=args.speed, clients=args.clients, poll_interval=args.poll_interval,
+                   track_interval=args.track_interval, seed=args.seed)
+    if args.base_url:
+        if not args.accounts:
+            parser.error('--base-url needs --accounts')
+        transport = HttpTransport(args.base_url)
+        patients, paramedics = remote_accounts(transport, args.accounts)
+        write_report(Simulation(transport, patients, paramedics, calls, **options).run(), args.output)
+        return
+
+    setup_django()
+    with bench_database(args.db_file):
+        patients, paramedics = local_accounts(args.patients, args.paramedics, args.history)
+        report = Simulation(LocalTransport(), patients, paramedics, calls, **options).run()
+    write_report(report, args.output)
+
+
+if __name__ == '__main__':
+    main()
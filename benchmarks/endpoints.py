@@ -0,0 +1,229 @@
+"""
+Latency and query counts for every page and API route at several data sizes.
+
+    python -m benchmarks.endpoints --sizes 1000,10000,100000 --output after.json
+    python -m benchmarks.endpoints --compare before.json after.json
+
+Each size gets a fresh database filled by ``seed_synthetic``. Pages are
+requested through the test client with a logged-in session, API routes with
+a signed bearer token. Only GET routes are timed, since repeating a POST
+would change the data under measurement; routes that are not exercised are
+listed under ``uncovered`` so new views do not go unnoticed.
+"""
+
+import argparse
+import json
+
+from benchmarks import add_common_arguments, bench_database, count_queries, setup_django, time_call, write_report
+
+# (role, path) pairs; {placeholders} are filled from the seeded data
+PAGES = [
+    (None, '/'),
+    (None, '/accounts/login/'),
+    (None, '/accounts/register/'),
+    (None, '/accounts/password-reset/'),
+    (None, '/accounts/password-reset/done/'),
+    (None, '/accounts/password-reset/complete/'),
+    ('patient', '/accounts/dashboard/'),
+    ('patient', '/dashboard/patient/'),
+    ('patient', '/accounts/profile/'),
+    ('patient', '/accounts/profile/edit/'),
+    ('patient', '/accounts/profile/change-password/'),
+    ('patient', '/ambulance/request/create/'),
+    ('patient', '/ambulance/requests/'),
+    ('patient', '/ambulance/request/{patient_request}/'),
+    ('paramedic', '/dashboard/paramedic/'),
+    ('paramedic', '/ambulance/requests/assigned/'),
+    ('paramedic', '/ambulance/requests/pending/'),
+    ('paramedic', '/ambulance/request/{paramedic_request}/'),
+    ('paramedic', '/ambulance/request/{paramedic_request}/update-status/'),
+    ('admin', '/dashboard/admin/'),
+    ('admin', '/dashboard/reports/'),
+    ('admin', '/accounts/manage-users/'),
+    ('admin', '/accounts/manage-users/?q=synthetic_patient_1'),
+    ('admin', '/accounts/admin/edit-user/{patient}/'),
+    ('admin', '/ambulance/requests/'),
+    ('admin', '/ambulance/requests/?q=chest+pain'),
+    ('admin', '/ambulance/request/{pending_request}/assign/'),
+    ('admin', '/ambulance/ambulances/'),
+    ('admin', '/ambulance/ambulance/create/'),
+    ('admin', '/ambulance/ambulance/{ambulance}/edit/'),
+    ('admin', '/ambulance/ambulance/{ambulance}/delete/'),
+    ('admin', '/accounts/admin/delete-user/{patient}/'),
+    ('admin', '/metrics'),
+]
+
+API = [
+    ('patient', '/api/v1/'),
+    ('patient', '/api/v1/requests/'),
+    ('patient', '/api/v1/requests/{patient_request}/'),
+    ('patient', '/api/v1/requests/{patient_request}/status_history/'),
+    ('patient', '/api/v1/users/'),
+    ('patient', '/api/v1/users/profile/'),
+    ('patient', '/api/v1/dashboard/stats/'),
+    ('patient', '/api/v1/dashboard/recent-requests/'),
+    ('paramedic', '/api/v1/requests/'),
+    ('paramedic', '/api/v1/dashboard/stats/'),
+    ('paramedic', '/api/v1/ambulances/'),
+    ('paramedic', '/api/v1/ambulances/available/'),
+    ('admin', '/api/v1/requests/'),
+    ('admin', '/api/v1/requests/?search=chest+pain'),
+    ('admin', '/api/v1/users/'),
+    ('admin', '/api/v1/users/?search=synthetic_para'),
+    ('admin', '/api/v1/users/{patient}/'),
+    ('admin', '/api/v1/users/role_counts/'),
+    ('admin', '/api/v1/paramedics/'),
+    ('admin', '/api/v1/paramedics/{paramedic}/'),
+    ('admin', '/api/v1/paramedics/available/'),
+    ('admin', '/api/v1/ambulances/{ambulance}/'),
+    ('admin', '/api/v1/dashboard/stats/'),
+    ('admin', '/api/v1/dashboard/recent-requests/'),
+]
+
+
+def seed(size):
+    from django.core.management import call_command
+
+    call_command(
+        'seed_synthetic', users=max(100, size // 10), requests=size, ambulances=max(10, size // 500),
+        days=30, verbosity=0,
+    )
+
+
+def fixtures():
+    """Pick representative users and objects from the seeded data"""
+    from accounts.models import User
+    from ambulance.models import Ambulance, AmbulanceRequest
+
+    admin = User.objects.filter(role='admin').first()
+    admin.is_staff = admin.is_superuser = True
+    admin.save(update_fields=['is_staff', 'is_superuser'])
+
+    assigned = AmbulanceRequest.objects.filter(
+        status__in=['assigned', 'en_route', 'arrived']
+    ).order_by('-created_at').first() or AmbulanceRequest.objects.exclude(paramedic=None).first()
+    pending = AmbulanceRequest.objects.filter(status='pending').first() or assigned
+    patient_request = AmbulanceRequest.objects.order_by('-created_at').first()
+    users = {
+        'patient': patient_request.patient,
+        'paramedic': assigned.paramedic,
+        'admin': admin,
+    }
+    values = {
+        'patient': users['patient'].pk,
+        'paramedic': users['paramedic'].pk,
+        'patient_request': patient_request.pk,
+        'paramedic_request': assigned.pk,
+        'pending_request': pending.pk,
+        'ambulance': Ambulance.objects.values_list('pk', flat=True).first(),
+    }
+    return users, values
+
+
+def measure(client, path, repeat):
+    from django.db import connection
+
+    with count_queries(connection) as queries:
+        response = client.get(path)
+    return {
+        'status': response.status_code,
+        'queries': len(queries),
+        'bytes': len(response.content) if not response.streaming else None,
+        'timing': time_call(lambda: client.get(path), repeat=repeat),
+    }
+
+
+def route_patterns(resolver=None, prefix=''):
+    """All URL patterns of the project except the Django admin and static file routes"""
+    from django.urls import URLResolver, get_resolver
+
+    resolver = resolver or get_resolver()
+    patterns = set()
+    for entry in resolver.url_patterns:
+        route = prefix + str(entry.pattern).lstrip('^').rstrip('$')
+        # Format-suffix variants of API routes run the same view
+        if route.startswith(('admin/', 'static/', 'media/')) or 'format>' in route:
+            continue
+        if isinstance(entry, URLResolver):
+            patterns |= route_patterns(entry, route)
+        else:
+            patterns.add(route)
+    return patterns
+
+
+def run_size(size, repeat, db_file):
+    from django.test import Client
+    from django.urls import resolve
+    from api.authentication import issue_token
+
+    with bench_database(db_file):
+        seed(size)
+        users, values = fixtures()
+
+        # Broken views are reported with their status code instead of aborting the run
+        sessions = {None: Client(raise_request_exception=False)}
+        tokens = {}
+        for role, user in users.items():
+            sessions[role] = Client(raise_request_exception=False)
+            sessions[role].force_login(user)
+            tokens[role] = Client(raise_request_exception=False,
+                                  HTTP_AUTHORIZATION=f'Bearer {issue_token(user)[0]}')
+
+        results, covered = {}, set()
+        for clients, routes in ((sessions, PAGES), (tokens, API)):
+            for role, template in routes:
+                path = template.format(**values)
+                results[f'{role or "anonymous"} GET {template}'] = measure(clients[role], path, repeat)
+                covered.add(resolve(path.split('?')[0]).route.lstrip('^').rstrip('$'))
+
+    return results, sorted(route_patterns() - covered)
+
+
+def run(sizes, repeat, db_file):
+    report = {'benchmark': 'endpoints', 'repeat': repeat, 'sizes': {}}
+    for size in sizes:
+        report['sizes'][str(size)], report['uncovered'] = run_size(size, repeat, db_file)
+    return report
+
+
+def compare(before_path, after_path):
+    """Print median latency and query count changes between two reports"""
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+
+    print(f'{"size":>8}  {"route":<70} {"before ms":>10} {"after ms":>10} {"change":>8} {"queries":>9}')
+    for size, routes in after['sizes'].items():
+        for key, new in routes.items():
+            old = before['sizes'].get(size, {}).get(key)
+            if old is None:
+                print(f'{size:>8}  {key:<70} {"-":>10} {new["timing"]["median_ms"]:>10.2f} {"new":>8}')
+                continue
+            old_ms, new_ms = old['timing']['median_ms'], new['timing']['median_ms']
+            change = (new_ms - old_ms) / old_ms * 100 if old_ms else 0.0
+            queries = f'{old["queries"]}->{new["queries"]}'
+            print(f'{size:>8}  {key:<70} {old_ms:>10.2f} {new_ms:>10.2f} {change:>+7.1f}% {queries:>9}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1000,10000,100000',
+                        help='Comma-separated request counts to seed')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'),
+                        help='Compare two saved reports instead of running')
+    add_common_arguments(parser)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    setup_django()
+    sizes = [int(size) for size in args.sizes.split(',')]
+    write_report(run(sizes, args.repeat, args.db_file), args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Compare FTS5 search with the old ``icontains`` scan over request text.
+
+    python -m benchmarks.fulltext_search --rows 1000000
+"""
+
+import argparse
+import random
+
+from benchmarks import add_common_arguments, bench_database, setup_django, time_call, write_report
+
+STREETS = ['Main', 'Oak', 'Pine', 'Maple', 'Cedar', 'Elm', 'Washington', 'Lake', 'Hill', 'Park',
+           'Sunset', 'River', 'Church', 'Chester', 'Highland', 'Mill', 'Spring', 'Forest']
+SUFFIXES = ['Street', 'Avenue', 'Road', 'Lane', 'Drive', 'Boulevard']
+SYMPTOMS = ['chest pain', 'shortness of breath', 'fall from ladder', 'car accident', 'seizure',
+            'severe bleeding', 'allergic reaction', 'unconscious person', 'stroke symptoms',
+            'burn injury', 'broken leg', 'high fever', 'diabetic emergency', 'overdose']
+NOTES = ['gate code 1234', 'patient on third floor', 'dog on premises', 'caller is neighbour',
+         'traffic on bridge', '', '', '']
+
+QUERIES = ['chest pain', 'ladder', 'chester', 'seizure third floor', 'washington avenue']
+
+
+def seed(connection, rows, batch_size=10000):
+    from django.utils import timezone
+    from accounts.models import User
+
+    patient = User.objects.create(username='bench_patient', role='patient')
+    now = timezone.now().isoformat()
+    rng = random.Random(42)
+    sql = (
+        'INSERT INTO ambulance_request (patient_id, pickup_address, destination_address, description, '
+        'priority, status, contact_phone, notes, created_at, updated_at) '
+        'VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)'
+    )
+    with connection.cursor() as cursor:
+        for start in range(0, rows, batch_size):
+            batch = []
+            for _ in range(min(batch_size, rows - start)):
+                batch.append((
+                    patient.pk,
+                    f'{rng.randint(1, 9999)} {rng.choice(STREETS)} {rng.choice(SUFFIXES)}',
+                    'City General Hospital',
+                    f'{rng.choice(SYMPTOMS)}, {rng.choice(SYMPTOMS)}',
+                    rng.choice(['low', 'medium', 'high', 'critical']),
+                    rng.choice(['pending', 'completed', 'completed', 'cancelled']),
+                    '555-0100',
+                    rng.choice(NOTES),
+                    now, now,
+                ))
+            cursor.executemany(sql, batch)
+
+
+def icontains_search(text):
+    from django.db.models import Q
+    from ambulance.models import AmbulanceRequest
+
+    condition = Q()
+    for token in text.split():
+        condition &= (Q(pickup_address__icontains=token) | Q(description__icontains=token) |
+                      Q(notes__icontains=token))
+    return AmbulanceRequest.objects.filter(condition).order_by('-created_at')
+
+
+def fulltext_search(text):
+    from ambulance.models import AmbulanceRequest
+    from ambulance.search import search_requests
+
+    return search_requests(AmbulanceRequest.objects.all(), text)
+
+
+def run(rows, repeat, db_file):
+    report = {'benchmark': 'fulltext_search', 'rows': rows, 'queries': {}}
+    with bench_database(db_file) as connection:
+        seed(connection, rows)
+        for text in QUERIES:
+            entry = {}
+            for name, build in (('icontains', icontains_search), ('fts5', fulltext_search)):
+                entry[name] = {
+                    'count': build(text).count(),
+                    'count_timing': time_call(lambda: build(text).count(), repeat=repeat),
+                    'first_page_timing': time_call(lambda: list(build(text)[:20]), repeat=repeat),
+                }
+            report['queries'][text] = entry
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=5)
+    add_common_arguments(parser)
+    args = parser.parse_args()
+
+    setup_django()
+    write_report(run(args.rows, args.repeat, args.db_file), args.output)
+
+
+if __name__ == '__main__':
+    main()
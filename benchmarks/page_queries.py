@@ -0,0 +1,94 @@
+"""
+Count the queries each page needs with the plain database session and user
+loading, and with the cached session and cached user backend.
+
+    python -m benchmarks.page_queries
+"""
+
+import argparse
+
+from benchmarks import add_common_arguments, bench_database, count_queries, setup_django, write_report
+
+PAGES = {
+    'patient': ['/dashboard/patient/', '/accounts/profile/', '/accounts/profile/edit/',
+                '/ambulance/requests/'],
+    'paramedic': ['/dashboard/paramedic/', '/accounts/profile/', '/accounts/profile/edit/',
+                  '/ambulance/requests/assigned/', '/ambulance/requests/pending/'],
+    'admin': ['/dashboard/admin/', '/accounts/profile/', '/accounts/manage-users/',
+              '/ambulance/requests/', '/ambulance/ambulances/'],
+}
+
+CONFIGURATIONS = {
+    'before': {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.db',
+        'AUTHENTICATION_BACKENDS': ['django.contrib.auth.backends.ModelBackend'],
+    },
+    'after': {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.cached_db',
+        'AUTHENTICATION_BACKENDS': ['accounts.backends.CachedModelBackend'],
+    },
+}
+
+
+def seed():
+    from accounts.models import User, UserProfile
+    from ambulance.models import Ambulance, AmbulanceRequest
+
+    users = {role: User.objects.create_user(username=f'bench_{role}', password='bench-pass', role=role)
+             for role in PAGES}
+    for user in users.values():
+        UserProfile.objects.create(user=user)
+    Ambulance.objects.create(vehicle_number='AMB-1', license_plate='BENCH-1',
+                             assigned_paramedic=users['paramedic'])
+    for index in range(5):
+        AmbulanceRequest.objects.create(
+            patient=users['patient'], paramedic=users['paramedic'] if index % 2 else None,
+            pickup_address=f'{index} Main Street', description='chest pain', contact_phone='555-0100',
+            status='assigned' if index % 2 else 'pending',
+        )
+    return users
+
+
+def page_queries(user, paths):
+    from django.core.cache import cache
+    from django.db import connection
+    from django.test import Client
+
+    cache.clear()
+    client = Client()
+    client.force_login(user)
+    result = {}
+    for path in paths:
+        client.get(path)  # warm the session and user caches
+        with count_queries(connection) as queries:
+            response = client.get(path)
+        assert response.status_code == 200, (path, response.status_code)
+        result[path] = len(queries)
+    return result
+
+
+def run(db_file):
+    from django.test import override_settings
+
+    report = {'benchmark': 'page_queries', 'pages': {}}
+    with bench_database(db_file):
+        users = seed()
+        for name, overrides in CONFIGURATIONS.items():
+            with override_settings(**overrides):
+                for role, paths in PAGES.items():
+                    for path, count in page_queries(users[role], paths).items():
+                        report['pages'].setdefault(f'{role} {path}', {})[name] = count
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    add_common_arguments(parser)
+    args = parser.parse_args()
+
+    setup_django()
+    write_report(run(args.db_file), args.output)
+
+
+if __name__ == '__main__':
+    main()
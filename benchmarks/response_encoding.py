@@ -0,0 +1,158 @@
+"""
+CPU per response and bytes on the wire for request list payloads, by encoding.
+
+    python -m benchmarks.response_encoding --rows 20,100,500
+
+For each page size the same ``AmbulanceRequestSerializer`` rows are
+serialized with DRF's stock decimal and datetime fields and with the ones in
+``api.serializers``, then rendered with DRF's ``JSONRenderer``,
+``FastJSONRenderer`` and ``MessagePackRenderer`` (if msgpack is installed).
+The report gives the median CPU time of each step, the body size and its
+gzipped size, and whether every encoding carries the same data as DRF's
+JSON. A final section times full ``GET /api/v1/requests/`` responses per
+Accept and Accept-Encoding header.
+"""
+
+import argparse
+import gzip
+import json
+import time
+from contextlib import contextmanager
+
+from benchmarks import add_common_arguments, bench_database, setup_django, time_call, write_report
+
+HEADERS = {
+    'json': {'HTTP_ACCEPT': 'application/json'},
+    'json+gzip': {'HTTP_ACCEPT': 'application/json', 'HTTP_ACCEPT_ENCODING': 'gzip'},
+    'msgpack': {'HTTP_ACCEPT': 'application/msgpack'},
+    'msgpack+gzip': {'HTTP_ACCEPT': 'application/msgpack', 'HTTP_ACCEPT_ENCODING': 'gzip'},
+}
+
+
+@contextmanager
+def stock_fields():
+    """Serialize with DRF's own DecimalField and DateTimeField"""
+    from rest_framework import serializers
+    from api.serializers import ModelSerializer
+
+    fast = ModelSerializer.serializer_field_mapping
+    ModelSerializer.serializer_field_mapping = serializers.ModelSerializer.serializer_field_mapping
+    try:
+        yield
+    finally:
+        ModelSerializer.serializer_field_mapping = fast
+
+
+def cpu_ms(func, repeat):
+    """Median process CPU time of func in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        start = time.process_time()
+        func()
+        samples.append((time.process_time() - start) * 1000)
+    samples.sort()
+    return round(samples[len(samples) // 2], 3)
+
+
+def renderers():
+    from rest_framework.renderers import JSONRenderer
+    from api.renderers import FastJSONRenderer, MessagePackRenderer
+
+    available = {'drf_json': JSONRenderer(), 'fast_json': FastJSONRenderer()}
+    if MessagePackRenderer.available:
+        available['msgpack'] = MessagePackRenderer()
+    return available
+
+
+def decode(name, body):
+    if name == 'msgpack':
+        import msgpack
+        return msgpack.unpackb(body)
+    return json.loads(body)
+
+
+def measure_rows(count, repeat):
+    from ambulance.models import AmbulanceRequest
+    from api.serializers import AmbulanceRequestSerializer
+
+    rows = list(AmbulanceRequest.objects.select_related('patient', 'paramedic').order_by('-created_at')[:count])
+    serialize = lambda: AmbulanceRequestSerializer(rows, many=True).data
+    with stock_fields():
+        stock_cpu = cpu_ms(serialize, repeat)
+        stock_data = serialize()
+    data = serialize()
+    entry = {
+        'rows': len(rows),
+        'serialize_cpu_ms': {'drf_fields': stock_cpu, 'fast_fields': cpu_ms(serialize, repeat)},
+        'same_data': json.loads(json.dumps(stock_data)) == json.loads(json.dumps(data)),
+        'render': {},
+    }
+
+    reference = None
+    for name, renderer in renderers().items():
+        body = renderer.render(data)
+        reference = decode(name, body) if reference is None else reference
+        entry['render'][name] = {
+            'cpu_ms': cpu_ms(lambda: renderer.render(data), repeat),
+            'gzip_cpu_ms': cpu_ms(lambda: gzip.compress(body, 6), repeat),
+            'bytes': len(body),
+            'gzip_bytes': len(gzip.compress(body, 6)),
+            'same_data': decode(name, body) == reference,
+        }
+    return entry
+
+
+def measure_responses(repeat):
+    from django.test import Client
+    from accounts.models import User
+    from api.authentication import issue_token
+    from api.renderers import MessagePackRenderer
+
+    token, _ = issue_token(User.objects.filter(role='admin').first())
+    client = Client(HTTP_AUTHORIZATION=f'Bearer {token}')
+    report = {}
+    for name, headers in HEADERS.items():
+        if name.startswith('msgpack') and not MessagePackRenderer.available:
+            continue
+
+        def fetch():
+            response = client.get('/api/v1/requests/', **headers)
+            body = b''.join(response.streaming_content) if response.streaming else response.content
+            return response, body
+
+        response, body = fetch()
+        report[name] = {
+            'status': response.status_code,
+            'content_encoding': response.get('Content-Encoding'),
+            'bytes': len(body),
+            'timing': time_call(fetch, repeat=repeat),
+        }
+    return report
+
+
+def run(sizes, repeat, db_file):
+    from django.core.management import call_command
+
+    report = {'benchmark': 'response_encoding', 'pages': {}}
+    with bench_database(db_file) as connection:
+        call_command('seed_synthetic', users=1000, requests=max(sizes) * 4, ambulances=20, days=30, verbosity=0)
+        for count in sizes:
+            report['pages'][str(count)] = measure_rows(count, repeat)
+        report['responses'] = measure_responses(repeat)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', default='20,100,500', help='Comma-separated page sizes')
+    parser.add_argument('--repeat', type=int, default=20)
+    add_common_arguments(parser)
+    args = parser.parse_args()
+
+    setup_django()
+    sizes = [int(size) for size in args.rows.split(',')]
+    write_report(run(sizes, args.repeat, args.db_file), args.output)
+
+
+if __name__ == '__main__':
+    main()
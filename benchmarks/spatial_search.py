@@ -0,0 +1,100 @@
+"""
+Compare R*Tree radius search with an exact-distance scan over request pickups.
+
+    python -m benchmarks.spatial_search --rows 1000000
+
+Pickups are spread over a 2 x 2 degree area. The full scan evaluates the
+haversine distance on every row; the indexed search only on the rows inside
+the circle's bounding box (``ambulance.spatial.within_radius``).
+"""
+
+import argparse
+import random
+
+from benchmarks import add_common_arguments, bench_database, setup_django, time_call, write_report
+
+CENTER = (40.7128, -74.0060)
+SPREAD_DEGREES = 1.0
+RADII_KM = [1, 5, 20]
+
+
+def seed(connection, rows, batch_size=10000):
+    from django.utils import timezone
+    from accounts.models import User
+
+    patient = User.objects.create(username='bench_patient', role='patient')
+    now = timezone.now().isoformat()
+    rng = random.Random(42)
+    sql = (
+        'INSERT INTO ambulance_request (patient_id, pickup_address, destination_address, description, '
+        'pickup_latitude, pickup_longitude, priority, status, contact_phone, created_at, updated_at) '
+        'VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)'
+    )
+    with connection.cursor() as cursor:
+        for start in range(0, rows, batch_size):
+            batch = []
+            for _ in range(min(batch_size, rows - start)):
+                batch.append((
+                    patient.pk, '1 Main Street', 'City General Hospital', 'chest pain',
+                    round(CENTER[0] + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES), 6),
+                    round(CENTER[1] + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES), 6),
+                    rng.choice(['low', 'medium', 'high', 'critical']),
+                    rng.choice(['pending', 'completed', 'completed', 'cancelled']),
+                    '555-0100', now, now,
+                ))
+            cursor.executemany(sql, batch)
+
+
+def full_scan(radius_km):
+    from ambulance.models import AmbulanceRequest
+    from ambulance.spatial import haversine_km
+
+    return AmbulanceRequest.objects.annotate(
+        distance_km=haversine_km('pickup_latitude', 'pickup_longitude', *CENTER)
+    ).filter(distance_km__lte=radius_km).order_by('distance_km', 'pk')
+
+
+def rtree_search(radius_km):
+    from ambulance.models import AmbulanceRequest
+    from ambulance.spatial import within_radius
+
+    return within_radius(AmbulanceRequest.objects.all(), *CENTER, radius_km)
+
+
+def query_plan(connection, queryset):
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def run(rows, repeat, db_file):
+    report = {'benchmark': 'spatial_search', 'rows': rows, 'radii': {}}
+    with bench_database(db_file) as connection:
+        seed(connection, rows)
+        for radius_km in RADII_KM:
+            entry = {}
+            for name, build in (('full_scan', full_scan), ('rtree', rtree_search)):
+                entry[name] = {
+                    'count': build(radius_km).count(),
+                    'count_timing': time_call(lambda: build(radius_km).count(), repeat=repeat),
+                    'first_page_timing': time_call(lambda: list(build(radius_km)[:20]), repeat=repeat),
+                    'plan': query_plan(connection, build(radius_km)),
+                }
+            report['radii'][f'{radius_km}km'] = entry
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=3)
+    add_common_arguments(parser)
+    args = parser.parse_args()
+
+    setup_django()
+    write_report(run(args.rows, args.repeat, args.db_file), args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,11 @@ ASGI config for emergency_ambulance project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The polled API endpoints have native async versions under /api/v1/async/
+(api/async_views.py) that only pay off when served from here, e.g.:
+
+    uvicorn emergency_ambulance.asgi:application --workers 4
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
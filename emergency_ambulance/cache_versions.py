@@ -0,0 +1,49 @@
+"""
+Version counters for cached dashboard fragments and figures.
+
+Each counter covers one table (``requests``, ``users``, ``ambulances``) and is
+bumped whenever a row of it is saved or deleted; ``paramedics`` only moves
+when a paramedic's fields shown by the fleet registry change. Cache keys that include the
+counters therefore change as soon as the data behind them does, and stale
+entries are simply never read again. Code that writes with ``.update()`` or
+raw SQL skips the model signals and has to call ``bump`` itself.
+"""
+
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+VERSION_KEY = 'counter-version:{}'
+
+
+def bump(*names):
+    """Advance the named counters so keys built from them change; returns their new values by name"""
+    values = {}
+    for name in names:
+        key = VERSION_KEY.format(name)
+        try:
+            values[name] = cache.incr(key)
+        except ValueError:
+            # First write, or the counter was evicted: start from the clock so old keys are not reused
+            start = time.time_ns() // 1000
+            values[name] = start if cache.add(key, start, None) else cache.incr(key)
+    return values
+
+
+def counters(*names):
+    """Current values of the named counters by name (0 for a counter never bumped)"""
+    values = cache.get_many([VERSION_KEY.format(name) for name in names])
+    return {name: values.get(VERSION_KEY.format(name), 0) for name in names}
+
+
+def versions(*names):
+    """Current values of the named counters as one string, e.g. 'requests.12-users.3'"""
+    values = cache.get_many([VERSION_KEY.format(name) for name in names])
+    return '-'.join(f'{name}.{values.get(VERSION_KEY.format(name), 0)}' for name in names)
+
+
+def cached_counts(name, version, compute):
+    """Return compute() cached under name and version; version comes from ``versions``"""
+    timeout = getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 300)
+    return cache.get_or_set(f'counts:{name}:{version}', compute, timeout)
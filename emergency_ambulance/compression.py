@@ -0,0 +1,57 @@
+"""
+Streaming gzip for large API responses.
+
+``StreamingGZipMiddleware`` compresses JSON and MessagePack responses of at
+least ``GZIP_MIN_SIZE`` bytes for clients that accept gzip. The rendered
+body is already in memory; it is compressed 64 KB at a time and handed to
+the server as a stream, so the first bytes go out while the rest is still
+being compressed and the compressed body is never held in full. Smaller
+responses are sent as they are; below a few kilobytes compression saves
+little next to the headers and costs CPU.
+
+It builds on Django's ``GZipMiddleware``, including its random padding
+against BREACH, and belongs at the top of ``MIDDLEWARE`` so the other
+middleware see the uncompressed response.
+"""
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+
+from .staticfiles import accepted_encodings
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/msgpack')
+
+CHUNK_SIZE = 64 * 1024
+
+
+def min_size():
+    return getattr(settings, 'GZIP_MIN_SIZE', 8192)
+
+
+def chunks(content):
+    for start in range(0, len(content), CHUNK_SIZE):
+        yield content[start:start + CHUNK_SIZE]
+
+
+class StreamingGZipMiddleware(GZipMiddleware):
+    """Gzip large API payloads, streamed in chunks"""
+
+    def process_response(self, request, response):
+        content_type = response.get('Content-Type', '').partition(';')[0].strip().lower()
+        if (response.streaming or content_type not in COMPRESSIBLE_TYPES or
+                response.has_header('Content-Encoding') or len(response.content) < min_size()):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if 'gzip' not in accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+            return response
+
+        streamed = StreamingHttpResponse(chunks(response.content), status=response.status_code)
+        for header, value in response.items():
+            if header.lower() != 'content-length':
+                streamed[header] = value
+        streamed.cookies = response.cookies
+        # Django's middleware compresses the stream and sets Content-Encoding
+        return super().process_response(request, streamed)
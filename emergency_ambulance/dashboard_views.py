@@ -3,7 +3,12 @@ from django.contrib.auth.decorators import login_required
 from django.db.models import Q, Count
 from django.contrib.auth import get_user_model
 from accounts.decorators import patient_required, paramedic_required, admin_required
-from ambulance.models import AmbulanceRequest, Ambulance
+from ambulance.fleet import fleet
+from ambulance.models import AmbulanceRequest
+from ambulance.archive import count_by
+from ambulance.columnar import history_summary
+from ambulance.duplicates import recent_clusters
+from .cache_versions import cached_counts, versions
 
 User = get_user_model()
 
@@ -17,19 +22,21 @@ def patient_dashboard(request):
     # Get patient's requests
     my_requests = AmbulanceRequest.objects.filter(patient=user).order_by('-created_at')
     
-    # Statistics
-    stats = {
+    # Statistics, recomputed only after a request changes
+    kpi_version = versions('requests')
+    stats = cached_counts(f'patient:{user.pk}', kpi_version, lambda: {
         'total_requests': my_requests.count(),
         'pending_requests': my_requests.filter(status='pending').count(),
         'active_requests': my_requests.filter(status__in=['assigned', 'en_route', 'arrived']).count(),
         'completed_requests': my_requests.filter(status='completed').count(),
-    }
+    })
     
     # Recent requests
-    recent_requests = my_requests[:5]
+    recent_requests = my_requests.select_related('paramedic')[:5]
     
     context = {
         'stats': stats,
+        'kpi_version': kpi_version,
         'recent_requests': recent_requests,
         'user': user,
     }
@@ -49,22 +56,24 @@ def paramedic_dashboard(request):
     # Get pending requests (available to accept)
     pending_requests = AmbulanceRequest.objects.filter(status='pending').order_by('-created_at')
     
-    # Statistics
-    stats = {
+    # Statistics, recomputed only after a request changes
+    kpi_version = versions('requests')
+    stats = cached_counts(f'paramedic:{user.pk}', kpi_version, lambda: {
         'assigned_to_me': assigned_requests.filter(status__in=['assigned', 'en_route', 'arrived']).count(),
         'completed_by_me': assigned_requests.filter(status='completed').count(),
         'pending_requests': pending_requests.count(),
         'total_handled': assigned_requests.count(),
-    }
+    })
     
     # Recent assigned requests
-    recent_assigned = assigned_requests[:5]
+    recent_assigned = assigned_requests.select_related('patient')[:5]
     
     # Recent pending requests
-    recent_pending = pending_requests[:5]
+    recent_pending = pending_requests.select_related('patient')[:5]
     
     context = {
         'stats': stats,
+        'kpi_version': kpi_version,
         'recent_assigned': recent_assigned,
         'recent_pending': recent_pending,
         'user': user,
@@ -82,8 +91,9 @@ def admin_dashboard(request):
     # Get all requests
     all_requests = AmbulanceRequest.objects.all().order_by('-created_at')
     
-    # Statistics
-    stats = {
+    # Statistics, recomputed only after a request, user or ambulance changes
+    kpi_version = versions('requests', 'users', 'ambulances')
+    stats = cached_counts('admin', kpi_version, lambda: {
         'total_requests': all_requests.count(),
         'pending_requests': all_requests.filter(status='pending').count(),
         'active_requests': all_requests.filter(status__in=['assigned', 'en_route', 'arrived']).count(),
@@ -93,12 +103,12 @@ def admin_dashboard(request):
         'patients': User.objects.filter(role='patient').count(),
         'paramedics': User.objects.filter(role='paramedic').count(),
         'available_paramedics': User.objects.filter(role='paramedic', is_available=True).count(),
-        'total_ambulances': Ambulance.objects.count(),
-        'available_ambulances': Ambulance.objects.filter(status='available').count(),
-    }
+        'total_ambulances': len(fleet.entries()),
+        'available_ambulances': len(fleet.available()),
+    })
     
     # Recent requests
-    recent_requests = all_requests[:10]
+    recent_requests = all_requests.select_related('patient', 'paramedic')[:10]
     
     # Priority distribution
     priority_stats = all_requests.values('priority').annotate(count=Count('priority')).order_by('priority')
@@ -109,12 +119,17 @@ def admin_dashboard(request):
     # Recent users
     recent_users = User.objects.order_by('-date_joined')[:5]
     
+    # Likely duplicate calls from the last 24 hours
+    duplicate_clusters = recent_clusters(hours=24)
+    
     context = {
         'stats': stats,
+        'kpi_version': kpi_version,
         'recent_requests': recent_requests,
         'priority_stats': priority_stats,
         'status_stats': status_stats,
         'recent_users': recent_users,
+        'duplicate_clusters': duplicate_clusters,
         'user': user,
     }
     
@@ -127,25 +142,26 @@ def admin_reports(request):
     """Admin analytics/Reports page"""
     user = request.user
     
-    # Basic aggregates (expand as needed)
-    requests_qs = AmbulanceRequest.objects.all()
-    kpis = {
-        'total': requests_qs.count(),
-        'pending': requests_qs.filter(status='pending').count(),
-        'assigned': requests_qs.filter(status='assigned').count(),
-        'en_route': requests_qs.filter(status='en_route').count(),
-        'arrived': requests_qs.filter(status='arrived').count(),
-        'completed': requests_qs.filter(status='completed').count(),
-        'cancelled': requests_qs.filter(status='cancelled').count(),
-    }
+    # Live and archived requests, one grouped query per table and field; archiving bumps the request counter too
+    kpi_version = versions('requests')
+    status_counts, priority_counts = cached_counts(
+        'reports', kpi_version, lambda: (count_by('status'), count_by('priority'))
+    )
+    kpis = {status: status_counts.get(status, 0) for status, _ in AmbulanceRequest.STATUS_CHOICES}
+    kpis['total'] = sum(status_counts.values())
+    
+    by_priority = [{'priority': key, 'count': count} for key, count in sorted(priority_counts.items())]
+    by_status = [{'status': key, 'count': count} for key, count in sorted(status_counts.items())]
     
-    by_priority = list(requests_qs.values('priority').annotate(count=Count('priority')).order_by('priority'))
-    by_status = list(requests_qs.values('status').annotate(count=Count('status')).order_by('status'))
+    # Multi-year history from the columnar store (empty until export_columnar has run)
+    history = history_summary()
     
     context = {
         'kpis': kpis,
+        'kpi_version': kpi_version,
         'by_priority': by_priority,
         'by_status': by_status,
+        'history': history,
         'user': user,
     }
     return render(request, 'dashboard/admin_reports.html', context)
@@ -0,0 +1,323 @@
+"""
+Prometheus-style metrics shared across worker processes.
+
+Each process appends its samples to its own memory-mapped file in
+``METRICS_DIR`` (``metrics-<pid>.db``), so updates never contend with other
+processes and only take a short in-process lock. ``/metrics`` sums the
+values of every file at scrape time and renders the Prometheus text format.
+
+File layout: an 8-byte header holding the number of bytes used, followed by
+entries of ``<int32 key length><utf-8 key, padded to 8 bytes><float64 value>``.
+Clear ``METRICS_DIR`` when deploying; files of exited workers keep counting
+towards the totals until then, like Prometheus' own multiprocess mode.
+"""
+
+import bisect
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse, HttpResponseForbidden
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+INF = float('inf')
+
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (512, 2048, 8192, 32768, 131072, 524288, 2097152)
+
+REGISTRY = {}
+
+_HEADER = struct.Struct('<i4x')
+_LENGTH = struct.Struct('<i')
+_VALUE = struct.Struct('<d')
+
+
+def _padded(length):
+    return length + (-(_LENGTH.size + length) % 8)
+
+
+class MmapedValues:
+    """Append-only store of named float64 values in a file written by one process"""
+
+    def __init__(self, path, initial_size=64 * 1024):
+        self.path = Path(path)
+        self._file = open(self.path, 'a+b')
+        if os.fstat(self._file.fileno()).st_size == 0:
+            self._file.truncate(initial_size)
+        self._capacity = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), self._capacity)
+        self._used = _HEADER.unpack_from(self._map, 0)[0] or _HEADER.size
+        self._positions = {key: position for key, _, position in self._entries(self._map, self._used)}
+
+    @staticmethod
+    def _entries(buffer, used):
+        offset = _HEADER.size
+        while offset < used:
+            length = _LENGTH.unpack_from(buffer, offset)[0]
+            key_start = offset + _LENGTH.size
+            key = bytes(buffer[key_start:key_start + length]).decode()
+            position = key_start + _padded(length)
+            yield key, _VALUE.unpack_from(buffer, position)[0], position
+            offset = position + _VALUE.size
+
+    def _position(self, key):
+        position = self._positions.get(key)
+        if position is None:
+            encoded = key.encode()
+            size = _LENGTH.size + _padded(len(encoded)) + _VALUE.size
+            if self._used + size > self._capacity:
+                self._grow(self._used + size)
+            _LENGTH.pack_into(self._map, self._used, len(encoded))
+            self._map[self._used + _LENGTH.size:self._used + _LENGTH.size + len(encoded)] = encoded
+            position = self._used + _LENGTH.size + _padded(len(encoded))
+            _VALUE.pack_into(self._map, position, 0.0)
+            self._used += size
+            _HEADER.pack_into(self._map, 0, self._used)
+            self._positions[key] = position
+        return position
+
+    def _grow(self, needed):
+        capacity = self._capacity
+        while capacity < needed:
+            capacity *= 2
+        self._map.close()
+        self._file.truncate(capacity)
+        self._capacity = capacity
+        self._map = mmap.mmap(self._file.fileno(), capacity)
+
+    def increment(self, key, amount):
+        position = self._position(key)
+        _VALUE.pack_into(self._map, position, _VALUE.unpack_from(self._map, position)[0] + amount)
+
+    @classmethod
+    def read(cls, path):
+        """Yield (key, value) pairs from a file without holding it open"""
+        with open(path, 'rb') as f:
+            data = f.read()
+        if len(data) < _HEADER.size:
+            return
+        used = min(_HEADER.unpack_from(data, 0)[0], len(data))
+        for key, value, _ in cls._entries(data, used):
+            yield key, value
+
+
+_lock = threading.Lock()
+_store = None
+_store_pid = None
+
+
+def metrics_dir():
+    return Path(getattr(settings, 'METRICS_DIR', Path(settings.BASE_DIR) / 'var' / 'metrics'))
+
+
+def _increment(*updates):
+    """Apply (key, amount) updates to this process's file under one lock"""
+    global _store, _store_pid
+    with _lock:
+        # A forked worker must not write into its parent's file
+        if _store is None or _store_pid != os.getpid():
+            directory = metrics_dir()
+            directory.mkdir(parents=True, exist_ok=True)
+            _store_pid = os.getpid()
+            _store = MmapedValues(directory / f'metrics-{_store_pid}.db')
+        for key, amount in updates:
+            _store.increment(key, amount)
+
+
+def collect():
+    """Sum the values of all worker files"""
+    totals = {}
+    for path in sorted(metrics_dir().glob('metrics-*.db')):
+        for key, value in MmapedValues.read(path):
+            totals[key] = totals.get(key, 0.0) + value
+    return totals
+
+
+class Metric:
+    type = None
+    suffix = ''
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._keys = {}
+        REGISTRY[name] = self
+
+    def _key(self, suffix, labels, extra=()):
+        values = tuple(str(labels.get(name, '')) for name in self.labelnames) + extra
+        cache_key = (suffix, values)
+        key = self._keys.get(cache_key)
+        if key is None:
+            key = json.dumps([self.name, suffix, list(values)])
+            self._keys[cache_key] = key
+        return key
+
+
+class Counter(Metric):
+    type = 'counter'
+    suffix = '_total'
+
+    def inc(self, amount=1, **labels):
+        _increment((self._key('total', labels), amount))
+
+    def samples(self, series):
+        for values, sample in sorted(series.items()):
+            yield f'{self.name}_total', dict(zip(self.labelnames, values)), sample.get('total', 0.0)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(float(bucket) for bucket in buckets) + (INF,)
+
+    def observe(self, value, **labels):
+        bucket = self.buckets[bisect.bisect_left(self.buckets, value)]
+        _increment(
+            (self._key('bucket', labels, (_format_value(bucket),)), 1),
+            (self._key('sum', labels), value),
+            (self._key('count', labels), 1),
+        )
+
+    def samples(self, series):
+        for values, sample in sorted(series.items()):
+            labels = dict(zip(self.labelnames, values))
+            cumulative = 0.0
+            for bucket in self.buckets:
+                le = _format_value(bucket)
+                cumulative += sample.get(('bucket', le), 0.0)
+                yield f'{self.name}_bucket', {**labels, 'le': le}, cumulative
+            yield f'{self.name}_sum', labels, sample.get('sum', 0.0)
+            yield f'{self.name}_count', labels, sample.get('count', 0.0)
+
+
+def _format_value(value):
+    if value == INF:
+        return '+Inf'
+    if float(value).is_integer():
+        return f'{value:.1f}'
+    return repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def render():
+    """Return all registered metrics in the Prometheus text exposition format"""
+    grouped = {}
+    for key, value in collect().items():
+        name, suffix, values = json.loads(key)
+        metric = REGISTRY.get(name)
+        if metric is None:
+            continue
+        label_values = tuple(values[:len(metric.labelnames)])
+        sample_key = (suffix, values[-1]) if suffix == 'bucket' else suffix
+        grouped.setdefault(name, {}).setdefault(label_values, {})[sample_key] = value
+
+    lines = []
+    for name, metric in sorted(REGISTRY.items()):
+        lines.append(f'# HELP {name}{metric.suffix} {metric.documentation}')
+        lines.append(f'# TYPE {name}{metric.suffix} {metric.type}')
+        for sample_name, labels, value in metric.samples(grouped.get(name, {})):
+            if labels:
+                label_text = ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+                lines.append(f'{sample_name}{{{label_text}}} {value!r}')
+            else:
+                lines.append(f'{sample_name} {value!r}')
+    return '\n'.join(lines) + '\n'
+
+
+# HTTP metrics recorded by MetricsMiddleware
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Request latency by route', ('route', 'method'))
+REQUESTS = Counter(
+    'http_requests', 'Responses by route and status code', ('route', 'method', 'status'))
+REQUEST_QUERIES = Histogram(
+    'http_request_db_queries', 'Database queries per request', ('route',), buckets=QUERY_COUNT_BUCKETS)
+REQUEST_QUERY_TIME = Histogram(
+    'http_request_db_seconds', 'Time spent in database queries per request', ('route',))
+RESPONSE_SIZE = Histogram(
+    'http_response_size_bytes', 'Response body size', ('route',), buckets=SIZE_BUCKETS)
+
+
+class QueryTimer:
+    """connection.execute_wrapper that counts queries and their total time"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+
+
+def route_label(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    # Router URLs are regexes; drop the end anchor so labels read like paths
+    return '/' + (match.route or '').rstrip('$')
+
+
+class MetricsMiddleware:
+    """Record latency, query count and time, response size and status per route"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Stay async under ASGI so async views are not pushed onto a worker thread
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timer = QueryTimer()
+        start = time.perf_counter()
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+        self.record(request, response, time.perf_counter() - start, timer)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        # Async ORM queries run on executor threads with their own connections, so they are not counted
+        self.record(request, response, time.perf_counter() - start)
+        return response
+
+    def record(self, request, response, duration, timer=None):
+        route = route_label(request)
+        REQUEST_LATENCY.observe(duration, route=route, method=request.method)
+        REQUESTS.inc(route=route, method=request.method, status=response.status_code)
+        if timer is not None:
+            REQUEST_QUERIES.observe(timer.count, route=route)
+            REQUEST_QUERY_TIME.observe(timer.seconds, route=route)
+        if not response.streaming:
+            RESPONSE_SIZE.observe(len(response.content), route=route)
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint (staff or METRICS_ALLOWED_IPS only)"""
+    allowed_ips = getattr(settings, 'METRICS_ALLOWED_IPS', ['127.0.0.1', '::1'])
+    if request.META.get('REMOTE_ADDR') not in allowed_ips and not request.user.is_staff:
+        return HttpResponseForbidden('Forbidden')
+    return HttpResponse(render(), content_type=CONTENT_TYPE)
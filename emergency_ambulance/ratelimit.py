@@ -0,0 +1,176 @@
+"""
+Rate limiting with token buckets kept in the cache.
+
+Every (scope, route, client) has its own bucket; the client is the user, or
+the remote address for anonymous requests. A bucket holds as many tokens as
+its scope's rate allows per period (``RATE_LIMITS``, e.g. ``'120/min'``) and
+refills evenly over the period, so clients can burst up to the limit but not
+sustain more than the rate.
+
+Buckets are stored as two per-period counters that are only ever changed
+with ``cache.incr``/``decr``, which are atomic on Redis and memcached, so
+workers never need a lock or a read-modify-write round trip. The fill level
+is estimated from them: the current period's count plus the previous one's,
+weighted by how much of it still falls inside the sliding period. Refused
+requests give their token back.
+
+Scopes:
+
+* ``poll`` - dashboard figures, recent requests, availability lists and delta
+  sync, which clients call in a loop
+* ``emergency`` - creating requests and changing their status; a separate,
+  larger allowance, so a client that exhausts its polling budget can still
+  call for help
+* ``critical`` - critical-priority emergency calls draw from their own,
+  larger bucket instead, so they still get through when the emergency one is
+  empty, yet are limited too (at the ``emergency`` rate if ``critical`` has
+  none configured)
+
+``ScopedBucketThrottle`` subclasses apply the buckets to DRF views and
+``rate_limit`` to plain views; ``check`` serves views that authenticate
+themselves, such as the async API views. All of them share the same buckets.
+With a per-process cache such as LocMemCache each worker counts on its own.
+"""
+
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+from rest_framework.throttling import BaseThrottle
+
+BUCKET_KEY = 'ratelimit:{}:{}:{}'
+
+PERIODS = {'s': 1, 'sec': 1, 'm': 60, 'min': 60, 'h': 3600, 'hour': 3600, 'd': 86400, 'day': 86400}
+
+# Emergency calls of these priorities draw from the bucket of their own scope
+PRIORITY_SCOPES = {'critical': 'critical'}
+
+
+def parse_rate(rate):
+    """'120/min' -> (120, 60)"""
+    count, _, period = rate.partition('/')
+    return int(count), PERIODS[period]
+
+
+def scope_rate(scope):
+    """(limit, period) of a scope, or None if it is not limited"""
+    rate = getattr(settings, 'RATE_LIMITS', {}).get(scope)
+    return parse_rate(rate) if rate else None
+
+
+def _incr(key, delta, timeout):
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        # First request of the period (or the counter was evicted)
+        if cache.add(key, delta, timeout):
+            return delta
+        return cache.incr(key, delta)
+
+
+def take(bucket, limit, period, now=None):
+    """
+    Take a token from a bucket; returns (allowed, seconds to wait when refused).
+    """
+    now = time.time() if now is None else now
+    window, offset = divmod(now, period)
+    window = int(window)
+    # Kept for two periods: the current one and, after it, as the previous one
+    current_key = f'{bucket}:{window}'
+    current = _incr(current_key, 1, period * 2)
+    previous = cache.get(f'{bucket}:{window - 1}', 0)
+
+    remaining = 1 - offset / period
+    used = previous * remaining + current
+    if used <= limit:
+        return True, 0
+
+    try:
+        cache.decr(current_key)
+    except ValueError:
+        pass
+    if current > limit:
+        # Full on this period's requests alone: wait for the next period
+        wait = period - offset
+    else:
+        # The previous period's share drains at previous/period tokens a second
+        wait = (used - limit) / previous * period
+    return False, max(1, math.ceil(wait))
+
+
+def client_id(request, user=None):
+    user = user if user is not None else getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f'user-{user.pk}'
+    return f'ip-{request.META.get("REMOTE_ADDR", "")}'
+
+
+def route_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else request.path
+
+
+def check(request, scope, user=None, priority=None):
+    """(allowed, wait) for a request against its bucket in scope"""
+    if scope == 'emergency' and priority in PRIORITY_SCOPES and scope_rate(PRIORITY_SCOPES[priority]):
+        scope = PRIORITY_SCOPES[priority]
+    rate = scope_rate(scope)
+    if rate is None:
+        return True, 0
+    bucket = BUCKET_KEY.format(scope, route_name(request), client_id(request, user))
+    return take(bucket, *rate)
+
+
+class ScopedBucketThrottle(BaseThrottle):
+    """DRF throttle drawing from the bucket of ``scope`` for the view's route and user"""
+
+    scope = None
+
+    def allow_request(self, request, view):
+        priority = None
+        if self.scope == 'emergency' and request.method == 'POST' and isinstance(request.data, dict):
+            priority = request.data.get('priority')
+        allowed, self.wait_seconds = check(request, self.scope, user=request.user, priority=priority)
+        return allowed
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class PollThrottle(ScopedBucketThrottle):
+    scope = 'poll'
+
+
+class EmergencyThrottle(ScopedBucketThrottle):
+    scope = 'emergency'
+
+
+def throttled_response(request, wait):
+    detail = f'Request was throttled. Expected available in {wait} seconds.'
+    # Pages get plain text; AJAX and API clients the DRF-style JSON body
+    if 'text/html' in request.headers.get('Accept', ''):
+        response = HttpResponse(detail, status=429, content_type='text/plain')
+    else:
+        response = JsonResponse({'detail': detail}, status=429)
+    response['Retry-After'] = str(wait)
+    return response
+
+
+def rate_limit(scope, methods=None):
+    """Decorator limiting a plain (sync) view with the bucket of scope, only for the given methods if any"""
+
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if not methods or request.method in methods:
+                priority = request.POST.get('priority') if scope == 'emergency' else None
+                allowed, wait = check(request, scope, priority=priority)
+                if not allowed:
+                    return throttled_response(request, wait)
+            return view_func(request, *args, **kwargs)
+        return wrapper
+
+    return decorator
@@ -47,11 +47,15 @@ INSTALLED_APPS = [
     'accounts',
     'ambulance',
     'api',
+    'notifications',
 ]
 
 MIDDLEWARE = [
+    'emergency_ambulance.compression.StreamingGZipMiddleware',
+    'emergency_ambulance.metrics.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'emergency_ambulance.staticfiles.PrecompressedStaticMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -78,6 +82,17 @@ TEMPLATES = [
     },
 ]
 
+# Production template profile: templates are compiled once per process and kept in memory.
+# Django already does this whenever DEBUG is off; it is spelled out so the setup is explicit.
+if not DEBUG:
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+
 WSGI_APPLICATION = 'emergency_ambulance.wsgi.application'
 
 
@@ -132,10 +147,23 @@ STATICFILES_DIRS = [
 ]
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+# collectstatic writes content-hashed copies with .gz/.br variants, which
+# PrecompressedStaticMiddleware serves with far-future cache headers
+if not DEBUG:
+    STORAGES = {
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'emergency_ambulance.staticfiles.CompressedManifestStaticFilesStorage'},
+    }
+
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Avatar thumbnails (accounts.thumbnails): resize threads per process, and how long a
+# generated thumbnail's name is remembered before the view checks the file again
+THUMBNAIL_WORKERS = 2
+THUMBNAIL_CACHE_TIMEOUT = 60 * 60 * 24
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -144,19 +172,69 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Custom User Model
 AUTH_USER_MODEL = 'accounts.User'
 
+# Session users are loaded with profile and ambulance in one query, and cached when the cache is shared;
+# API token revocations are cached for the same time under the same condition
+AUTHENTICATION_BACKENDS = ['accounts.backends.CachedModelBackend']
+AUTH_USER_CACHE_TIMEOUT = 300  # seconds
+
+# Sessions are read from the cache and written through to the database
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
 # Django REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        'api.authentication.SignedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    'PAGE_SIZE': 20
+    'PAGE_SIZE': 20,
+    # JSON, MessagePack (with the msgpack package) or the browsable API, by Accept header (see api/renderers.py)
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'api.renderers.MessagePackRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_CONTENT_NEGOTIATION_CLASS': 'api.renderers.AvailableRendererNegotiation',
+}
+
+# API responses at least this large are gzipped, as a stream, for clients that accept it
+GZIP_MIN_SIZE = 8192
+
+# Token buckets per scope, route and user (see emergency_ambulance/ratelimit.py). Emergency calls and
+# status changes draw from their own larger allowance, critical-priority calls from a larger one still.
+RATE_LIMITS = {
+    'poll': '120/min',
+    'emergency': '300/min',
+    'critical': '600/min',
+}
+
+# Signed API tokens (see api/authentication.py)
+API_TOKEN_TTL = 60 * 60  # seconds
+
+# Cache
+# For multiple worker processes use a shared cache, so rate limits and version counters are shared:
+# CACHES = {
+#     'default': {
+#         'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+#         'LOCATION': 'redis://127.0.0.1:6379/1',
+#     }
+# }
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'emergency-ambulance',
+        # Room for one template fragment per listed request row (the default of 300 culls constantly)
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
 }
 
+# Seconds cached dashboard figures are kept (the {% cache %} fragments in templates/dashboard use 300 too);
+# version counters invalidate both earlier when the data changes
+DASHBOARD_CACHE_TIMEOUT = 300
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
@@ -185,6 +263,46 @@ DEFAULT_FROM_EMAIL = 'Emergency Ambulance System <noreply@ambulance.com>'
 # Password Reset Settings
 PASSWORD_RESET_TIMEOUT = 3600  # 1 hour in seconds
 
+# Outbox: emails are queued in the database and sent by `manage.py send_outbox`
+SITE_URL = os.environ.get('SITE_URL', 'http://127.0.0.1:8000')  # For links in queued emails
+OUTBOX_BATCH_SIZE = 50
+OUTBOX_WORKERS = 4
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_RETRY_BASE_SECONDS = 30  # Doubles after each failed attempt
+OUTBOX_RETRY_MAX_SECONDS = 3600
+
+# Metrics
+# Each worker process writes its samples to its own file here; /metrics sums them.
+# Clear this directory on deploy.
+METRICS_DIR = os.environ.get('METRICS_DIR', BASE_DIR / 'var' / 'metrics')
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
+# Columnar analytics store of closed requests, filled by `manage.py export_columnar`
+ANALYTICS_STORE_DIR = os.environ.get('ANALYTICS_STORE_DIR', BASE_DIR / 'var' / 'analytics')
+
+# Geocoding
+# Tab-separated gazetteer: address<TAB>latitude<TAB>longitude per line
+GEOCODER_GAZETTEER_PATH = BASE_DIR / 'data' / 'gazetteer.tsv'
+GEOCODER_ASYNC = True  # Geocode new requests on a background thread pool
+GEOCODER_WORKERS = 2
+GEOCODER_MISS_TTL = 60 * 60 * 24  # seconds an address not in the gazetteer is remembered as a miss
+
+# Duplicate-call detection
+DUPLICATE_CELL_SIZE_DEGREES = 0.005  # ~550 m grid cells
+DUPLICATE_RADIUS_METERS = 300
+DUPLICATE_WINDOW_MINUTES = 30
+
+# Radius search (?near=lat,lng&radius_km=) on the request and ambulance APIs
+NEAR_DEFAULT_RADIUS_KM = 10
+NEAR_MAX_RADIUS_KM = 100
+
+# Closed requests' GPS tracks drop fixes closer than this to the simplified route
+TRACK_SIMPLIFY_TOLERANCE_METERS = 10
+
+# Seconds a request-creation Idempotency-Key (or form token) is remembered; a retry within it
+# gets the original response instead of creating a second request
+IDEMPOTENCY_KEY_TTL = 60 * 60 * 24
+
 # User roles
 USER_ROLES = (
     ('patient', 'Patient'),
@@ -0,0 +1,183 @@
+"""
+Fingerprinted, precompressed static files.
+
+``collectstatic`` with ``CompressedManifestStaticFilesStorage`` copies every
+file to a content-hashed name (``css/bootstrap.min.3f2a9c1e.css``) and writes
+``.gz`` and ``.br`` variants of the hashed text assets next to it, so nothing
+is compressed per request.
+
+``PrecompressedStaticMiddleware`` answers requests for those hashed names
+before the rest of the stack runs: it picks the best variant the client's
+``Accept-Encoding`` allows, streams it with ``FileResponse`` (which servers
+hand to ``sendfile`` through ``wsgi.file_wrapper``) and marks it immutable for
+a year. A changed file gets a new name, so browsers never need to revalidate.
+Any other path falls through to the normal handlers.
+"""
+
+import gzip
+import mimetypes
+import os
+from pathlib import Path
+
+import brotli
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+# Client encoding token -> file suffix, in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+def _source_map_free(patterns):
+    return tuple(
+        (extension, tuple(
+            pattern for pattern in extension_patterns
+            if 'sourceMappingURL' not in (pattern[0] if isinstance(pattern, tuple) else pattern)
+        ))
+        for extension, extension_patterns in patterns
+    )
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Manifest storage that also writes gzip and brotli variants of hashed text files"""
+
+    # The vendored Bootstrap files point at source maps that are not shipped
+    patterns = _source_map_free(ManifestStaticFilesStorage.patterns)
+
+    compress_extensions = ('.css', '.js', '.json', '.map', '.svg', '.txt', '.xml', '.html', '.ico')
+    # Smaller files gain nothing once headers are counted
+    compress_min_size = 512
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in sorted(set(self.hashed_files.values())):
+            if name.endswith(self.compress_extensions):
+                for compressed_name in self.compress(name):
+                    yield name, compressed_name, True
+
+    def compress(self, name):
+        """Write the variants of one hashed file that are worth keeping; yields their names"""
+        path = self.path(name)
+        with open(path, 'rb') as f:
+            data = f.read()
+        if len(data) < self.compress_min_size:
+            return
+        for suffix, compress in (('.gz', lambda d: gzip.compress(d, 9, mtime=0)), ('.br', brotli.compress)):
+            # Hashed names are content addressed, so an existing variant is already current
+            if os.path.exists(path + suffix):
+                yield name + suffix
+                continue
+            compressed = compress(data)
+            if len(compressed) >= len(data) * 0.95:
+                continue
+            with open(path + suffix + '.tmp', 'wb') as f:
+                f.write(compressed)
+            os.replace(path + suffix + '.tmp', path + suffix)
+            yield name + suffix
+
+
+def accepted_encodings(header):
+    """Content codings the client accepts (q > 0) from an Accept-Encoding header"""
+    accepted = set()
+    refused = set()
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        (accepted if quality > 0 else refused).add(coding)
+    if '*' in accepted:
+        accepted.update(token for token, _ in ENCODINGS if token not in refused)
+    return accepted
+
+
+class PrecompressedStaticMiddleware:
+    """Serve hashed files from STATIC_ROOT, precompressed when possible, with immutable caching"""
+
+    manifest_name = 'staticfiles.json'
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = '/' + settings.STATIC_URL.lstrip('/')
+        self.root = Path(settings.STATIC_ROOT) if settings.STATIC_ROOT else None
+        self._manifest = (None, frozenset())
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.static_response(request)
+        if response is not None:
+            return response
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        # Serving only static files; the body is streamed by the server, so nothing blocks for long
+        response = self.static_response(request)
+        if response is not None:
+            return response
+        return await self.get_response(request)
+
+    def static_response(self, request):
+        if request.method in ('GET', 'HEAD') and request.path_info.startswith(self.prefix) and self.root:
+            return self.serve(request, request.path_info[len(self.prefix):])
+        return None
+
+    def hashed_names(self):
+        """Hashed names listed in the manifest, reloaded after each collectstatic"""
+        try:
+            mtime = (self.root / self.manifest_name).stat().st_mtime
+        except OSError:
+            return frozenset()
+        if self._manifest[0] != mtime:
+            storage = ManifestStaticFilesStorage(location=self.root)
+            self._manifest = (mtime, frozenset(storage.hashed_files.values()))
+        return self._manifest[1]
+
+    def serve(self, request, name):
+        # Only names from the manifest are served, which also rules out path traversal
+        if name not in self.hashed_names():
+            return None
+        path, encoding = self.root / name, None
+        accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        for token, suffix in ENCODINGS:
+            if token in accepted and (self.root / (name + suffix)).is_file():
+                path, encoding = self.root / (name + suffix), token
+                break
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+
+        if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), stat.st_mtime):
+            response = HttpResponseNotModified()
+        else:
+            content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+            response = FileResponse(path.open('rb'), content_type=content_type)
+            # FileResponse names the opened file (e.g. "app.css.br") inline; assets need no disposition
+            del response['Content-Disposition']
+            response['Last-Modified'] = http_date(stat.st_mtime)
+            if encoding:
+                response['Content-Encoding'] = encoding
+        response['Cache-Control'] = IMMUTABLE
+        response['Vary'] = 'Accept-Encoding'
+        return response
@@ -19,6 +19,7 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from django.shortcuts import redirect
+from .metrics import metrics_view
 
 def home_redirect(request):
     """Redirect home to login page"""
@@ -38,6 +39,9 @@ urlpatterns = [
     
     # Dashboard URLs (will be created in Phase 7)
     path('dashboard/', include('emergency_ambulance.dashboard_urls')),
+    
+    # Prometheus scrape endpoint
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 # Serve media files during development
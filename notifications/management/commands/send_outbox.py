@@ -0,0 +1,42 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from notifications.outbox import claim_batch, deliver
+
+
+class Command(BaseCommand):
+    help = 'Send queued emails from the outbox, retrying failures with exponential backoff'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=getattr(settings, 'OUTBOX_BATCH_SIZE', 50),
+                            help='Messages claimed per batch')
+        parser.add_argument('--workers', type=int, default=getattr(settings, 'OUTBOX_WORKERS', 4),
+                            help='Sending threads; each uses one SMTP connection per batch')
+        parser.add_argument('--max-attempts', type=int, default=getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 8),
+                            help='Give up on a message after this many failed attempts')
+        parser.add_argument('--interval', type=float, default=2.0,
+                            help='Seconds to wait when the outbox is empty')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once no message is due instead of polling')
+
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+        try:
+            while True:
+                messages = claim_batch(options['batch_size'])
+                if not messages:
+                    if options['once']:
+                        break
+                    time.sleep(options['interval'])
+                    continue
+                sent, failed = deliver(messages, workers=options['workers'], max_attempts=options['max_attempts'])
+                total_sent += sent
+                total_failed += failed
+                if options['verbosity'] > 1 or failed:
+                    self.stdout.write(f'Sent {sent} messages, {failed} failed')
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(f'Done: sent {total_sent} messages, {total_failed} failed attempts'))
@@ -0,0 +1,123 @@
+"""
+Transactional email outbox.
+
+Code that triggers an email calls ``enqueue_email`` inside its own database
+transaction, so the message is stored only if the triggering change commits
+and the request never waits for SMTP. ``send_outbox`` claims due messages in
+batches, sends them from a thread pool with one connection per thread and
+batch, and schedules failures for a retry with exponential backoff.
+"""
+
+import random
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db.models import F, Q
+from django.template import TemplateDoesNotExist
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import OutboxMessage
+
+
+def enqueue_email(kind, to, subject, template_name, context):
+    """Render ``<template_name>.txt`` (and ``.html`` if present) and store the message for sending"""
+    body = render_to_string(f'{template_name}.txt', context)
+    try:
+        html_body = render_to_string(f'{template_name}.html', context)
+    except TemplateDoesNotExist:
+        html_body = ''
+    return OutboxMessage.objects.create(kind=kind, to=to, subject=subject, body=body, html_body=html_body)
+
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter: base, 2x base, 4x base ... capped"""
+    base = getattr(settings, 'OUTBOX_RETRY_BASE_SECONDS', 30)
+    cap = getattr(settings, 'OUTBOX_RETRY_MAX_SECONDS', 3600)
+    delay = min(cap, base * 2 ** max(attempts - 1, 0))
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def claim_batch(size, lease_seconds=300):
+    """Mark up to size due messages as 'sending' for this worker and return them"""
+    now = timezone.now()
+    due = OutboxMessage.objects.filter(
+        Q(status='pending', next_attempt_at__lte=now) |
+        # Messages of a worker that died mid-batch
+        Q(status='sending', lease_expires_at__lt=now)
+    )
+    ids = list(due.order_by('id').values_list('id', flat=True)[:size])
+    if not ids:
+        return []
+    token = uuid.uuid4().hex
+    # Re-check the due condition so two workers never claim the same message
+    due.filter(id__in=ids).update(
+        status='sending', claimed_by=token, lease_expires_at=now + timedelta(seconds=lease_seconds)
+    )
+    return list(OutboxMessage.objects.filter(claimed_by=token, status='sending'))
+
+
+def _send_chunk(messages):
+    """Send messages over one connection; returns (id, error) pairs, error is '' on success"""
+    results = []
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        return [(message.id, f'connect: {e}') for message in messages]
+    try:
+        for message in messages:
+            email = EmailMultiAlternatives(
+                message.subject, message.body, settings.DEFAULT_FROM_EMAIL, [message.to],
+                connection=connection,
+            )
+            if message.html_body:
+                email.attach_alternative(message.html_body, 'text/html')
+            try:
+                email.send()
+                results.append((message.id, ''))
+            except Exception as e:
+                results.append((message.id, str(e) or e.__class__.__name__))
+    finally:
+        try:
+            connection.close()
+        except Exception:
+            pass
+    return results
+
+
+def deliver(messages, workers=4, max_attempts=8):
+    """Send claimed messages from a thread pool and record the outcome; returns (sent, failed) counts"""
+    if not messages:
+        return 0, 0
+    # One chunk per thread, so each thread reuses a single SMTP connection for the batch
+    chunks = [messages[i::workers] for i in range(min(workers, len(messages)))]
+    with ThreadPoolExecutor(max_workers=len(chunks), thread_name_prefix='outbox') as executor:
+        results = [result for chunk in executor.map(_send_chunk, chunks) for result in chunk]
+
+    # Outcomes are written from this thread only, so the workers never touch the database
+    by_id = {message.id: message for message in messages}
+    now = timezone.now()
+    sent_ids = [message_id for message_id, error in results if not error]
+    OutboxMessage.objects.filter(id__in=sent_ids).update(
+        status='sent', sent_at=now, attempts=F('attempts') + 1, last_error='', lease_expires_at=None
+    )
+    failed = 0
+    for message_id, error in results:
+        if not error:
+            continue
+        message = by_id[message_id]
+        message.attempts += 1
+        message.last_error = error[:2000]
+        message.lease_expires_at = None
+        failed += 1
+        if message.attempts >= max_attempts:
+            message.status = 'failed'
+        else:
+            message.status = 'pending'
+            message.next_attempt_at = now + retry_delay(message.attempts)
+        message.save(update_fields=['attempts', 'last_error', 'lease_expires_at', 'status', 'next_attempt_at'])
+    return len(sent_ids), failed
@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.urls import reverse
+
+from accounts.models import UserProfile
+from ambulance.models import RequestStatusUpdate
+from .outbox import enqueue_email
+
+# Status changes a patient is emailed about
+NOTIFY_STATUSES = ('assigned', 'en_route', 'arrived', 'completed', 'cancelled')
+
+
+@receiver(post_save, sender=RequestStatusUpdate)
+def notify_patient_of_status_change(sender, instance, created, **kwargs):
+    """Queue an email to the patient; runs inside the transaction that recorded the update"""
+    if not created or instance.new_status not in NOTIFY_STATUSES:
+        return
+    
+    ambulance_request = instance.request
+    patient = ambulance_request.patient
+    if not patient.email or instance.updated_by_id == patient.pk:
+        return
+    # A missing profile means the defaults, which include email notifications
+    if UserProfile.objects.filter(user_id=patient.pk, email_notifications=False).exists():
+        return
+    
+    enqueue_email(
+        'status_change',
+        patient.email,
+        f'Request #{ambulance_request.pk}: {instance.get_new_status_display()} - Emergency Ambulance System',
+        'notifications/emails/status_change',
+        {
+            'user': patient,
+            'ambulance_request': ambulance_request,
+            'status_update': instance,
+            'paramedic': ambulance_request.paramedic,
+            'request_url': settings.SITE_URL + reverse('ambulance:request_detail', args=[ambulance_request.pk]),
+            'site_name': 'Emergency Ambulance System',
+        },
+    )
@@ -0,0 +1,124 @@
+import io
+from datetime import timedelta
+
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from accounts.models import User
+from ambulance.models import AmbulanceRequest, RequestStatusUpdate
+from .models import OutboxMessage
+from .outbox import claim_batch, deliver
+
+FAILING_RECIPIENTS = set()
+
+
+class FlakyEmailBackend(EmailBackend):
+    """locmem stand-in for an SMTP server that refuses some recipients"""
+
+    def send_messages(self, messages):
+        for message in messages:
+            if FAILING_RECIPIENTS & set(message.to):
+                raise ConnectionError('450 mailbox unavailable')
+        return super().send_messages(messages)
+
+
+def queue(to='patient@example.com'):
+    return OutboxMessage.objects.create(kind='status_change', to=to, subject='Subject', body='Body')
+
+
+@override_settings(EMAIL_BACKEND='notifications.tests.FlakyEmailBackend', OUTBOX_RETRY_BASE_SECONDS=30)
+class OutboxTests(TestCase):
+
+    def setUp(self):
+        FAILING_RECIPIENTS.clear()
+        self.addCleanup(FAILING_RECIPIENTS.clear)
+
+    def test_status_change_is_queued_with_its_transaction(self):
+        patient = User.objects.create_user('patient', email='patient@example.com', password='x', role='patient')
+        medic = User.objects.create_user('medic', password='x', role='paramedic')
+        ambulance_request = AmbulanceRequest.objects.create(
+            patient=patient, pickup_address='1 Main Street', description='chest pain', contact_phone='555-0100',
+        )
+
+        def record_update():
+            RequestStatusUpdate.objects.create(
+                request=ambulance_request, updated_by=medic, old_status='pending', new_status='assigned',
+            )
+
+        try:
+            with transaction.atomic():
+                record_update()
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertFalse(OutboxMessage.objects.exists())
+
+        record_update()
+        message = OutboxMessage.objects.get()
+        self.assertEqual((message.to, message.status), ('patient@example.com', 'pending'))
+        self.assertEqual(mail.outbox, [])
+
+    def test_claim_takes_due_messages_once(self):
+        due = queue()
+        later = queue()
+        OutboxMessage.objects.filter(pk=later.pk).update(next_attempt_at=timezone.now() + timedelta(minutes=5))
+
+        self.assertEqual([message.pk for message in claim_batch(10)], [due.pk])
+        self.assertEqual(claim_batch(10), [])
+
+    def test_expired_lease_is_claimed_again(self):
+        message = queue()
+        claim_batch(10, lease_seconds=60)
+        OutboxMessage.objects.filter(pk=message.pk).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual([claimed.pk for claimed in claim_batch(10)], [message.pk])
+
+    def test_deliver_sends_and_records(self):
+        queue('a@example.com')
+        queue('b@example.com')
+        self.assertEqual(deliver(claim_batch(10), workers=2), (2, 0))
+        self.assertEqual(sorted(email.to[0] for email in mail.outbox), ['a@example.com', 'b@example.com'])
+        self.assertEqual(set(OutboxMessage.objects.values_list('status', 'attempts')), {('sent', 1)})
+
+    def test_failure_is_retried_with_backoff(self):
+        FAILING_RECIPIENTS.add('down@example.com')
+        message = queue('down@example.com')
+        ok = queue('ok@example.com')
+
+        before = timezone.now()
+        self.assertEqual(deliver(claim_batch(10)), (1, 1))
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), ('pending', 1))
+        self.assertIn('450', message.last_error)
+        # 30s base with +-20% jitter
+        delay = (message.next_attempt_at - before).total_seconds()
+        self.assertTrue(23 <= delay <= 37, delay)
+        self.assertEqual(OutboxMessage.objects.get(pk=ok.pk).status, 'sent')
+
+        # Not due yet; once it is, the second failure waits about twice as long
+        self.assertEqual(claim_batch(10), [])
+        OutboxMessage.objects.filter(pk=message.pk).update(next_attempt_at=timezone.now())
+        before = timezone.now()
+        deliver(claim_batch(10))
+        message.refresh_from_db()
+        self.assertEqual(message.attempts, 2)
+        self.assertTrue(47 <= (message.next_attempt_at - before).total_seconds() <= 73)
+
+    def test_gives_up_after_max_attempts(self):
+        FAILING_RECIPIENTS.add('down@example.com')
+        message = queue('down@example.com')
+        OutboxMessage.objects.filter(pk=message.pk).update(attempts=2)
+        deliver(claim_batch(10), max_attempts=3)
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), ('failed', 3))
+        self.assertEqual(claim_batch(10), [])
+
+    def test_send_outbox_command(self):
+        queue()
+        out = io.StringIO()
+        call_command('send_outbox', once=True, stdout=out)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('sent 1 messages', out.getvalue())